@@ -0,0 +1,109 @@
+"""
+Performance benchmarks, run with ``poe bench``.
+
+Results are saved to ``.benchmarks`` and may be compared across commits with
+``pytest benchmarks --benchmark-compare``.
+"""
+
+import os
+import socket
+import sys
+import threading
+import zlib
+
+import pytest
+
+import yumemi
+
+
+FILE_SIZE = int(os.environ.get('YUMEMI_BENCH_FILE_SIZE', 2 << 30))
+"""Size of the synthetic file for hashing benchmarks, 2 GiB by default."""
+SMALL_FILES = int(os.environ.get('YUMEMI_BENCH_SMALL_FILES', 100_000))
+"""Number of files in the tree of small files for hashing benchmarks."""
+TITLES = int(os.environ.get('YUMEMI_BENCH_TITLES', 100_000))
+"""Number of titles in the synthetic anime titles dump."""
+THREADS = sorted({1, 2, 4, os.cpu_count() or 1})
+"""Numbers of threads for scaling benchmarks."""
+GIL_ENABLED = getattr(sys, '_is_gil_enabled', lambda: True)()
+"""Scaling benchmarks are limited by the GIL unless on a free-threaded build."""
+
+# Replies recorded from the API, session key and IDs are made up.
+REPLIES = {
+    'PING': b'300 PONG',
+    'AUTH': b'200 sEsSkEy LOGIN ACCEPTED',
+    'LOGOUT': b'203 LOGGED OUT',
+    'MYLISTADD': b'210 MYLIST ENTRY ADDED\n271828',
+    'FILE': (
+        b'220 FILE\n'
+        b'2718281|11829|182437|7172|271828|3f8d1d2ca6ad4de5a89a7e8dbb2c36b1|'
+        b'c2a3a1f5b83fdc6c3b6a8a3e9a3d3f0e4a6f2c1d|9f2c1d3e|2016-2016|TV Series|'
+        b'Kono Subarashii Sekai ni Shukufuku o!|'
+        b'\xe3\x81\x93\xe3\x81\xae\xe7\xb4\xa0\xe6\x99\xb4\xe3\x82\x89\xe3\x81'
+        b'\x97\xe3\x81\x84\xe4\xb8\x96\xe7\x95\x8c\xe3\x81\xab\xe7\xa5\x9d\xe7'
+        b'\xa6\x8f\xe3\x82\x92\xef\xbc\x81|'
+        b'KonoSuba: God`s Blessing on This Wonderful World!|01|'
+        b'This Self-Proclaimed Goddess and Reincarnation in Another World!|'
+        b'Kono Jishou Megami to Isekai Tensei o!|'
+        b'\xe3\x81\x93\xe3\x81\xae\xe8\x87\xaa\xe7\xa7\xb0\xe5\xa5\xb3\xe7\xa5'
+        b'\x9e\xe3\x81\xa8\xe7\x95\xb0\xe4\xb8\x96\xe7\x95\x8c\xe8\xbb\xa2\xe7'
+        b'\x94\x9f\xe3\x82\x92\xef\xbc\x81|HorribleSubs|HorribleSubs'
+    ),
+}
+
+
+def compress(reply: bytes) -> bytes:
+    """Compress the reply the same way as the API does for ``comp=1``."""
+    return b'\0\0' + zlib.compress(reply)
+
+
+class FakeServer:
+    """Local UDP stand-in for the API replying with :data:`REPLIES`."""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.port = self.socket.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(1400)
+            except OSError:
+                return
+            command = data.split(b' ', 1)[0].decode()
+            self.socket.sendto(
+                self.replies.get(command, b'598 UNKNOWN COMMAND'),
+                address,
+            )
+
+    def connection(self):
+        """New connection to the server without flood protection delays."""
+        return yumemi.Connection(
+            server_host='127.0.0.1',
+            server_port=self.port,
+            local_port=0,
+            short_term_delay=0,
+            long_term_delay=0,
+        )
+
+    def close(self):
+        self.socket.close()
+
+
+@pytest.fixture(scope='session')
+def fake_server():
+    server = FakeServer({k: compress(v) for k, v in REPLIES.items()})
+    yield server
+    server.close()
+
+
+@pytest.fixture(scope='session')
+def sparse_file(tmp_path_factory):
+    """Synthetic file of :data:`FILE_SIZE` bytes which takes no disk space."""
+    path = tmp_path_factory.mktemp('sparse') / 'sparse.mkv'
+    with open(path, 'wb') as f:
+        f.truncate(FILE_SIZE)
+    return path
@@ -0,0 +1,34 @@
+import click.testing
+
+import yumemi
+import yumemi.cli
+
+
+FILES = 20
+
+
+def test_add(benchmark, mocker, tmp_path, fake_server):
+    mocker.patch(
+        'yumemi.cli.Client',
+        lambda *args, **kwargs: yumemi.Client(
+            *args, connection=fake_server.connection(), **kwargs),
+    )
+    runner = click.testing.CliRunner()
+
+    rounds = iter(range(1 << 30))
+
+    def setup():
+        directory = tmp_path / str(next(rounds))
+        directory.mkdir()
+        for i in range(FILES):
+            (directory / f'{i}.mkv').write_bytes(i.to_bytes(4, 'big') * 1024)
+        args = ['add', '-u', 'user', '-p', 'pass', '--rename', '--recursive',
+                str(directory)]
+        return (yumemi.cli.main, args), {}
+
+    def run(*args):
+        result = runner.invoke(*args)
+        assert result.exit_code == 0, result.output
+
+    benchmark.extra_info['files'] = FILES
+    benchmark.pedantic(run, setup=setup, rounds=5)
@@ -0,0 +1,101 @@
+import concurrent.futures
+
+import pytest
+
+import yumemi
+from yumemi.capture import Recorder, ReplayConnection
+
+from .conftest import GIL_ENABLED, REPLIES, THREADS
+
+
+class StubConnection:
+    """Connection replying immediately, to measure the client alone."""
+
+    tracer = None
+
+    def __init__(self, reply):
+        self.reply = reply
+
+    def send(self, data, codec=None):
+        pass
+
+    def recv(self):
+        return self.reply
+
+
+def test_command(benchmark):
+    client = yumemi.Client('bench', 1, connection=StubConnection(REPLIES['FILE']))
+    client._session_key = 'sesskey'
+    client._codec = yumemi.CodecPlain('UTF-8')
+    params = {
+        'ed2k': '47c61a0fa8738ba77308a8a600f88e4b',
+        'size': 1 << 30,
+        'fmask': '78380000',
+        'amask': '30E0F0C0',
+        'comment': 'Watched & rewatched\n' * 10,
+    }
+    benchmark(client.command, 'FILE', params)
+
+
+@pytest.mark.parametrize('threads', THREADS)
+def test_command_threads(benchmark, threads):
+    """
+    Every thread sends the same number of commands with its own client, the
+    time stays the same as with one thread when clients scale across cores.
+    """
+    clients = []
+    for _ in range(threads):
+        client = yumemi.Client(
+            'bench', 1, connection=StubConnection(REPLIES['FILE']))
+        client._session_key = 'sesskey'
+        client._codec = yumemi.CodecPlain('UTF-8')
+        clients.append(client)
+
+    def send(client):
+        for _ in range(1000):
+            client.command('FILE', {'fid': 2718281})
+
+    def send_parallel():
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            for _ in executor.map(send, clients):
+                pass
+
+    benchmark.extra_info['commands'] = 1000 * threads
+    benchmark.extra_info['gil'] = GIL_ENABLED
+    benchmark.pedantic(send_parallel, rounds=3)
+
+
+def test_command_udp(benchmark, fake_server):
+    client = yumemi.Client('bench', 1, connection=fake_server.connection())
+    client.auth('user', 'pass')
+    benchmark(client.command, 'FILE', {'fid': 2718281})
+
+
+def test_command_replay(benchmark, fake_server, tmp_path):
+    path = str(tmp_path / 'capture.jsonl.gz')
+    rounds = 100
+    with Recorder(path) as recorder:
+        connection = fake_server.connection()
+        connection.recorder = recorder
+        client = yumemi.Client('bench', 1, connection=connection)
+        client.auth('user', 'pass')
+        for _ in range(rounds):
+            client.command('FILE', {'fid': 2718281})
+        connection.close()
+
+    def setup():
+        connection = ReplayConnection(
+            capture_path=path,
+            short_term_delay=0,
+            long_term_delay=0,
+            latency_scale=0,
+        )
+        client = yumemi.Client('bench', 1, connection=connection)
+        client.auth('user', 'pass')
+        return (client,), {}
+
+    def replay(client):
+        for _ in range(rounds):
+            client.command('FILE', {'fid': 2718281})
+
+    benchmark.pedantic(replay, setup=setup, rounds=5)
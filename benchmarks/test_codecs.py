@@ -0,0 +1,29 @@
+import pytest
+
+import yumemi
+
+from .conftest import REPLIES, compress
+
+
+@pytest.fixture
+def codec_crypt():
+    return yumemi.CodecCrypt('UTF-8', 'apikeysalt')
+
+
+def test_plain_decode(benchmark):
+    codec = yumemi.CodecPlain('UTF-8')
+    benchmark(codec.decode, REPLIES['FILE'])
+
+
+def test_plain_decode_compressed(benchmark):
+    codec = yumemi.CodecPlain('UTF-8')
+    benchmark(codec.decode, compress(REPLIES['FILE']))
+
+
+def test_crypt_encode(benchmark, codec_crypt):
+    benchmark(codec_crypt.encode, REPLIES['FILE'].decode())
+
+
+def test_crypt_decode(benchmark, codec_crypt):
+    data = codec_crypt.encode(REPLIES['FILE'].decode())
+    benchmark(codec_crypt.decode, data)
@@ -0,0 +1,83 @@
+import concurrent.futures
+
+import pytest
+
+from yumemi import _rhash as rhash
+from yumemi import hashers
+
+from .conftest import GIL_ENABLED, SMALL_FILES, THREADS
+
+
+def test_update_file(benchmark, sparse_file):
+    def hash_file():
+        return rhash.RHash(rhash.ED2K).update_file(sparse_file).finish().hex()
+
+    benchmark.extra_info['bytes'] = sparse_file.stat().st_size
+    benchmark.pedantic(hash_file, rounds=3)
+
+
+def test_hash_msg(benchmark):
+    data = bytes(1 << 20)
+    benchmark(rhash.hash_msg, data, rhash.ED2K)
+
+
+@pytest.mark.parametrize(
+    'backend', hashers.available_backends(), ids=lambda backend: backend.name)
+def test_hash_backend(benchmark, backend):
+    data = bytes(1 << 20)
+    benchmark.extra_info['bytes'] = len(data)
+    benchmark.pedantic(backend.hash_bytes, args=(data,), rounds=3)
+
+
+@pytest.mark.parametrize('threads', THREADS)
+@pytest.mark.parametrize(
+    'backend', hashers.available_backends(), ids=lambda backend: backend.name)
+def test_hash_threads(benchmark, backend, threads):
+    """
+    Every thread hashes the same amount of data, the time stays the same as
+    with one thread when hashing scales across cores. LibRHash releases the
+    GIL, Python backends scale only on free-threaded builds.
+    """
+    data = bytes(1 << 20 if backend.name == 'python' else 16 << 20)
+
+    def hash_parallel():
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            for _ in executor.map(backend.hash_bytes, [data] * threads):
+                pass
+
+    benchmark.extra_info['bytes'] = len(data) * threads
+    benchmark.extra_info['gil'] = GIL_ENABLED
+    benchmark.pedantic(hash_parallel, rounds=3)
+
+
+@pytest.fixture(scope='session')
+def small_files(tmp_path_factory):
+    """Tree of :data:`SMALL_FILES` files of a few kilobytes."""
+    root = tmp_path_factory.mktemp('small')
+    paths = []
+    for i in range(SMALL_FILES):
+        directory = root / str(i // 1000)
+        if i % 1000 == 0:
+            directory.mkdir()
+        path = directory / f'{i}.ass'
+        path.write_bytes(b'Dialogue: %d\n' % i * (i % 200 + 1))
+        paths.append(str(path))
+    return paths
+
+
+def test_hash_file_small(benchmark, small_files):
+    def hash_files():
+        for path in small_files:
+            rhash.hash_file(path, rhash.ED2K)
+
+    benchmark.extra_info['files'] = len(small_files)
+    benchmark.pedantic(hash_files, rounds=3)
+
+
+def test_hash_files_small(benchmark, small_files):
+    def hash_files():
+        for _ in rhash.hash_files(small_files, rhash.ED2K):
+            pass
+
+    benchmark.extra_info['files'] = len(small_files)
+    benchmark.pedantic(hash_files, rounds=3)
@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from yumemi.titles import TitleIndex
+
+from .conftest import TITLES
+
+
+SYLLABLES = [
+    c + v for c in ['', 'k', 's', 't', 'n', 'h', 'm', 'y', 'r', 'g', 'sh', 'ch']
+    for v in 'aeiou'
+]
+# Particles and words in many titles, their trigrams have the longest
+# posting lists.
+COMMON_WORDS = ['no', 'to', 'ga', 'wa', 'the', 'of', 'season', 'movie']
+
+
+def make_title(rng):
+    words = []
+    for _ in range(rng.randint(2, 6)):
+        if rng.random() < 0.35:
+            words.append(rng.choice(COMMON_WORDS))
+        else:
+            words.append(''.join(
+                rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return ' '.join(words).title()
+
+
+@pytest.fixture(scope='session')
+def title_index(tmp_path_factory):
+    """Index of :data:`TITLES` synthetic romaji titles."""
+    rng = random.Random(0)
+    path = tmp_path_factory.mktemp('titles') / 'anime-titles.dat'
+    with open(path, 'w', encoding='UTF-8') as f:
+        for i in range(TITLES):
+            f.write(f'{i // 4}|{i % 4 + 1}|x-jat|{make_title(rng)}\n')
+        f.write(f'{TITLES}|1|x-jat|Shingeki no Kyojin\n')
+    index = TitleIndex.open(str(path))
+    yield index
+    index.close()
+
+
+@pytest.mark.parametrize('query', [
+    'shingeki no kyojin',
+    'singeki kyojin',
+    # Only common trigrams.
+    'the movie no',
+])
+def test_search(benchmark, title_index, query):
+    benchmark.extra_info['titles'] = len(title_index)
+    benchmark(title_index.search, query)
@@ -49,6 +49,8 @@ from .rhash import (
     RHash,
     hash_msg,
     hash_file,
+    hash_files,
+    hash_files_multi,
     make_magnet,
     get_librhash_version,
 )
@@ -94,6 +96,8 @@ __all__ = [
     "RHash",
     "hash_msg",
     "hash_file",
+    "hash_files",
+    "hash_files_multi",
     "make_magnet",
     "get_librhash_version",
     "SHA224",
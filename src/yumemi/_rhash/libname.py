@@ -1,17 +1,34 @@
 import sys
+from ctypes import CDLL
 from ctypes.util import find_library
 
 
-_LIBNAME = find_library('rhash')
+def _find_librhash():
+    """Name of LibRHash, find_library does not work without ldconfig or gcc."""
+    name = find_library("rhash")
+    if name:
+        return name
 
-if not _LIBNAME:
     if sys.platform == "win32":
-        _LIBNAME = "librhash.dll"
+        candidates = ["librhash.dll", "rhash.dll"]
     elif sys.platform == "darwin":
-        _LIBNAME = "librhash.1.dylib"
+        candidates = ["librhash.1.dylib", "librhash.dylib",
+                      "/opt/homebrew/lib/librhash.dylib",
+                      "/usr/local/lib/librhash.dylib"]
     elif sys.platform == "cygwin":
-        _LIBNAME = "cygrhash.dll"
+        candidates = ["cygrhash.dll"]
     elif sys.platform == "msys":
-        _LIBNAME = "msys-rhash.dll"
+        candidates = ["msys-rhash.dll"]
     else:
-        _LIBNAME = "librhash.so.1"
+        candidates = ["librhash.so.1", "librhash.so.0", "librhash.so"]
+
+    for candidate in candidates:
+        try:
+            CDLL(candidate)
+        except OSError:
+            continue
+        return candidate
+    return candidates[0]
+
+
+_LIBNAME = _find_librhash()
@@ -67,10 +67,12 @@ message digests computed by the RHash object.
 """
 
 import sys
+import threading
 import warnings
 from ctypes import (
     CDLL,
     POINTER,
+    c_char,
     c_char_p,
     c_int,
     c_size_t,
@@ -196,6 +198,10 @@ class RHash(object):
 
     def __init__(self, *hash_ids):
         """Construct RHash object."""
+        # Calls to the library release the GIL, the lock keeps other threads
+        # from freeing the context while it's used.
+        self._lock = threading.Lock()
+        self._ctx = None
         if len(hash_ids) == 2 and hash_ids[0] == RHash.__context_key:
             self._ctx = hash_ids[1]
         elif _HAS_INIT_MULTI and RHash._are_good_ids(hash_ids):
@@ -214,8 +220,7 @@ class RHash(object):
 
     def __exit__(self, _type, _value, _traceback):
         """Exit the runtime context related to the RHash object."""
-        self._cleanup()
-        self._ctx = None
+        self.close()
 
     def __del__(self):
         """Destroy RHash object."""
@@ -225,10 +230,26 @@ class RHash(object):
         """Return the message digest."""
         return self._print(0, 0)
 
+    def close(self):
+        """Free the context, the object can't be used anymore."""
+        self._cleanup()
+
     def _cleanup(self):
         """Cleanup allocated resources."""
-        if self._ctx is not None:
-            _LIBRHASH.rhash_free(self._ctx)
+        # __init__ may have failed before the lock was created.
+        lock = getattr(self, "_lock", None)
+        if lock is None:
+            return
+        with lock:
+            ctx, self._ctx = self._ctx, None
+        if ctx is not None:
+            _LIBRHASH.rhash_free(ctx)
+
+    def _context(self):
+        """Return the context, must be called with the lock held."""
+        if self._ctx is None:
+            raise ValueError("RHash object is closed")
+        return self._ctx
 
     @staticmethod
     def _are_good_ids(hash_ids):
@@ -250,13 +271,15 @@ class RHash(object):
 
     def reset(self):
         """Reset this object to initial state."""
-        _LIBRHASH.rhash_reset(self._ctx)
+        with self._lock:
+            _LIBRHASH.rhash_reset(self._context())
         return self
 
     def update(self, message):
         """Update this object with new data chunk."""
         data = _msg_to_bytes(message)
-        _LIBRHASH.rhash_update(self._ctx, data, len(data))
+        with self._lock:
+            _LIBRHASH.rhash_update(self._context(), data, len(data))
         return self
 
     def __lshift__(self, message):
@@ -274,13 +297,15 @@ class RHash(object):
 
     def finish(self):
         """Flush buffered data and calculate message digests."""
-        _LIBRHASH.rhash_final(self._ctx, None)
+        with self._lock:
+            _LIBRHASH.rhash_final(self._context(), None)
         return self
 
     def _print(self, hash_id, flags):
         """Retrieve the message digest in the specified format."""
         buf = create_string_buffer(130)
-        size = _LIBRHASH.rhash_print(buf, self._ctx, hash_id, flags)
+        with self._lock:
+            size = _LIBRHASH.rhash_print(buf, self._context(), hash_id, flags)
         if (flags & 3) == _RHPR_RAW:
             return buf[0:size]
         return buf[0:size].decode()
@@ -314,11 +339,13 @@ class RHash(object):
 
     def magnet(self, filepath):
         """Return magnet link with all message digests computed by this object."""
-        size = _LIBRHASH.rhash_print_magnet(
-            None, _s2b(filepath), self._ctx, ALL, _RHPR_FILESIZE
-        )
-        buf = create_string_buffer(size)
-        _LIBRHASH.rhash_print_magnet(buf, _s2b(filepath), self._ctx, ALL, _RHPR_FILESIZE)
+        with self._lock:
+            ctx = self._context()
+            size = _LIBRHASH.rhash_print_magnet(
+                None, _s2b(filepath), ctx, ALL, _RHPR_FILESIZE
+            )
+            buf = create_string_buffer(size)
+            _LIBRHASH.rhash_print_magnet(buf, _s2b(filepath), ctx, ALL, _RHPR_FILESIZE)
         return buf[0:size - 1].decode("utf-8")
 
     def hash(self, hash_id=0):
@@ -329,12 +356,14 @@ class RHash(object):
         """Store RHash context into a block of bytes."""
         if not hasattr(_LIBRHASH, "rhash_export"):
             raise NotImplementedError("Unsupported method")
-        size = _LIBRHASH.rhash_export(self._ctx, None, 0)
-        if size > 0:
-            buf = create_string_buffer(size)
-            exported_size = _LIBRHASH.rhash_export(self._ctx, buf, size)
-            if size == exported_size:
-                return buf.raw
+        with self._lock:
+            ctx = self._context()
+            size = _LIBRHASH.rhash_export(ctx, None, 0)
+            if size > 0:
+                buf = create_string_buffer(size)
+                exported_size = _LIBRHASH.rhash_export(ctx, buf, size)
+                if size == exported_size:
+                    return buf.raw
         raise RuntimeError("Store failed")
 
     @staticmethod
@@ -367,6 +396,64 @@ def hash_file(filepath, hash_id):
     return str(handle)
 
 
+def hash_files(filepaths, hash_id, buffer_size=65536, onerror=None):
+    """Compute message digests (in their default format) of several files.
+
+    Yield (filepath, digest) tuples as the files are hashed. One RHash
+    context, read buffer and print buffer are reused for all files, so
+    hashing many small files does not pay for their allocation per file.
+    Errors of reading a file are raised, unless onerror is given; then it's
+    called with the filepath and the exception and the file is skipped.
+    """
+    results = hash_files_multi(filepaths, (hash_id,), buffer_size, onerror)
+    try:
+        for filepath, (digest,) in results:
+            yield filepath, digest
+    finally:
+        results.close()
+
+
+def hash_files_multi(filepaths, hash_ids, buffer_size=65536, onerror=None):
+    """Compute message digests of several files for several hash functions.
+
+    Same as hash_files(), but yield (filepath, digests) tuples, where digests
+    is a tuple of the digests in the order of hash_ids. Each file is read
+    once for all hash functions.
+    """
+    hash_ids = tuple(hash_ids)
+    if not hash_ids:
+        raise ValueError("No hash_ids given")
+    handle = RHash(*hash_ids)
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    data = (c_char * buffer_size).from_buffer(buf)
+    out = create_string_buffer(130)
+    try:
+        for filepath in filepaths:
+            handle.reset()
+            try:
+                with open(filepath, "rb", buffering=0) as file:
+                    size = file.readinto(view)
+                    while size:
+                        _LIBRHASH.rhash_update(handle._ctx, data, size)
+                        size = file.readinto(view)
+            except OSError as exc:
+                if onerror is None:
+                    raise
+                onerror(filepath, exc)
+                continue
+            _LIBRHASH.rhash_final(handle._ctx, None)
+            digests = []
+            for hash_id in hash_ids:
+                size = _LIBRHASH.rhash_print(out, handle._ctx, hash_id, 0)
+                digests.append(out.raw[0:size].decode())
+            yield filepath, tuple(digests)
+    finally:
+        del data
+        view.release()
+        handle.close()
+
+
 def make_magnet(filepath, *hash_ids):
     """Compute and return the magnet link for the file."""
     handle = RHash(*hash_ids)
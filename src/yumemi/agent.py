@@ -0,0 +1,354 @@
+"""
+Hashing files on the machines where they are stored, so the bytes don't have
+to travel over the network to the machine adding them to mylist.
+
+:class:`HashAgent` runs next to the storage and hashes files under its root
+directory. :class:`Coordinator` maps local paths (eg. mount points of network
+shares) to agents and requests hashes of the files from them. Requests and
+replies are length prefixed JSON frames over TCP, the same as used by the
+daemon (see :func:`~yumemi.daemon.send_frame`)::
+
+    -> {"id": 1, "path": "Anime/Kono Subarashii - 01.mkv"}
+    <- {"id": 1, "size": 367001600, "mtime_ns": 1675209600000000000,
+        "ed2k": "2f7c2..."}
+
+The agent has no authentication, it only tells hashes, sizes and
+modification times of files under its root to anyone who can connect.
+"""
+
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import os
+import socket
+import threading
+import time
+import typing as t
+
+import attrs
+
+from . import hashers
+from .daemon import recv_frame, send_frame
+from .exceptions import AnidbError, ClientError
+
+
+DEFAULT_PORT = 9001
+
+
+@attrs.define
+class Hash:
+    size: int
+    mtime_ns: int
+    ed2k: str
+
+    def matches(self, st: os.stat_result) -> bool:
+        """
+        Check if the hash is of the file with stat `st`. Network file systems
+        may round the modification time, it's compared with 1 second
+        tolerance.
+        """
+        return (st.st_size == self.size
+                and abs(st.st_mtime_ns - self.mtime_ns) < 1_000_000_000)
+
+
+@attrs.define
+class HashAgent:
+    """
+    Server hashing files under `root` on request.
+
+    Every connection is served by its own thread, requests of one connection
+    are hashed one at a time.
+    """
+
+    root: str
+    host: str = '127.0.0.1'
+    port: int = DEFAULT_PORT
+    """Port to listen on, updated to the bound port when 0."""
+
+    _socket: t.Optional[socket.socket] = attrs.field(init=False, default=None)
+    _closed: threading.Event = attrs.field(init=False, factory=threading.Event)
+
+    def listen(self) -> None:
+        """Bind the socket, called by :meth:`serve_forever` if needed."""
+        self._socket = socket.create_server((self.host, self.port))
+        self.port = self._socket.getsockname()[1]
+
+    def serve_forever(self) -> None:
+        """Serve requests until :meth:`close`."""
+        if self._socket is None:
+            self.listen()
+        assert self._socket is not None
+
+        while not self._closed.is_set():
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._socket is not None:
+            # Shutdown interrupts accept() blocked in serve_forever().
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._socket.close()
+
+    def _serve(self, conn: socket.socket) -> None:
+        try:
+            while (request := recv_frame(conn)) is not None:
+                send_frame(conn, self._hash(request))
+        except (OSError, ValueError, AnidbError):
+            pass
+        finally:
+            conn.close()
+
+    def _local_path(self, path: str) -> str:
+        root = os.path.realpath(self.root)
+        local_path = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, local_path]) != root:
+            raise PermissionError(f'{path} is outside of the root directory')
+        return local_path
+
+    def _hash(self, request: dict[str, t.Any]) -> dict[str, t.Any]:
+        try:
+            path = self._local_path(request['path'])
+            st = os.stat(path)
+            ed2k = hashers.hash_file(path)
+            if os.stat(path).st_mtime_ns != st.st_mtime_ns:
+                raise OSError(f'{request["path"]} changed while hashing')
+        except (OSError, KeyError, TypeError) as e:
+            return {'id': request.get('id'), 'error': str(e)}
+        return {
+            'id': request['id'],
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'ed2k': ed2k,
+        }
+
+
+@attrs.define
+class AgentClient:
+    """
+    Connection to a :class:`HashAgent`. Requests are pipelined, the agent
+    starts hashing the next file as soon as it's done with the previous one.
+
+    When the agent can't be reached or stops responding (see
+    :meth:`mark_dead`), requests fail immediately for `retry_interval`
+    seconds instead of connecting again for every file.
+    """
+
+    host: str
+    port: int = DEFAULT_PORT
+    connect_timeout: float = 5
+    retry_interval: float = 60
+    """Seconds requests fail without connecting after the agent failed."""
+
+    _socket: t.Optional[socket.socket] = attrs.field(init=False, default=None)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _ids: t.Iterator[int] = attrs.field(init=False, factory=itertools.count)
+    _pending: dict[int, 'concurrent.futures.Future[Hash]'] = attrs.field(
+        init=False, factory=dict)
+    _dead_until: float = attrs.field(init=False, default=0)
+
+    def _connect(self) -> socket.socket:
+        if self._socket is None:
+            if time.monotonic() < self._dead_until:
+                raise ConnectionError(
+                    f'Agent {self.host}:{self.port} is not available')
+            try:
+                self._socket = socket.create_connection(
+                    (self.host, self.port), timeout=self.connect_timeout)
+            except OSError:
+                self._dead_until = time.monotonic() + self.retry_interval
+                raise
+            # Hashing a file may take any time, replies are waited for by
+            # the callers.
+            self._socket.settimeout(None)
+            threading.Thread(
+                target=self._read, args=(self._socket,), daemon=True).start()
+        return self._socket
+
+    def hash(self, path: str) -> 'concurrent.futures.Future[Hash]':
+        """
+        Request hash of the file, `path` is relative to the agent's root.
+
+        Returns:
+            Future of the hash, it fails with :exc:`ClientError` if the agent
+            could not hash the file and with :exc:`OSError` if the connection
+            failed.
+        """
+        future: concurrent.futures.Future[Hash] = concurrent.futures.Future()
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                send_frame(self._connect(), {'id': request_id, 'path': path})
+            except OSError as e:
+                del self._pending[request_id]
+                future.set_exception(e)
+        return future
+
+    def _read(self, sock: socket.socket) -> None:
+        error: Exception = ConnectionResetError('Agent closed the connection')
+        try:
+            while (reply := recv_frame(sock)) is not None:
+                with self._lock:
+                    future = self._pending.pop(reply['id'], None)
+                if future is None:
+                    continue
+                if 'error' in reply:
+                    future.set_exception(ClientError(reply['error']))
+                else:
+                    future.set_result(
+                        Hash(reply['size'], reply['mtime_ns'], reply['ed2k']))
+        except (OSError, ValueError, AnidbError) as e:
+            error = e
+
+        with self._lock:
+            if self._socket is sock:
+                self._socket = None
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            future.set_exception(error)
+
+    def mark_dead(self) -> None:
+        """
+        Drop the connection to an agent which stopped responding, fail its
+        pending requests and don't connect again for `retry_interval`.
+        """
+        with self._lock:
+            self._dead_until = time.monotonic() + self.retry_interval
+            sock, self._socket = self._socket, None
+            pending = list(self._pending.values())
+            self._pending.clear()
+        if sock is not None:
+            # Shutdown wakes up the reader blocked in recv().
+            with contextlib.suppress(OSError):
+                sock.shutdown(socket.SHUT_RDWR)
+            sock.close()
+        error = TimeoutError(f'Agent {self.host}:{self.port} is not responding')
+        for future in pending:
+            future.set_exception(error)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+
+def parse_agent(value: str) -> tuple[str, tuple[str, int]]:
+    """Parse ``PREFIX=HOST[:PORT]`` to prefix and agent address."""
+    prefix, sep, address = value.rpartition('=')
+    if not sep or not prefix or not address:
+        raise ValueError(f'{value!r} is not PREFIX=HOST[:PORT]')
+    host, _, port = address.rpartition(':') if ':' in address else (address, '', '')
+    return prefix, (host, int(port) if port else DEFAULT_PORT)
+
+
+@attrs.define
+class Coordinator:
+    """
+    Requests hashes of files from agents running where the files are stored.
+
+    `agents` maps local directories to agents, path of a file under the
+    directory relative to it is the path relative to the agent's root.
+    """
+
+    agents: dict[str, tuple[str, int]]
+    window: int = 8
+    """Maximum number of files requested ahead."""
+    onerror: t.Optional[t.Callable[[str, Exception], None]] = None
+    """Called with a path and an exception when an agent failed to hash it."""
+    timeout: t.Optional[float] = 10 * 60
+    """
+    Seconds to wait for a hash, the agent is considered hung after that and
+    its files are hashed locally.
+    """
+
+    _clients: dict[str, AgentClient] = attrs.field(init=False)
+    _futures_clients: dict['concurrent.futures.Future[Hash]', AgentClient] = \
+        attrs.field(init=False, factory=dict)
+
+    def __attrs_post_init__(self):
+        self._clients = {
+            os.path.abspath(prefix): AgentClient(host, port)
+            for prefix, (host, port) in self.agents.items()
+        }
+
+    def _agent(self, path: str) -> t.Optional[tuple[AgentClient, str]]:
+        path = os.path.abspath(path)
+        # Longest prefix wins for nested directories.
+        for prefix in sorted(self._clients, key=len, reverse=True):
+            if os.path.commonpath([prefix, path]) == prefix and path != prefix:
+                return self._clients[prefix], os.path.relpath(path, prefix)
+        return None
+
+    def hash(self, path: str) -> t.Optional['concurrent.futures.Future[Hash]']:
+        """Request hash of the file, ``None`` if no agent has the file."""
+        agent = self._agent(path)
+        if agent is None:
+            return None
+        client, agent_path = agent
+        future = client.hash(agent_path)
+        self._futures_clients[future] = client
+        return future
+
+    def hashes(self,
+               paths: t.Iterable[tuple[str, t.Optional[str]]],
+               ) -> t.Iterator[tuple[str, t.Optional[str]]]:
+        """
+        Fill in ED2K hashes of ``(path, ed2k)`` pairs which have no hash, in
+        the same order. Files are requested from agents up to `window` files
+        ahead. Hash stays ``None`` if no agent has the file, the agent failed,
+        or the file on the agent differs from the local file.
+        """
+        paths = iter(paths)
+        pending: collections.deque[tuple[
+            str, t.Optional[str], t.Optional[concurrent.futures.Future[Hash]]
+        ]] = collections.deque()
+
+        def fill() -> None:
+            while len(pending) < max(self.window, 1):
+                item = next(paths, None)
+                if item is None:
+                    return
+                path, ed2k = item
+                pending.append((path, ed2k, None if ed2k else self.hash(path)))
+
+        fill()
+        while pending:
+            path, ed2k, future = pending.popleft()
+            fill()
+            if future is not None:
+                ed2k = self._result(path, future)
+            yield path, ed2k
+
+    def _result(self, path: str,
+                future: 'concurrent.futures.Future[Hash]') -> t.Optional[str]:
+        client = self._futures_clients.pop(future, None)
+        try:
+            try:
+                result = future.result(self.timeout)
+            except concurrent.futures.TimeoutError:
+                if client is not None:
+                    client.mark_dead()
+                raise TimeoutError(
+                    f'Agent did not hash {path} in {self.timeout:g} seconds'
+                ) from None
+            if not result.matches(os.stat(path)):
+                raise ClientError(f'{path} differs from the file on the agent')
+        except (OSError, AnidbError) as e:
+            if self.onerror is not None:
+                self.onerror(path, e)
+            return None
+        return result.ed2k
+
+    def close(self) -> None:
+        for client in self._clients.values():
+            client.close()
@@ -1,3 +1,4 @@
+import queue
 import socket
 import threading
 import time
@@ -7,23 +8,49 @@ import zlib
 import attrs
 from cryptography.hazmat.primitives import ciphers, hashes, padding
 
+from . import trace
 from .exceptions import ClientError, ServerError
 
 
+if t.TYPE_CHECKING:
+    from .batch import FileResult
+    from .cache import ResultCache
+    from .capture import Recorder
+    from .mylist import MylistEdit
+
+
 @attrs.define
 class Connection:
     """
     Low-level conection to the AniDB UDP API with thread safe `flood
     protection <https://wiki.anidb.net/w/UDP_API_Definition#Flood_Protection>`_
     (packet rate limit, one packet every two seconds).
+
+    Server address is resolved once and cached for `dns_ttl` seconds. When
+    resolving fails, the last known address is used.
     """
 
     server_host: str = 'api.anidb.net'
     server_port: int = 9000
     local_port: int = 8888
+    short_term_delay: float = 2
+    """Seconds between packets after the first five packets."""
+    long_term_delay: float = 4
+    """Seconds between packets when the server starts dropping packets."""
+    tracer: t.Optional[trace.Tracer] = None
+    address_family: socket.AddressFamily = socket.AF_INET
+    """:data:`socket.AF_INET` for IPv4 or :data:`socket.AF_INET6` for IPv6."""
+    dns_ttl: float = 5 * 60
+    """Seconds to cache the resolved server address."""
+    recorder: t.Optional['Recorder'] = None
+    """Record packets and latencies, see :mod:`yumemi.capture`."""
 
     _lock: threading.RLock = attrs.field(init=False)
     _socket: socket.socket = attrs.field(init=False)
+    _resolve_lock: threading.Lock = attrs.field(init=False)
+    _address: t.Optional[tuple] = attrs.field(init=False)
+    _address_time: float = attrs.field(init=False)
+    _replies: t.Optional[queue.Queue] = attrs.field(init=False)
     _send_time: float = attrs.field(init=False)
     _send_count: int = attrs.field(init=False)
     _send_drop_count: int = attrs.field(init=False)
@@ -31,46 +58,117 @@ class Connection:
     def __attrs_post_init__(self):
         self._lock = threading.RLock()
 
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self._socket.bind(('0.0.0.0', self.local_port))
+        self._socket = self._open_socket()
         self._socket.settimeout(4)
 
+        self._resolve_lock = threading.Lock()
+        self._address = None
+        self._address_time = 0
+
         self._send_time = 0
         self._send_count = 0
         self._send_drop_count = 0
 
-    def send(self, data: bytes) -> None:
+        self._replies = None
+
+    def _open_socket(self) -> socket.socket:
+        """UDP socket bound to `local_port`."""
+        sock = socket.socket(self.address_family, socket.SOCK_DGRAM)
+        try:
+            if self.address_family == socket.AF_INET6:
+                sock.bind(('::', self.local_port))
+            else:
+                sock.bind(('0.0.0.0', self.local_port))
+        except OSError:
+            # Eg. port is in use, callers may try another port.
+            sock.close()
+            raise
+        return sock
+
+    def _resolve(self) -> tuple:
+        """Server address for :meth:`socket.socket.sendto`."""
+        with self._resolve_lock:
+            now = time.monotonic()
+            if self._address is not None and now < self._address_time + self.dns_ttl:
+                return self._address
+
+            with trace.span(self.tracer, 'resolve', 'connection'):
+                try:
+                    addr_info = socket.getaddrinfo(
+                        self.server_host,
+                        self.server_port,
+                        self.address_family,
+                        socket.SOCK_DGRAM,
+                    )
+                    self._address = addr_info[0][4]
+                except OSError as e:
+                    if self._address is None:
+                        raise ServerError(
+                            f'Could not resolve {self.server_host}, {e!s}') from e
+                    # Keep the last known address until the next refresh.
+
+            self._address_time = now
+            return self._address
+
+    def send(self, data: bytes, codec: t.Optional['CodecPlain'] = None) -> None:
+        """
+        Send a packet, after waiting for the flood protection.
+
+        Args:
+            data: Encoded packet.
+            codec: Codec the packet was encoded with, the `recorder` decodes
+                packets and their replies with it.
+        """
         if len(data) > 1400:
             raise ClientError("Can't send more than 1400 bytes")
 
-        with self._lock:
-            delay_secs = 0
-            if self._send_count > 4:
-                # "Short Term" policy (1 packet per 2 seconds).
-                # Enforced after the first 5 packets.
-                delay_secs = 2
-            if self._send_drop_count > 4:
-                # "Long Term" policy (1 packet per 4 seconds).
-                # Used when server starts dropping packets.
-                delay_secs = 4
+        # Resolved before taking the lock, slow resolver doesn't hold up recv.
+        address = self._resolve()
 
+        with self._lock:
+            delay_secs = self._delay()
             t = time.time()
             if t < self._send_time + delay_secs:
-                time.sleep(self._send_time + delay_secs - t)
+                with trace.span(self.tracer, 'limiter', 'connection'):
+                    time.sleep(self._send_time + delay_secs - t)
 
             try:
-                self._socket.sendto(data, (self.server_host, self.server_port))
+                with trace.span(self.tracer, 'sendto', 'connection'):
+                    self._sendto(data, address)
             finally:
                 self._send_count += 1
                 self._send_time = time.time()
 
+            if self.recorder is not None:
+                self.recorder.sent(data, codec)
+
+    def _delay(self) -> float:
+        delay_secs = 0.0
+        if self._send_count > 4:
+            # "Short Term" policy (1 packet per 2 seconds).
+            # Enforced after the first 5 packets.
+            delay_secs = self.short_term_delay
+        if self._send_drop_count > 4:
+            # "Long Term" policy (1 packet per 4 seconds).
+            # Used when server starts dropping packets.
+            delay_secs = self.long_term_delay
+        return delay_secs
+
+    def send_delay(self) -> float:
+        """Seconds until the next packet may be sent without waiting."""
+        with self._lock:
+            return max(self._send_time + self._delay() - time.time(), 0)
+
+    def _sendto(self, data: bytes, address: tuple) -> None:
+        self._socket.sendto(data, address)
+
     def recv(self) -> bytes:
         data = b''
 
         try:
-            # Replies from the server will never exceed 1400 bytes.
-            data = self._socket.recv(1400)
-        except socket.timeout:
+            with trace.span(self.tracer, 'recv', 'connection'):
+                data = self._recv()
+        except (socket.timeout, queue.Empty):
             with self._lock:
                 self._send_drop_count += 1
         else:
@@ -78,10 +176,55 @@ class Connection:
                 if self._send_drop_count > 0:
                     self._send_drop_count -= 1
 
+        if self.recorder is not None:
+            self.recorder.received(data or None)
+
         if not data:
             raise ServerError('Received no data from the API')
         return data
 
+    def _recv(self) -> bytes:
+        if self._replies is not None:
+            return self._replies.get(timeout=self._socket.gettimeout())
+        # Replies from the server will never exceed 1400 bytes.
+        return self._socket.recv(1400)
+
+    def start_receiver(self, handler: t.Callable[[bytes], bool]) -> None:
+        """
+        Receive packets in a background thread instead of in :meth:`recv`.
+
+        Every packet is passed to the `handler` first. Packets the handler
+        returns ``True`` for are consumed by it (eg. server notifications),
+        other packets are replies returned by :meth:`recv`.
+        """
+        with self._lock:
+            if self._replies is not None:
+                raise ClientError('Receiver is already running')
+            self._replies = queue.Queue()
+
+        def receive():
+            assert self._replies is not None
+            while True:
+                try:
+                    data = self._socket.recv(1400)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    # Socket was closed.
+                    return
+                try:
+                    if handler(data):
+                        continue
+                except Exception:
+                    pass
+                self._replies.put(data)
+
+        threading.Thread(target=receive, daemon=True).start()
+
+    def close(self) -> None:
+        """Close the socket and free the local port."""
+        self._socket.close()
+
 
 @attrs.define
 class CodecPlain:
@@ -142,6 +285,16 @@ class CodecCrypt(CodecPlain):
         return decoded_data
 
 
+def parse_reply(lines: list[str]) -> tuple[int, str, tuple[tuple[str, ...], ...]]:
+    """Split lines of a decoded reply to code, message and data."""
+    code, message = lines[0].split(' ', maxsplit=1)
+    data = tuple(
+        tuple(field.replace('<br />', '\n') for field in line.split('|'))
+        for line in lines[1:]
+    )
+    return int(code), message, data
+
+
 @attrs.define
 class Result:
     command: str
@@ -155,14 +308,33 @@ class Result:
 class Client:
     client_name: str
     client_version: int
+    _connection: Connection = attrs.field(default=None, kw_only=True)
+    """Connection to use, new :class:`Connection` with defaults if not given."""
+    tracer: t.Optional[trace.Tracer] = attrs.field(default=None, kw_only=True)
+    """Record commands, also passed to the connection if it has no tracer."""
+    failure_threshold: int = attrs.field(default=3, kw_only=True)
+    """
+    Consecutive failures (no reply or server error) after which commands fail
+    fast without being sent, ``0`` to never fail fast.
+    """
+    cooldown: float = attrs.field(default=30, kw_only=True)
+    """Seconds to fail fast before the API is probed with ``PING`` again."""
+    cache: t.Optional['ResultCache'] = attrs.field(default=None, kw_only=True)
+    """Results of lookup commands, returned without sending the command."""
 
-    _connection: Connection = attrs.field(init=False)
     _lock: threading.RLock = attrs.field(init=False)
     _codec: CodecPlain = attrs.field(init=False)
     _session_key: t.Optional[str] = attrs.field(init=False)
+    _circuit_lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _failures: int = attrs.field(init=False, default=0)
+    _open_until: t.Optional[float] = attrs.field(init=False, default=None)
+    _probing: bool = attrs.field(init=False, default=False)
 
     def __attrs_post_init__(self):
-        self._connection = Connection()
+        if self._connection is None:
+            self._connection = Connection()
+        if self._connection.tracer is None:
+            self._connection.tracer = self.tracer
         self._lock = threading.RLock()
         self._codec = CodecPlain('ASCII')
         self._session_key = None
@@ -190,14 +362,100 @@ class Client:
         Returns:
             Command result.
 
+        Results of lookup commands are returned from `cache` if they're
+        cached.
+
+        After `failure_threshold` consecutive failures, commands raise
+        :exc:`ServerError` immediately for `cooldown` seconds. Then the API is
+        probed with ``PING`` before the next command is sent.
+
         Raises:
             ClientError: Raised for common client side errors, like invalid
                 command or invalid parameters.
-            ServerError: When something went wrong on the server side.
+            ServerError: When something went wrong on the server side, or
+                the API is unavailable.
         """
         command = command.upper()
         params = params or {}
 
+        if self.cache is not None:
+            cached = self.cache.get(command, params)
+            if cached is not None:
+                return cached
+
+        probing = self._check_circuit()
+        with self._lock:
+            # Circuit may have opened while waiting for another command.
+            if not probing:
+                probing = self._check_circuit()
+            try:
+                if probing and command != 'PING':
+                    self._send_command('PING', {})
+                    self._close_circuit()
+                result = self._send_command(command, params)
+            except (ServerError, OSError):
+                self._command_failed(probing)
+                raise
+            else:
+                self._close_circuit()
+                if self.cache is not None:
+                    self.cache.put(result)
+            finally:
+                if probing:
+                    with self._circuit_lock:
+                        self._probing = False
+
+        return result
+
+    def command_if_idle(self,
+                        command: str,
+                        params: t.Optional[dict[str, t.Any]] = None,
+                        ) -> t.Optional[Result]:
+        """
+        Send the command only if it would not wait, no other command is being
+        sent and the flood protection allows to send a packet right now. For
+        background work which should not delay other commands.
+
+        Returns:
+            Command result, ``None`` if the command was not sent.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if self._connection.send_delay() > 0:
+                return None
+            return self.command(command, params)
+        finally:
+            self._lock.release()
+
+    def _check_circuit(self) -> bool:
+        """
+        Fail fast while the circuit is open. Returns ``True`` if the caller
+        should probe the API, it's the first command after the cool-down.
+        """
+        with self._circuit_lock:
+            if self._open_until is None:
+                return False
+            remaining = self._open_until - time.monotonic()
+            if remaining > 0 or self._probing:
+                raise ServerError(
+                    f'API is unavailable, next attempt in {max(remaining, 0):.0f}s')
+            self._probing = True
+            return True
+
+    def _close_circuit(self) -> None:
+        with self._circuit_lock:
+            self._failures = 0
+            self._open_until = None
+
+    def _command_failed(self, probing: bool) -> None:
+        with self._circuit_lock:
+            self._failures += 1
+            if probing or (self.failure_threshold
+                           and self._failures >= self.failure_threshold):
+                self._open_until = time.monotonic() + self.cooldown
+
+    def _send_command(self, command: str, params: dict[str, t.Any]) -> Result:
         params_copy = params.copy()
         for k, v in params_copy.items():
             if v is None:
@@ -206,7 +464,7 @@ class Client:
                 v = int(v)
             params_copy[k] = str(v).replace('&', '&amp;').replace('\n', '<br />')
 
-        with self._lock:
+        with trace.span(self.tracer, command, 'command') as span_args, self._lock:
             if command not in {'PING', 'ENCODING', 'ENCRYPT', 'AUTH', 'VERSION'}:
                 if not self._session_key:
                     result = Result(
@@ -222,28 +480,25 @@ class Client:
             params_str = '&'.join(f'{k}={v}' for k, v in params_copy.items())
             request = self._codec.encode(f'{command} {params_str}'.strip())
 
-            self._connection.send(request)
+            self._connection.send(request, codec=self._codec)
             response = self._connection.recv()
 
             lines = self._codec.decode(response).split('\n')
+            span_args['reply'] = lines[0]
 
-        code, message = lines[0].split(' ', maxsplit=1)
-        data = tuple(
-            tuple(field.replace('<br />', '\n') for field in line.split('|'))
-            for line in lines[1:]
-        )
+        code, message, data = parse_reply(lines)
 
         result = Result(
             command=command,
             params=params,
-            code=int(code),
+            code=code,
             message=message,
             data=data,
         )
 
-        if result.code >= 600:
+        if 600 <= result.code < 700:
             raise ServerError.from_result(result)
-        elif result.code >= 500:
+        elif 500 <= result.code < 600:
             raise ClientError.from_result(result)
 
         return result
@@ -355,3 +610,40 @@ class Client:
         """
         with self._lock:
             return self._session_key is not None and self.command('UPTIME').code == 208
+
+    def mylistadd_many(self,
+                       paths: t.Iterable[str],
+                       params: t.Optional[dict[str, t.Any]] = None,
+                       **kwargs: t.Any,
+                       ) -> t.Generator['FileResult', None, None]:
+        """
+        Hash files and add them to mylist, see :func:`yumemi.batch.mylistadd_many`.
+
+        Example::
+
+            for result in client.mylistadd_many(paths, {'viewed': True}):
+                if result.error:
+                    print(result.path, result.error)
+                else:
+                    print(result.path, result.mylistadd.message)
+        """
+        from .batch import mylistadd_many
+        return mylistadd_many(self, paths, params, **kwargs)
+
+    def mylistedit_many(self,
+                        files: t.Iterable[tuple[str, int]],
+                        params: dict[str, t.Any],
+                        **kwargs: t.Any,
+                        ) -> t.Iterator[tuple['MylistEdit', Result]]:
+        """
+        Edit mylist entries of files with ranged edits of their anime's
+        episodes, see :func:`yumemi.mylist.mylistedit_many`.
+
+        Example::
+
+            files = [(ed2k, size)]
+            for edit, result in client.mylistedit_many(files, {'viewed': True}):
+                print(edit.params, result.message)
+        """
+        from .mylist import mylistedit_many
+        return mylistedit_many(self, files, params, **kwargs)
@@ -0,0 +1,173 @@
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+import typing as t
+
+import attrs
+
+from . import hashers
+from .anidb import Client, Result
+from .exceptions import AnidbError
+from .unknown import UnknownFiles
+
+
+FATAL_CODES = frozenset({500, 502, 503, 504, 555})
+"""
+Codes of errors after which no other file can be added: login failed, access
+denied, client outdated or banned, user banned.
+"""
+
+
+@attrs.define
+class FileResult:
+    path: str
+    ed2k: t.Optional[str] = None
+    size: t.Optional[int] = None
+    mylistadd: t.Optional[Result] = None
+    """Result of ``MYLISTADD`` command."""
+    file: t.Optional[Result] = None
+    """Result of ``FILE`` command, only if it was requested."""
+    error: t.Optional[Exception] = None
+    """
+    Error of reading the file (:exc:`OSError`), no commands were sent for it,
+    or of its command (:exc:`~yumemi.AnidbError`, eg. a lost reply).
+    """
+    next_check: t.Optional[float] = None
+    """
+    Time (:func:`time.time`) of the next check of a file unknown to AniDB.
+    ``MYLISTADD`` was not sent if its result is ``None``.
+    """
+
+
+def hash_file(path: str) -> tuple[str, int]:
+    """ED2K hash and size of the file."""
+    return hashers.hash_file(path), os.path.getsize(path)
+
+
+def mylistadd_many(client: Client,
+                   paths: t.Iterable[str],
+                   params: t.Optional[dict[str, t.Any]] = None,
+                   *,
+                   file_params: t.Optional[dict[str, t.Any]] = None,
+                   workers: int = 2,
+                   window: int = 4,
+                   hasher: t.Callable[[str], tuple[str, int]] = hash_file,
+                   unknown_files: t.Optional[UnknownFiles] = None,
+                   recheck: bool = False,
+                   ) -> t.Generator[FileResult, None, None]:
+    """
+    Hash files and add them to mylist, yielding result of each file as soon as
+    it's done, in the order of `paths`.
+
+    Files are hashed by `workers` threads up to `window` files ahead of the
+    file being added, so a hash is ready whenever the connection's flood
+    protection lets the next command through. `paths` are consumed lazily by
+    a background thread, they may be endless.
+
+    Errors of a single file are in its result, the other files are still
+    added.
+
+    Args:
+        client: Authenticated client.
+        paths: Paths of the files.
+        params: Other ``MYLISTADD`` parameters, eg. ``{'viewed': True}``.
+        file_params: Send also ``FILE`` command with these parameters (eg.
+            ``fmask`` and ``amask``) for files known to AniDB.
+        workers: Number of hashing threads.
+        window: Maximum number of files hashed ahead.
+        hasher: Function returning ED2K hash and size of a file, called by
+            the hashing threads, eg. to take hashes from manifests.
+        unknown_files: Files unknown to AniDB are recorded to it, and not
+            sent until it's time to check them again.
+        recheck: Send also files recorded as unknown to AniDB.
+
+    Raises:
+        ClientError: Error after which no other file can be added, see
+            :data:`FATAL_CODES`.
+    """
+    paths = iter(paths)
+    pending: queue.Queue[
+        t.Optional[tuple[str, concurrent.futures.Future[tuple[str, int]]]]
+    ] = queue.Queue()
+    # The file being added and the files hashed ahead of it.
+    slots = threading.Semaphore(max(window, 1) + 1)
+    stop = threading.Event()
+    errors: list[Exception] = []
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=workers,
+        thread_name_prefix='yumemi-hash',
+    )
+
+    def feed() -> None:
+        # Paths may never end (eg. a watcher), they're taken in a thread so
+        # results of the files already found aren't held back.
+        try:
+            while True:
+                slots.acquire()
+                if stop.is_set():
+                    return
+                path = next(paths, None)
+                if path is None:
+                    return
+                pending.put((path, executor.submit(hasher, path)))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            pending.put(None)
+
+    threading.Thread(target=feed, name='yumemi-feed', daemon=True).start()
+
+    try:
+        while True:
+            item = pending.get()
+            if item is None:
+                if errors:
+                    raise errors[0]
+                return
+            path, future = item
+            try:
+                ed2k, size = future.result()
+            except OSError as e:
+                yield FileResult(path, error=e)
+                slots.release()
+                continue
+
+            result = FileResult(path, ed2k, size)
+            if (unknown_files is not None and not recheck
+                    and not unknown_files.should_check(ed2k, size)):
+                result.next_check = unknown_files.next_check(ed2k, size)
+                yield result
+                slots.release()
+                continue
+
+            try:
+                result.mylistadd = client.command('MYLISTADD', {
+                    'ed2k': ed2k,
+                    'size': size,
+                    **(params or {}),
+                })
+                if unknown_files is not None:
+                    if result.mylistadd.code == 320:
+                        result.next_check = (
+                            time.time() + unknown_files.failed(ed2k, size))
+                    else:
+                        unknown_files.found(ed2k, size)
+                if file_params is not None and result.mylistadd.code != 320:
+                    result.file = client.command('FILE', {
+                        'ed2k': ed2k,
+                        'size': size,
+                        **file_params,
+                    })
+            except AnidbError as e:
+                if e.result is not None and e.result.code in FATAL_CODES:
+                    raise
+                result.error = e
+            yield result
+            slots.release()
+    finally:
+        stop.set()
+        slots.release()
+        executor.shutdown(cancel_futures=True)
@@ -0,0 +1,176 @@
+"""
+Cache of results of lookup commands, filled by the client and ahead of time
+by :class:`~yumemi.prefetch.Prefetcher`.
+
+AniDB asks clients not to request the same data repeatedly, cached results
+are returned by :meth:`~yumemi.Client.command` without sending anything.
+Mylist fields of ``FILE`` results (eg. ``lid``) change with ``MYLISTADD``,
+they're cached empty.
+
+With a `path`, the cache is kept in a JSON file between runs, so files looked
+up before are not looked up again.
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+import typing as t
+
+import attrs
+
+from .anidb import Result
+
+
+CACHED_COMMANDS = frozenset({'FILE', 'ANIME', 'EPISODE', 'GROUP'})
+"""Commands whose results are cached, they don't change any data."""
+
+Key = tuple[str, tuple[tuple[str, str], ...]]
+
+# Mylist fields of FILE fmask by byte and bits: lid, and mylist state,
+# filestate, viewed, viewdate, storage, source and other.
+_FMASK_MYLIST = {0: 0x08, 4: 0xFE}
+
+
+def _without_mylist(result: Result) -> Result:
+    """Copy of a ``FILE`` result with empty mylist fields."""
+    try:
+        fmask = bytes.fromhex(str(result.params.get('fmask', '')))
+    except ValueError:
+        return result
+    indexes = []
+    # Fields follow fid in order of fmask bits.
+    index = 1
+    for i, byte in enumerate(fmask):
+        for bit in (0x80, 0x40, 0x20, 0x10, 0x08, 0x04, 0x02, 0x01):
+            if byte & bit:
+                if _FMASK_MYLIST.get(i, 0) & bit:
+                    indexes.append(index)
+                index += 1
+    if not indexes:
+        return result
+    data = tuple(
+        tuple('' if j in indexes else value for j, value in enumerate(row))
+        for row in result.data
+    )
+    return attrs.evolve(result, data=data)
+
+
+def cache_key(command: str, params: dict[str, t.Any]) -> Key:
+    """Key of the command, session key and order of params don't matter."""
+    return command.upper(), tuple(sorted(
+        (k, str(int(v) if isinstance(v, bool) else v))
+        for k, v in params.items() if k != 's'
+    ))
+
+
+@attrs.define
+class ResultCache:
+    """
+    Successful results of :data:`CACHED_COMMANDS`, least recently used are
+    dropped when the cache is full.
+    """
+
+    ttl: float = 24 * 60 * 60
+    """Seconds a result is valid."""
+    max_size: int = 1024
+    path: t.Optional[str] = None
+    """File the cache is loaded from and saved to, ``None`` to keep it in memory."""
+
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _results: 'collections.OrderedDict[Key, tuple[float, Result]]' = attrs.field(
+        init=False, factory=collections.OrderedDict)
+
+    def __attrs_post_init__(self):
+        if self.path is not None:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def __contains__(self, key: Key) -> bool:
+        return self._get(key) is not None
+
+    def _get(self, key: Key) -> t.Optional[Result]:
+        with self._lock:
+            item = self._results.get(key)
+            if item is None:
+                return None
+            if time.time() > item[0]:
+                del self._results[key]
+                return None
+            self._results.move_to_end(key)
+            return item[1]
+
+    def get(self, command: str, params: dict[str, t.Any]) -> t.Optional[Result]:
+        """Copy of the cached result, ``None`` if not cached or expired."""
+        result = self._get(cache_key(command, params))
+        return attrs.evolve(result) if result is not None else None
+
+    def put(self, result: Result) -> bool:
+        """Cache the result if it's cacheable, returns if it was cached."""
+        if result.command not in CACHED_COMMANDS or not 200 <= result.code < 300:
+            return False
+        key = cache_key(result.command, result.params)
+        if result.command == 'FILE':
+            result = _without_mylist(result)
+        with self._lock:
+            self._results[key] = (time.time() + self.ttl, result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+    def _load(self) -> None:
+        assert self.path is not None
+        try:
+            with open(self.path) as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            # Missing or damaged, start empty.
+            return
+        now = time.time()
+        with self._lock:
+            for item in items[-self.max_size:]:
+                try:
+                    expires = float(item['expires'])
+                    result = Result(
+                        command=str(item['command']),
+                        params=dict(item['params']),
+                        code=int(item['code']),
+                        message=str(item['message']),
+                        data=tuple(tuple(map(str, row)) for row in item['data']),
+                    )
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if expires > now:
+                    self._results[cache_key(result.command, result.params)] = \
+                        (expires, result)
+
+    def save(self) -> None:
+        """Write the cache to `path`, it's replaced atomically."""
+        if self.path is None:
+            return
+        now = time.time()
+        with self._lock:
+            items = [
+                {
+                    'expires': expires,
+                    'command': result.command,
+                    'params': {k: v for k, v in result.params.items() if k != 's'},
+                    'code': result.code,
+                    'message': result.message,
+                    'data': result.data,
+                }
+                for expires, result in self._results.values()
+                if expires > now
+            ]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(items, f, default=str)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,230 @@
+"""
+Record packets of real API sessions and replay them without network, eg. to
+benchmark the client and the CLI with real traffic patterns.
+
+Captures are gzipped JSON lines, one line for every request with its reply
+and latency. Packets are stored decoded, with password, session key and
+encryption salt redacted. Packets of encrypted sessions are decrypted with
+the client's codec, encrypted bytes are never stored, so a capture of an
+encrypted session is replayed as a plain one (``ENCRYPT`` is skipped).
+
+Example::
+
+    with Recorder('session.jsonl.gz') as recorder:
+        client = Client('example', 1, connection=Connection(recorder=recorder))
+        ...
+
+    # Same commands in the same order, replies twice as fast.
+    connection = ReplayConnection(capture_path='session.jsonl.gz',
+                                  latency_scale=0.5)
+    client = Client('example', 1, connection=connection)
+"""
+
+import collections
+import gzip
+import json
+import re
+import socket
+import threading
+import time
+import typing as t
+import zlib
+
+import attrs
+
+from .anidb import CodecPlain, Connection
+from .exceptions import ClientError, ServerError
+
+
+CAPTURE_VERSION = 2
+
+REDACTED = 'REDACTED'
+
+# Escaped `&` is part of the value, see `Client.command`.
+_SECRET_PARAMS = re.compile(r'(?<=[ &])(s|pass)=[^&]*(?:&amp;[^&]*)*')
+# Session key in the AUTH reply, salt in the ENCRYPT reply.
+_SESSION_REPLY = re.compile(r'^(20[01]|209) \S+')
+
+
+def redact(text: str) -> str:
+    """Replace password, session key and salt in a decoded packet."""
+    text = _SECRET_PARAMS.sub(rf'\1={REDACTED}', text)
+    return _SESSION_REPLY.sub(rf'\1 {REDACTED}', text)
+
+
+def _decode(data: bytes) -> t.Optional[str]:
+    """Text of a plain packet, ``None`` for an encrypted packet."""
+    if data[:2] == b'\0\0':
+        try:
+            data = zlib.decompress(data[2:])
+        except zlib.error:
+            return None
+    try:
+        return data.decode('UTF-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def _decode_with(codec: t.Optional[CodecPlain], data: bytes) -> t.Optional[str]:
+    """Text of a packet decoded by the client's codec, if it can be decoded."""
+    if codec is not None:
+        try:
+            return codec.decode(data)
+        except (ValueError, zlib.error):
+            pass
+    return _decode(data)
+
+
+def _dump_packet(key: str, text: t.Optional[str]) -> dict[str, t.Any]:
+    # Undecodable packets are not stored, they may contain the password.
+    return {key: redact(text) if text is not None else None}
+
+
+def _load_packet(key: str, exchange: dict[str, t.Any]) -> t.Optional[bytes]:
+    if exchange[key] is None:
+        return None
+    return exchange[key].encode('UTF-8')
+
+
+def _command(data: bytes) -> t.Optional[str]:
+    text = _decode(data)
+    return text.split(' ', 1)[0] if text is not None else None
+
+
+@attrs.define
+class Recorder:
+    """
+    Writes packets sent and received by a :class:`~yumemi.Connection` to the
+    capture file at `path`. Pass it as the connection's `recorder`.
+    """
+
+    path: str
+
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _file: t.TextIO = attrs.field(init=False)
+    _request: t.Optional[bytes] = attrs.field(init=False, default=None)
+    _request_codec: t.Optional[CodecPlain] = attrs.field(init=False, default=None)
+    _sent_at: float = attrs.field(init=False, default=0)
+
+    def __attrs_post_init__(self):
+        self._file = gzip.open(self.path, 'wt', encoding='UTF-8')
+        self._file.write(json.dumps({'version': CAPTURE_VERSION}) + '\n')
+
+    def __enter__(self) -> 'Recorder':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def sent(self, data: bytes, codec: t.Optional[CodecPlain] = None) -> None:
+        """Record a request, it's decoded with the `codec` it was encoded with."""
+        with self._lock:
+            if self._request is not None:
+                # Previous request was never waited for.
+                self._write(None)
+            self._request = data
+            self._request_codec = codec
+            self._sent_at = time.monotonic()
+
+    def received(self, data: t.Optional[bytes]) -> None:
+        """Record the reply, ``None`` if no reply was received."""
+        with self._lock:
+            if self._request is not None:
+                self._write(data)
+
+    def _write(self, reply: t.Optional[bytes]) -> None:
+        assert self._request is not None
+        request = _decode_with(self._request_codec, self._request)
+        exchange = {
+            'command': request.split(' ', 1)[0] if request is not None else None,
+            **_dump_packet('request', request),
+            **_dump_packet(
+                'reply',
+                _decode_with(self._request_codec, reply) if reply else None),
+            'latency': round(time.monotonic() - self._sent_at, 6),
+        }
+        self._file.write(json.dumps(exchange, ensure_ascii=False) + '\n')
+        self._request = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._request is not None:
+                self._write(None)
+            self._file.close()
+
+
+def read_capture(path: str) -> t.Iterator[dict[str, t.Any]]:
+    """Read exchanges of the capture file."""
+    with gzip.open(path, 'rt', encoding='UTF-8') as f:
+        header = json.loads(f.readline() or '{}')
+        version = header.get('version')
+        if isinstance(version, int) and version < CAPTURE_VERSION:
+            # Version 1 stored encrypted packets, they can't be replayed.
+            raise ValueError(f'{path} was recorded by an older version')
+        if version != CAPTURE_VERSION:
+            raise ValueError(f'{path} is not a capture file')
+        for line in f:
+            yield json.loads(line)
+
+
+@attrs.define
+class ReplayConnection(Connection):
+    """
+    Connection which replies with packets from a capture instead of the API.
+    Its socket is not bound and nothing is sent.
+
+    Requests must be the same commands in the same order as in the capture,
+    replies are delayed by the recorded latency multiplied by
+    `latency_scale`. Flood protection is applied the same as by
+    :class:`~yumemi.Connection`, set the delays to 0 to disable it.
+    """
+
+    capture_path: str = attrs.field(kw_only=True)
+    latency_scale: float = attrs.field(default=1, kw_only=True)
+    """Multiplier of the recorded latencies, 0 to reply immediately."""
+
+    _exchanges: collections.deque = attrs.field(init=False)
+    _pending: t.Optional[dict[str, t.Any]] = attrs.field(init=False, default=None)
+    _sent_at: float = attrs.field(init=False, default=0)
+
+    def __attrs_post_init__(self):
+        super().__attrs_post_init__()
+        # Encrypted sessions are recorded decrypted, they're replayed as plain.
+        self._exchanges = collections.deque(
+            e for e in read_capture(self.capture_path) if e['command'] != 'ENCRYPT')
+
+    def _open_socket(self) -> socket.socket:
+        # Not bound, nothing is sent through it.
+        return socket.socket(self.address_family, socket.SOCK_DGRAM)
+
+    def _resolve(self) -> tuple:
+        return (self.server_host, self.server_port)
+
+    def _sendto(self, data: bytes, address: tuple) -> None:
+        if not self._exchanges:
+            raise ServerError('No more packets in the capture')
+        exchange = self._exchanges.popleft()
+        command = _command(data)
+        if command != exchange['command']:
+            raise ClientError(
+                f'Capture expects {exchange["command"]} command, got {command}')
+        self._pending = exchange
+        self._sent_at = time.monotonic()
+
+    def _recv(self) -> bytes:
+        exchange, self._pending = self._pending, None
+        if exchange is None:
+            raise socket.timeout
+
+        delay = (exchange['latency'] * self.latency_scale
+                 - (time.monotonic() - self._sent_at))
+        if delay > 0:
+            time.sleep(delay)
+
+        reply = _load_packet('reply', exchange)
+        if reply is None:
+            raise socket.timeout
+        return reply
+
+    def start_receiver(self, handler: t.Callable[[bytes], bool]) -> None:
+        raise ClientError('Replay does not support receiving notifications')
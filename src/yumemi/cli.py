@@ -1,23 +1,50 @@
+import collections
+import contextlib
 import datetime
-import multiprocessing
+import itertools
 import os
 import re
 import string
+import threading
 import time
 from pathlib import Path
 
 import click
 
-from . import AnidbError, Client
-from . import _rhash as rhash
+from . import AnidbError, Client, hashers, trace
+from .agent import DEFAULT_PORT, Coordinator, HashAgent, parse_agent
+from .batch import mylistadd_many
+from .cache import ResultCache
+from .daemon import RemoteClient, Server, default_socket_path
+from .manifest import MANIFEST_NAME, Manifests
+from .move import move_file
+from .mylist import mylistedit_many
+from .plan import (LONG_TERM_DELAY, SHORT_TERM_DELAY, Tracker, format_duration,
+                   format_size, make_plan)
+from .prefetch import Prefetcher
+from .scan import VIDEO_EXTENSIONS, Scanner, read_paths0
+from .trace import Tracer
+from .unknown import UnknownFiles
+from .watch import Watcher
 
 
 CLIENT_NAME = 'yumemi'
 CLIENT_VERSION = 4
 
+# Number of files hashed ahead of the file being processed.
+HASH_AHEAD = 2
+# Check the session after this many seconds, AniDB logs out idle clients.
+KEEPALIVE_INTERVAL = 30 * 60
+# Write changed manifests and caches at most once per this many seconds.
+SAVE_INTERVAL = 60
+# Lookups kept in the --cache file, AniDB data of a file rarely change.
+CACHE_TTL = 30 * 24 * 60 * 60
+CACHE_SIZE = 65536
+
 # Parameters for FILE command.
 FILE_FMASK = '78380000'
 FILE_AMASK = '30E0F0C0'
+FILE_PARAMS = {'fmask': FILE_FMASK, 'amask': FILE_AMASK}
 # Data keys in FILE command response.
 FILE_KEYS = [
     'fid', 'aid', 'eid', 'gid', 'lid', 'md5', 'sha1', 'crc32', 'ayear', 'atype',
@@ -71,6 +98,20 @@ class DateTime(click.ParamType):
             self.fail(f"format must be '{self.format}'")
 
 
+class ByteSize(click.ParamType):
+    name = 'size'
+
+    UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            return value
+        match = re.fullmatch(r'(\d+)\s*([KMGT]?)i?B?', value.strip(), re.IGNORECASE)
+        if not match:
+            self.fail('size must be a number with optional K, M, G or T suffix')
+        return int(match[1]) * self.UNITS[match[2].upper()]
+
+
 class TemplateString(click.ParamType):
     name = 'template'
 
@@ -88,6 +129,14 @@ class TemplateString(click.ParamType):
             self.fail(f'Template is not valid, {e}')
 
 
+def parse_agent_option(value):
+    """Click type for ``DIR=HOST[:PORT]`` agent options."""
+    try:
+        return parse_agent(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
 def sanitize_filename(filename):
     filename = filename.replace('/', '-')
     filename = re.sub(r'\s+', ' ', filename).strip()
@@ -97,21 +146,569 @@ def sanitize_filename(filename):
     return filename
 
 
-def safe_rename(old, new):
-    if new.exists():
-        raise FileExistsError(f'file "{new!s}" exists')
-    os.rename(old, new)
+def safe_rename(old, new, ed2k=None):
+    """
+    Move the file without overwriting, also to another file system. Returns
+    how the file was moved, see :func:`~yumemi.move.move_file`.
+    """
+    try:
+        return move_file(str(old), str(new), ed2k=ed2k)
+    except FileExistsError:
+        raise FileExistsError(f'file "{new!s}" exists') from None
+
+
+def file_command_params(file_ed2k, file_size):
+    """Parameters of FILE command for renaming."""
+    return {
+        'ed2k': file_ed2k,
+        'size': file_size,
+        **FILE_PARAMS,
+    }
 
 
-def mylistadd_file_params(file):
+def mylistadd_file_params(file, ed2k=None):
+    """Path, ED2K hash and size of the file, hashed only if `ed2k` is unknown."""
     return (
         file,
-        rhash.hash_file(file, rhash.ED2K),
+        ed2k or hashers.hash_file(file),
         os.path.getsize(file),
     )
 
 
-@click.command(
+class DefaultGroup(click.Group):
+    """
+    Group that invokes the default command when the first argument is not a
+    name of a subcommand, so ``yumemi [OPTIONS] FILES...`` keeps working.
+    """
+
+    def __init__(self, *args, default_command, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx, args):
+        group_opts = {
+            opt
+            for param in self.get_params(ctx)
+            for opt in (*param.opts, *param.secondary_opts)
+        }
+        if not args or (args[0] not in self.commands and args[0] not in group_opts):
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+
+def client_options(f):
+    """Options for logging in to AniDB, shared by commands that need a session."""
+    options = [
+        click.option(
+            '-u', '--username',
+        ),
+        click.option(
+            '-p', '--password',
+        ),
+        click.option(
+            '--encrypt',
+            default=None,
+            help='Ecrypt connection. Parameter value is API Key.',
+        ),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+def mylistadd_options(f):
+    """Options that control what is done with the files."""
+    options = [
+        click.option(
+            '-w', '--watched',
+            is_flag=True,
+            default=False,
+            help='Mark files as watched.',
+        ),
+        click.option(
+            '-W', '--watched-date',
+            type=DateTime('%Y-%m-%d'),
+            default=None,
+            metavar='YYYY-MM-DD',
+            help='Mark files as watched and set watched date to the specified value.',
+        ),
+        click.option(
+            '-d', '--deleted',
+            is_flag=True,
+            default=False,
+            help='Set file state to deleted.',
+        ),
+        click.option(
+            '-e', '--edit',
+            is_flag=True,
+            default=False,
+            help='Edit watched state and date of files that are already in mylist.',
+        ),
+        click.option(
+            '-r', '--rename',
+            is_flag=True,
+            default=False,
+            help='Rename files.',
+        ),
+        click.option(
+            '-R', '--rename-format',
+            type=TemplateString(FILE_KEYS),
+            default='$aname - $epno',
+            show_default=True,
+            help=('Format for renaming files. Template vars: '
+                  + ', '.join(f'${i}' for i in FILE_KEYS)),
+        ),
+        click.option(
+            '--library-root',
+            type=click.Path(exists=True, file_okay=False),
+            default=None,
+            help=('Move renamed files to the directory, it may be on another '
+                  'file system.'),
+        ),
+        click.option(
+            '--verify-copy',
+            is_flag=True,
+            default=False,
+            help=('Hash files copied to another file system before the '
+                  'original is removed.'),
+        ),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+prefetch_option = click.option(
+    '--prefetch',
+    is_flag=True,
+    default=False,
+    help=('With --rename, look up files with hashes from manifests or hash '
+          'agents while other files are hashed.'),
+)
+
+
+manifest_option = click.option(
+    '--manifest',
+    is_flag=True,
+    default=False,
+    help=(f'Use hashes from {MANIFEST_NAME} manifests of unchanged files and '
+          'record hashes of other files to the manifests.'),
+)
+
+
+cache_option = click.option(
+    '--cache',
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help=('Keep results of FILE lookups in the file, files looked up before '
+          'are not looked up again.'),
+)
+
+
+def unknown_options(f):
+    """Options for skipping files which AniDB doesn't know."""
+    options = [
+        click.option(
+            '--unknown-files',
+            type=click.Path(dir_okay=False, writable=True),
+            default=None,
+            help=('Remember files unknown to AniDB in the file and skip them '
+                  'for 1 hour, then 1 day, then a week. With --manifest, '
+                  'skipped files are not hashed either.'),
+        ),
+        click.option(
+            '--recheck',
+            is_flag=True,
+            default=False,
+            help='Check also files remembered as unknown to AniDB.',
+        ),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+
+
+def open_cache(client, path):
+    """Give the client a cache kept in `path`, returns it or ``None``."""
+    # Daemon's client has no cache, it's sent as any other command.
+    if path is None or not isinstance(client, Client):
+        return None
+    client.cache = ResultCache(ttl=CACHE_TTL, max_size=CACHE_SIZE, path=path)
+    return client.cache
+
+
+trace_option = click.option(
+    '--trace', 'trace_path',
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help=('Write timeline of the processing as Chrome trace JSON, it can be '
+          'opened in Perfetto.'),
+)
+
+
+@contextlib.contextmanager
+def open_tracer(path):
+    """Tracer writing to `path` at the end, or ``None`` without path."""
+    if path is None:
+        yield None
+        return
+
+    tracer = Tracer()
+    try:
+        yield tracer
+    finally:
+        with open(path, 'w') as f:
+            tracer.dump(f)
+
+
+remote_option = click.option(
+    '-S', '--socket', 'socket_path',
+    type=click.Path(dir_okay=False),
+    default=None,
+    help=('Send commands through yumemi daemon listening on the socket '
+          'instead of logging in (see serve command).'),
+)
+
+
+def ask_credentials(username, password):
+    """Prompt for username and password if they were not given."""
+    if username is None:
+        username = click.prompt('Username')
+    if password is None:
+        password = click.prompt('Password', hide_input=True)
+    return username, password
+
+
+def auth(client, username, password, encrypt):
+    if encrypt:
+        client.encrypt(username, encrypt)
+    client.auth(username, password)
+
+
+def login(username, password, encrypt, tracer=None):
+    """Create a client and log in."""
+    client = Client(CLIENT_NAME, CLIENT_VERSION, tracer=tracer)
+    try:
+        auth(client, username, password, encrypt)
+    except AnidbError as e:
+        msg = str(e)
+        if e.result and e.result.code in {503, 504}:
+            msg = 'Client version is no longer supported, please update.'
+        click.secho(msg, fg='red', err=True)
+        raise click.Abort
+
+    return client
+
+
+@contextlib.contextmanager
+def open_client(username, password, encrypt, socket_path, keepalive=False,
+                tracer=None):
+    """
+    Log in or connect to the daemon if `socket_path` is given, and logout at
+    the end. With `keepalive`, the session is periodically checked and
+    renewed, for commands that run for a long time.
+    """
+    if socket_path:
+        remote_client = RemoteClient(socket_path)
+        try:
+            yield remote_client
+        finally:
+            remote_client.close()
+        return
+
+    username, password = ask_credentials(username, password)
+    client = login(username, password, encrypt, tracer)
+
+    stop = threading.Event()
+    if keepalive:
+        def keep_session():
+            while not stop.wait(KEEPALIVE_INTERVAL):
+                try:
+                    if client.check_session():
+                        continue
+                except AnidbError:
+                    pass
+                try:
+                    auth(client, username, password, encrypt)
+                except AnidbError as e:
+                    click.secho(f'Session renewal failed, {e!s}', fg='red', err=True)
+
+        threading.Thread(target=keep_session, daemon=True).start()
+
+    try:
+        yield client
+    finally:
+        stop.set()
+        client.logout()
+
+
+def report_file(result, *, rename, rename_format, library_root=None,
+                verify_copy=False, tracer=None):
+    """
+    Show the result of one file from :func:`~yumemi.batch.mylistadd_many`
+    and optionally rename the file, into `library_root` if given. Returns the
+    new path of the file.
+    """
+    file = result.path
+    click.secho(file, bold=True)
+    if result.ed2k is not None:
+        click.echo(f'  - ed2k={result.ed2k} size={result.size}')
+
+    if result.mylistadd is None:
+        if result.error is not None:
+            click.secho(f'  - failed, {result.error!s}', fg='red')
+        else:
+            click.echo(f'  - unknown to AniDB, next check after '
+                       f'{format_time(result.next_check)}')
+        return file
+
+    click.echo(f'  - {result.mylistadd.message.lower()}')
+    if result.next_check is not None:
+        click.echo(f'  - next check after {format_time(result.next_check)}')
+    if result.error is not None:
+        click.secho(f'  - failed, {result.error!s}', fg='red')
+        return file
+
+    if not rename or result.file is None:
+        return file
+
+    if result.file.code != 220:
+        click.echo(f'  - {result.file.message.lower()}')
+        return file
+
+    file_vars = dict(zip(FILE_KEYS, result.file.data[0]))
+    if result.mylistadd.code in {210, 310} and result.mylistadd.data:
+        # Mylist fields of cached FILE results are empty, and the result may
+        # be from before the file was added.
+        file_vars['lid'] = result.mylistadd.data[0][0]
+
+    file_path_old = Path(file)
+    directory = Path(library_root) if library_root else file_path_old.parent
+    file_path_new = directory / sanitize_filename(
+        rename_format.substitute(file_vars) + file_path_old.suffix
+    )
+
+    try:
+        with trace.span(tracer, 'rename', 'pipeline'):
+            method = safe_rename(file_path_old, file_path_new,
+                                 result.ed2k if verify_copy else None)
+        if method == 'rename':
+            click.echo(f'  - renamed to "{file_path_new!s}"')
+        else:
+            click.echo(f'  - moved to "{file_path_new!s}" ({method})')
+        return str(file_path_new)
+    except Exception as e:
+        click.echo(f'  - failed to rename, {e!s}')
+        return file
+
+
+def update_manifest(manifests, file, new_file, file_ed2k, file_size):
+    """Record hash of the file, under its new name if it was renamed."""
+    try:
+        st = os.stat(new_file)
+    except OSError:
+        return
+    if st.st_size != file_size:
+        # Changed since it was hashed.
+        return
+    if new_file != file:
+        manifests.remove(file)
+    manifests.update(new_file, file_ed2k, st)
+
+
+def echo_plan(plan):
+    """Show the plan with estimates for both flood protection policies."""
+    click.echo(f'Files:   {len(plan.files)} ({format_size(plan.size)})')
+    click.echo(
+        f'Hashing: {len(plan.hash_files)} files ({format_size(plan.hash_size)}), '
+        f'{format_duration(plan.hash_time())} at {format_size(plan.hash_rate)}/s'
+    )
+    file_packets = 'MYLISTADD and FILE' if plan.file_commands else 'MYLISTADD'
+    click.echo(f'Packets: {plan.packets} ({file_packets} per file, AUTH, LOGOUT)')
+    if plan.skip_files:
+        click.echo(f'Skipped: {len(plan.skip_files)} files unknown to AniDB')
+    if plan.cached_files:
+        click.echo(f'Cached:  {len(plan.cached_files)} FILE results')
+    for policy, delay in [('short', SHORT_TERM_DELAY), ('long', LONG_TERM_DELAY)]:
+        click.echo(
+            f'ETA:     {format_duration(plan.eta(delay))} '
+            f'({policy} term policy, {delay:g} s per packet)'
+        )
+
+
+def make_mylistadd_params(watched, watched_date, deleted, edit):
+    """MYLISTADD parameters from the mylistadd options."""
+    if watched_date is not None:
+        watched = True
+    elif watched:
+        watched_date = datetime.datetime.now()
+
+    return {
+        'state': 3 if deleted else 1,  # 1 = internal storage (hdd)
+        'viewed': watched,
+        'viewdate': int(watched_date.timestamp()) if watched_date else 0,
+        'edit': edit,
+    }
+
+
+def add_hashed_file(username, password, encrypt, socket_path, file,
+                    file_ed2k, file_size, *, manifest, watched, watched_date,
+                    deleted, edit, rename, rename_format, library_root,
+                    verify_copy):
+    """
+    Log in and add one already hashed file, for commands which hash files
+    before there's anything to send.
+    """
+    try:
+        with open_client(username, password, encrypt, socket_path) as client:
+            result = next(mylistadd_many(
+                client, [file],
+                make_mylistadd_params(watched, watched_date, deleted, edit),
+                file_params=FILE_PARAMS if rename else None,
+                hasher=lambda path: (file_ed2k, file_size),
+            ))
+            new_file = report_file(
+                result, rename=rename, rename_format=rename_format,
+                library_root=library_root, verify_copy=verify_copy,
+            )
+    except AnidbError as e:
+        click.secho(str(e), fg='red', err=True)
+        click.get_current_context().exit(1)
+
+    if result.error is not None:
+        click.get_current_context().exit(1)
+
+    if manifest:
+        manifests = Manifests()
+        update_manifest(manifests, file, new_file, file_ed2k, file_size)
+        manifests.save()
+
+
+def process_files(client, files, *, watched, watched_date, deleted, edit,
+                  rename, rename_format, library_root=None, verify_copy=False,
+                  prefetch=False, manifest=False, cache=None, unknown_files=None,
+                  recheck=False, coordinator=None, tracker=None, tracer=None):
+    """
+    Add files to mylist and optionally rename them. With `manifest`, hashes
+    are taken from and recorded to ED2K manifests, lookups are kept in the
+    `cache` file if given. Files not in manifests are hashed by the
+    `coordinator`'s agents if they have them. With `prefetch`, files with
+    known hashes are looked up in idle slots of the flood protection.
+    Files recorded as unknown to AniDB in the `unknown_files` file are not
+    sent until it's time to check them again, or with `recheck`. Progress is
+    shown if a `tracker` of the planned files is given.
+
+    Files are hashed and sent by :func:`~yumemi.batch.mylistadd_many`, the
+    results are reported and the files renamed here.
+    """
+    manifests = Manifests() if manifest else None
+    saved_at = time.monotonic()
+
+    result_cache = open_cache(client, cache)
+    unknown = UnknownFiles(unknown_files) if unknown_files else None
+
+    def save():
+        # Watch is usually stopped by a signal, state is saved periodically.
+        if manifests is not None:
+            manifests.save()
+        if result_cache is not None:
+            result_cache.save()
+        if unknown is not None:
+            unknown.save()
+
+    prefetcher = None
+    # Daemon's client has no cache, it's sent as any other command.
+    if prefetch and rename and isinstance(client, Client):
+        if client.cache is None:
+            client.cache = ResultCache()
+        prefetcher = Prefetcher(client)
+
+    # Hashes from manifests and agents, for files which are not hashed.
+    known = {}
+
+    def known_ed2k(file):
+        if manifests is None:
+            return None
+        try:
+            return manifests.lookup(file)
+        except OSError:
+            return None
+
+    def feed():
+        files_ed2k = ((file, known_ed2k(file)) for file in files)
+        if coordinator is not None:
+            files_ed2k = coordinator.hashes(files_ed2k)
+        for file, ed2k in files_ed2k:
+            if ed2k:
+                known[file] = ed2k
+            if prefetcher is not None and ed2k:
+                with contextlib.suppress(OSError):
+                    size = os.path.getsize(file)
+                    if (unknown is None or recheck
+                            or unknown.should_check(ed2k, size)):
+                        prefetcher.prefetch(
+                            'FILE', file_command_params(ed2k, size))
+            yield file
+
+    def hash_file(file):
+        with trace.span(tracer, 'hash', 'pipeline', file=file):
+            _, ed2k, size = mylistadd_file_params(file, known.pop(file, None))
+        return ed2k, size
+
+    results = mylistadd_many(
+        client,
+        feed(),
+        make_mylistadd_params(watched, watched_date, deleted, edit),
+        file_params=FILE_PARAMS if rename else None,
+        workers=1,
+        window=HASH_AHEAD,
+        hasher=hash_file,
+        unknown_files=unknown,
+        recheck=recheck,
+    )
+    try:
+        while True:
+            with trace.span(tracer, 'file', 'pipeline') as span_args:
+                result = next(results, None)
+                if result is None:
+                    break
+                span_args['path'] = result.path
+                new_file = report_file(
+                    result, rename=rename, rename_format=rename_format,
+                    library_root=library_root, verify_copy=verify_copy,
+                    tracer=tracer,
+                )
+
+            if tracker is not None:
+                tracker.done(result.path, result.size or 0)
+                click.echo(f'  - {tracker.status()}')
+
+            if manifests is not None and result.ed2k is not None:
+                update_manifest(manifests, result.path, new_file, result.ed2k,
+                                result.size)
+            if time.monotonic() - saved_at > SAVE_INTERVAL:
+                save()
+                saved_at = time.monotonic()
+
+    except AnidbError as e:
+        click.secho(str(e), fg='red', err=True)
+    finally:
+        results.close()
+        if prefetcher is not None:
+            prefetcher.close()
+        save()
+        # Watcher never ends on its own, stop its thread.
+        if isinstance(files, Watcher):
+            files.close()
+
+
+@click.group(
+    cls=DefaultGroup,
+    default_command='add',
     context_settings=dict(
         help_option_names=['-h', '--help'],
         auto_envvar_prefix='YUMEMI',
@@ -126,20 +723,332 @@ def mylistadd_file_params(file):
     expose_value=False,
     help='Test connection to AniDB API server.',
 )
+def main():
+    """
+    AniDB client for adding files to mylist.
+
+    When no command is given, the add command is used.
+    """
+
+
+@main.command(
+    context_settings=dict(auto_envvar_prefix='YUMEMI'),
+)
+@client_options
+@mylistadd_options
+@prefetch_option
+@unknown_options
+@manifest_option
+@cache_option
+@remote_option
+@trace_option
 @click.option(
-    '-u', '--username',
-    prompt=True,
+    '--recursive',
+    is_flag=True,
+    default=False,
+    help='Add files from directories and their subdirectories.',
+)
+@click.option(
+    '--ext', 'extensions',
+    multiple=True,
+    metavar='EXT',
+    help=('Extension of files added from directories, may be repeated. '
+          '[default: common video extensions]'),
+)
+@click.option(
+    '--min-size',
+    type=ByteSize(),
+    default='0',
+    help='Skip smaller files in directories, eg. 50M.',
 )
 @click.option(
-    '-p', '--password',
-    prompt=True,
-    hide_input=True,
+    '--agent', 'agents',
+    type=parse_agent_option,
+    multiple=True,
+    metavar='DIR=HOST[:PORT]',
+    help=('Hash files under the directory by hash-agent running on the host, '
+          'may be repeated.'),
 )
 @click.option(
-    '--encrypt',
+    '--plan',
+    is_flag=True,
+    default=False,
+    help=('Only show how many bytes must be hashed and packets sent, and how '
+          'long it takes.'),
+)
+@click.option(
+    '--progress',
+    is_flag=True,
+    default=False,
+    help=('Show throughput and remaining time after each file. All files are '
+          'checked before the first one is added.'),
+)
+@click.option(
+    '--hash-rate',
+    type=ByteSize(),
     default=None,
-    help='Ecrypt connection. Parameter value is API Key.',
+    help='Hashing speed per second for --plan and --progress, eg. 200M. '
+         '[default: measured]',
+)
+@click.option(
+    '--files0-from',
+    type=click.File('rb'),
+    default=None,
+    help='Add files with null-delimited paths read from the file, - for stdin.',
+)
+@click.argument(
+    'files',
+    nargs=-1,
+    type=click.Path(),
+)
+def add(username, password, encrypt, socket_path, trace_path, recursive,
+        extensions, min_size, agents, plan, progress, hash_rate, files0_from,
+        files, **options):
+    """
+    Add files to mylist.
+
+    Paths are read and checked lazily, files are processed while directories
+    are still being scanned. A file with several hardlinks is added once.
+    """
+    if not files and files0_from is None:
+        raise click.UsageError("Missing argument 'FILES...'.")
+
+    paths = itertools.chain(files, read_paths0(files0_from) if files0_from else ())
+
+    def onerror(path, e):
+        click.secho(f'{path}: {e!s}', fg='red', err=True)
+
+    scanner = Scanner(
+        recursive=recursive,
+        extensions=(
+            frozenset('.' + ext.lower().lstrip('.') for ext in extensions)
+            or VIDEO_EXTENSIONS
+        ),
+        min_size=min_size,
+        onerror=onerror,
+    )
+
+    files = scanner.scan(paths)
+    tracker = None
+    if plan or progress:
+        plan_cache = None
+        # Daemon's client has no cache.
+        if options['cache'] and socket_path is None:
+            plan_cache = ResultCache(ttl=CACHE_TTL, max_size=CACHE_SIZE,
+                                     path=options['cache'])
+        plan_unknown = None
+        if options['unknown_files'] and not options['recheck']:
+            plan_unknown = UnknownFiles(options['unknown_files'])
+        files_plan = make_plan(
+            files,
+            manifests=Manifests() if options['manifest'] else None,
+            file_commands=options['rename'],
+            file_params=FILE_PARAMS,
+            cache=plan_cache,
+            unknown_files=plan_unknown,
+            hash_rate=hash_rate,
+            onerror=onerror,
+        )
+        if plan:
+            echo_plan(files_plan)
+            return
+        files = (f.path for f in files_plan.files)
+        tracker = Tracker(files_plan)
+
+    coordinator = None
+    if agents:
+        coordinator = Coordinator(
+            dict(agents),
+            onerror=lambda path, e: click.secho(
+                f'{path}: agent failed, hashing locally, {e!s}', fg='yellow',
+                err=True),
+        )
+
+    try:
+        with open_tracer(trace_path) as tracer, \
+             open_client(username, password, encrypt, socket_path,
+                         tracer=tracer) as client:
+            process_files(client, files, coordinator=coordinator,
+                          tracker=tracker, tracer=tracer, **options)
+    finally:
+        if coordinator is not None:
+            coordinator.close()
+
+
+@main.command(
+    context_settings=dict(auto_envvar_prefix='YUMEMI'),
+)
+@client_options
+@mylistadd_options
+@prefetch_option
+@unknown_options
+@manifest_option
+@cache_option
+@remote_option
+@trace_option
+@click.option(
+    '--settle',
+    type=click.FloatRange(min=0),
+    default=5,
+    show_default=True,
+    help='Seconds a file must stay unchanged before it is processed.',
 )
+@click.option(
+    '--queue-size',
+    type=click.IntRange(min=1),
+    default=16,
+    show_default=True,
+    help='Maximum number of complete files waiting to be processed.',
+)
+@click.option(
+    '--poll',
+    is_flag=True,
+    default=False,
+    help='Scan the directory periodically instead of using inotify.',
+)
+@click.argument(
+    'directory',
+    type=click.Path(exists=True, file_okay=False),
+)
+def watch(username, password, encrypt, socket_path, trace_path, settle,
+          queue_size, poll, directory, **options):
+    """
+    Watch directory and add new files to mylist.
+
+    Files are processed when they are written and closed, or moved into the
+    directory, and did not change for a few seconds.
+    """
+    watcher = Watcher(directory, settle=settle, queue_size=queue_size, poll=poll)
+    watcher.start()
+
+    with open_tracer(trace_path) as tracer, \
+         open_client(username, password, encrypt, socket_path,
+                     keepalive=True, tracer=tracer) as client:
+        try:
+            process_files(client, watcher, tracer=tracer, **options)
+        except KeyboardInterrupt:
+            pass
+
+
+@main.command(
+    context_settings=dict(auto_envvar_prefix='YUMEMI'),
+)
+@client_options
+@mylistadd_options
+@manifest_option
+@remote_option
+@click.option(
+    '--size',
+    type=click.IntRange(min=0),
+    default=None,
+    help=('Declared size of the file in bytes, the file is not added if the '
+          'stream is shorter or longer.'),
+)
+@click.option(
+    '-i', '--input', 'input_file',
+    type=click.File('rb'),
+    default='-',
+    help='Read the file from a pipe or a file instead of stdin.',
+)
+@click.argument(
+    'path',
+    type=click.Path(dir_okay=False, writable=True),
+)
+def stream(username, password, encrypt, socket_path, size, input_file, path,
+           **options):
+    """
+    Save file read from stdin to PATH and add it to mylist.
+
+    The file is hashed while it's written, eg. when it's piped from
+    a downloader, so it's identified without reading it again.
+    """
+    try:
+        with open(path, 'xb') as f:
+            file_ed2k, file_size = hashers.hash_stream(input_file, tee=f)
+    except OSError as e:
+        raise click.FileError(path, e.strerror)
+
+    if size is not None and file_size != size:
+        click.secho(f'{path}: read {file_size} bytes, expected {size}',
+                    fg='red', err=True)
+        click.get_current_context().exit(1)
+
+    add_hashed_file(username, password, encrypt, socket_path, path, file_ed2k,
+                    file_size, **options)
+
+
+@main.command(
+    context_settings=dict(auto_envvar_prefix='YUMEMI'),
+)
+@client_options
+@mylistadd_options
+@manifest_option
+@remote_option
+@click.option(
+    '--size',
+    type=click.IntRange(min=0),
+    required=True,
+    help='Final size of the file in bytes.',
+)
+@click.option(
+    '--state', 'state_path',
+    type=click.Path(dir_okay=False),
+    default=None,
+    help=('File to save hashing progress to, hashing continues from it after '
+          'a restart. [default: hidden file next to the file]'),
+)
+@click.option(
+    '--timeout',
+    type=click.FloatRange(min=0),
+    default=None,
+    help='Give up when no data is written for this many seconds.',
+)
+@click.argument(
+    'path',
+    type=click.Path(dir_okay=False),
+)
+def follow(username, password, encrypt, socket_path, size, state_path,
+           timeout, path, **options):
+    """
+    Hash a file while it's downloaded and add it to mylist when complete.
+
+    Data is hashed as it's written, the file is added right after the last
+    byte. Files downloaded out of order must be sparse, only data before the
+    first hole is hashed. Preallocated files, and files on file systems
+    which can't report holes, are hashed when they are complete.
+
+    Downloaders which write to a temporary name and rename the file at the
+    end can't be followed, use the watch command for them.
+    """
+    # Imported here, it requires LibRHash unlike other commands.
+    from .follow import FollowHasher, default_state_path
+
+    hasher = FollowHasher(
+        path,
+        size,
+        state_path=state_path or default_state_path(path),
+        onwarning=lambda msg: click.secho(f'{path}: {msg}', fg='yellow', err=True),
+    )
+    try:
+        file_ed2k = hasher.follow(timeout=timeout)
+    except KeyboardInterrupt:
+        click.echo(f'{path}: stopped at {hasher.offset} bytes', err=True)
+        raise click.Abort
+    except (OSError, ValueError) as e:
+        click.secho(f'{path}: {e!s}', fg='red', err=True)
+        click.get_current_context().exit(1)
+
+    add_hashed_file(username, password, encrypt, socket_path, path, file_ed2k,
+                    size, **options)
+
+
+@main.command(
+    context_settings=dict(auto_envvar_prefix='YUMEMI'),
+)
+@client_options
+@manifest_option
+@cache_option
+@remote_option
 @click.option(
     '-w', '--watched',
     is_flag=True,
@@ -153,6 +1062,12 @@ def mylistadd_file_params(file):
     metavar='YYYY-MM-DD',
     help='Mark files as watched and set watched date to the specified value.',
 )
+@click.option(
+    '--unwatched',
+    is_flag=True,
+    default=False,
+    help='Mark files as not watched.',
+)
 @click.option(
     '-d', '--deleted',
     is_flag=True,
@@ -160,104 +1075,233 @@ def mylistadd_file_params(file):
     help='Set file state to deleted.',
 )
 @click.option(
-    '-e', '--edit',
+    '--recursive',
     is_flag=True,
     default=False,
-    help='Edit watched state and date of files that are already in mylist.',
+    help='Edit files from directories and their subdirectories.',
+)
+@click.argument(
+    'files',
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True),
+)
+def edit(username, password, encrypt, socket_path, manifest, cache, watched,
+         watched_date, unwatched, deleted, recursive, files):
+    """
+    Change state of files which are already in mylist.
+
+    Files are grouped by anime and group, and the episodes of each group are
+    edited with as few commands as possible, eg. a whole season with one.
+    Other files of the episodes from the same group are edited too. With
+    --manifest and --cache, files hashed and looked up before are neither
+    hashed nor looked up again.
+    """
+    if (watched or watched_date is not None) and unwatched:
+        raise click.UsageError('--unwatched conflicts with --watched.')
+
+    params = {}
+    if watched or watched_date is not None:
+        params = make_mylistadd_params(True, watched_date, False, True)
+        del params['state'], params['edit']
+    elif unwatched:
+        params = {'viewed': False}
+    if deleted:
+        params['state'] = 3
+    if not params:
+        raise click.UsageError('Nothing to change, use -w, -W, --unwatched or -d.')
+
+    manifests = Manifests() if manifest else None
+    scanner = Scanner(
+        recursive=recursive,
+        onerror=lambda path, e: click.secho(f'{path}: {e!s}', fg='red', err=True),
+    )
+    paths = collections.defaultdict(list)
+    for file in scanner.scan(files):
+        file_ed2k = None
+        if manifests is not None:
+            with contextlib.suppress(OSError):
+                file_ed2k = manifests.lookup(file)
+        if file_ed2k is None:
+            click.echo(f'Hashing {file}', err=True)
+        file, file_ed2k, file_size = mylistadd_file_params(file, file_ed2k)
+        if manifests is not None:
+            update_manifest(manifests, file, file, file_ed2k, file_size)
+        paths[file_ed2k, file_size].append(file)
+    if manifests is not None:
+        manifests.save()
+
+    try:
+        with open_client(username, password, encrypt, socket_path) as client:
+            result_cache = open_cache(client, cache)
+            try:
+                for mylist_edit, result in mylistedit_many(
+                        client, paths, params,
+                        file_params={'fmask': FILE_FMASK, 'amask': FILE_AMASK}):
+                    click.secho(
+                        ' '.join(f'{k}={v}' for k, v in mylist_edit.params.items()),
+                        bold=True,
+                    )
+                    for key in mylist_edit.files:
+                        for file in paths[key]:
+                            click.echo(f'  - {file}')
+                    click.echo(f'  - {result.message.lower()}')
+            finally:
+                if result_cache is not None:
+                    result_cache.save()
+    except AnidbError as e:
+        click.secho(str(e), fg='red', err=True)
+        click.get_current_context().exit(1)
+
+
+@main.command(
+    context_settings=dict(auto_envvar_prefix='YUMEMI'),
 )
 @click.option(
-    '-r', '--rename',
+    '--recursive',
     is_flag=True,
     default=False,
-    help='Rename files.',
+    help='Verify also manifests in subdirectories.',
 )
 @click.option(
-    '-R', '--rename-format',
-    type=TemplateString(FILE_KEYS),
-    default='$aname - $epno',
-    show_default=True,
-    help=('Format for renaming files. Template vars: '
-          + ', '.join(f'${i}' for i in FILE_KEYS)),
+    '--full',
+    is_flag=True,
+    default=False,
+    help='Rehash all files, not only files changed since they were hashed.',
 )
 @click.argument(
-    'files',
+    'directories',
     nargs=-1,
     required=True,
-    type=click.Path(exists=True, dir_okay=False),
+    type=click.Path(exists=True, file_okay=False),
 )
-def main(username, password, watched, watched_date, deleted, edit, encrypt,
-         rename, rename_format, files):
-    """AniDB client for adding files to mylist."""
-    if watched_date is not None:
-        watched = True
-    elif watched:
-        watched_date = datetime.datetime.now()
+def verify(recursive, full, directories):
+    """
+    Verify files against ED2K manifests.
 
-    client = Client(CLIENT_NAME, CLIENT_VERSION)
-    try:
-        if encrypt:
-            client.encrypt(username, encrypt)
-        client.auth(username, password)
-    except AnidbError as e:
-        msg = str(e)
-        if e.result and e.result.code in {503, 504}:
-            msg = 'Client version is no longer supported, please update.'
-        click.secho(msg, fg='red', err=True)
-        raise click.Abort
+    Only files whose size or modification time changed since they were
+    hashed are read again (all files with --full). Manifest entries of files
+    which still match are updated. Exits with status 1 if any file is
+    missing or does not match.
+    """
+    manifests = Manifests()
+    ok = failed = 0
 
-    mp_pool = multiprocessing.Pool(1)
+    def walk():
+        for directory in directories:
+            if recursive:
+                for dirpath, dirnames, filenames in os.walk(directory):
+                    dirnames.sort()
+                    if MANIFEST_NAME in filenames:
+                        yield dirpath
+            elif os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+                yield directory
 
-    try:
-        files_params = mp_pool.imap(mylistadd_file_params, files)
-        for file, file_ed2k, file_size in files_params:
-            click.secho(file, bold=True)
-            click.echo(f'  - ed2k={file_ed2k} size={file_size}')
-
-            mylistadd_result = client.command('MYLISTADD', {
-                'ed2k': file_ed2k,
-                'size': file_size,
-                'state': 3 if deleted else 1,  # 1 = internal storage (hdd)
-                'viewed': watched,
-                'viewdate': int(watched_date.timestamp()) if watched_date else 0,
-                'edit': edit,
-            })
-
-            click.echo(f'  - {mylistadd_result.message.lower()}')
-
-            if not rename or mylistadd_result.code == 320:
+    for directory in walk():
+        for entry in sorted(manifests.entries(directory), key=lambda e: e.name):
+            path = os.path.join(directory, entry.name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                click.secho(f'{path}: missing', fg='red')
+                failed += 1
                 continue
 
-            file_result = client.command('FILE', {
-                'ed2k': file_ed2k,
-                'size': file_size,
-                'fmask': FILE_FMASK,
-                'amask': FILE_AMASK,
-            })
-
-            if file_result.code != 220:
-                click.echo(f'  - {file_result.message.lower()}')
+            if not full and entry.matches(st):
+                ok += 1
                 continue
 
-            file_vars = dict(zip(FILE_KEYS, file_result.data[0]))
+            ed2k = hashers.hash_file(path)
+            if ed2k == entry.ed2k:
+                manifests.update(path, ed2k, st)
+                click.echo(f'{path}: ok')
+                ok += 1
+            else:
+                click.secho(f'{path}: changed', fg='red')
+                failed += 1
 
-            file_path_old = Path(file)
-            file_path_new = file_path_old.parent / sanitize_filename(
-                rename_format.substitute(file_vars) + file_path_old.suffix
-            )
+    manifests.save()
+    click.echo(f'{ok} files ok, {failed} failed', err=True)
+    if failed:
+        click.get_current_context().exit(1)
 
-            try:
-                safe_rename(file_path_old, file_path_new)
-                click.echo(f'  - renamed to "{file_path_new!s}"')
-            except Exception as e:
-                click.echo(f'  - failed to rename, {e!s}')
 
-    except AnidbError as e:
-        click.secho(str(e), fg='red', err=True)
+@main.command(
+    'hash-agent',
+    context_settings=dict(auto_envvar_prefix='YUMEMI'),
+)
+@click.option(
+    '--host',
+    default='127.0.0.1',
+    show_default=True,
+    help='Address to listen on, eg. 0.0.0.0 for all interfaces.',
+)
+@click.option(
+    '--port',
+    type=click.IntRange(min=0, max=65535),
+    default=DEFAULT_PORT,
+    show_default=True,
+    help='Port to listen on.',
+)
+@click.argument(
+    'root',
+    type=click.Path(exists=True, file_okay=False),
+)
+def hash_agent(host, port, root):
+    """
+    Hash files under ROOT for yumemi running on other machines.
+
+    Run it where the files are stored and pass --agent to the add command,
+    files are then hashed locally instead of read over the network. There
+    is no authentication, listen only on a trusted network.
+    """
+    agent = HashAgent(root, host, port)
+    agent.listen()
+    click.echo(f'Listening on {agent.host}:{agent.port}', err=True)
+
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.close()
 
-    mp_pool.close()
-    mp_pool.join()
 
-    client.logout()
+@main.command(
+    context_settings=dict(auto_envvar_prefix='YUMEMI'),
+)
+@client_options
+@click.option(
+    '-S', '--socket', 'socket_path',
+    type=click.Path(dir_okay=False),
+    default=default_socket_path,
+    show_default='$XDG_RUNTIME_DIR/yumemi.sock',
+    help='Path of the Unix socket to listen on.',
+)
+def serve(username, password, encrypt, socket_path):
+    """
+    Run daemon sharing one AniDB session.
+
+    Other yumemi processes (add --socket) and programs using RemoteClient
+    send commands through the daemon, so they share one login and one flood
+    protection instead of each logging in on its own.
+    """
+    username, password = ask_credentials(username, password)
+    client = login(username, password, encrypt)
+
+    def relogin(client):
+        auth(client, username, password, encrypt)
+
+    server = Server(client, socket_path, login=relogin)
+    click.echo(f'Listening on {socket_path}', err=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        client.logout()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,355 @@
+import collections
+import json
+import os
+import socket
+import struct
+import threading
+import typing as t
+
+import attrs
+
+from .anidb import Client, Result
+from .exceptions import AnidbError, ClientError, ServerError
+
+
+# Frame header, length of the JSON payload that follows.
+_HEADER = struct.Struct('!I')
+# Upper bound for a frame, commands and replies are limited to 1400 bytes by
+# the AniDB API so anything much larger is a protocol error.
+MAX_FRAME_SIZE = 64 * 1024
+
+# Commands that would change the session owned by the daemon.
+SESSION_COMMANDS = {'AUTH', 'LOGOUT', 'ENCRYPT', 'ENCODING'}
+# LOGIN FIRST and INVALID SESSION, the session was dropped by the server.
+SESSION_EXPIRED_CODES = {501, 506}
+
+
+def default_socket_path() -> str:
+    """
+    Default path of the daemon socket, ``$XDG_RUNTIME_DIR/yumemi.sock`` or
+    ``/tmp/yumemi-$UID.sock`` when runtime dir is not set.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'yumemi.sock')
+    return f'/tmp/yumemi-{os.getuid()}.sock'
+
+
+def send_frame(sock: socket.socket, obj: t.Any) -> None:
+    """Send JSON serializable object as a length prefixed frame."""
+    payload = json.dumps(obj, separators=(',', ':')).encode('UTF-8')
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise EOFError
+        buf += chunk
+    return bytes(buf)
+
+
+def recv_frame(sock: socket.socket) -> t.Optional[t.Any]:
+    """
+    Receive one frame sent by :func:`send_frame`.
+
+    Returns:
+        Decoded object or ``None`` if the peer closed the connection.
+    """
+    try:
+        (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+        if size > MAX_FRAME_SIZE:
+            raise ClientError(f'Frame too large ({size} bytes)')
+        return json.loads(_recv_exactly(sock, size))
+    except EOFError:
+        return None
+
+
+def _is_listening(path: str) -> bool:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def result_to_dict(result: Result) -> dict[str, t.Any]:
+    return attrs.asdict(result)
+
+
+def result_from_dict(data: dict[str, t.Any]) -> Result:
+    return Result(
+        command=data['command'],
+        params=data['params'],
+        code=data['code'],
+        message=data['message'],
+        data=tuple(tuple(line) for line in data['data']),
+    )
+
+
+@attrs.define
+class _Scheduler:
+    """
+    Round-robin queue of requests. Every producer (connection) has its own
+    FIFO and the producers take turns, so one producer with a long batch can't
+    starve the others.
+    """
+
+    _cond: threading.Condition = attrs.field(
+        init=False, factory=threading.Condition)
+    _queues: dict[int, collections.deque] = attrs.field(
+        init=False, factory=dict)
+    _order: collections.deque = attrs.field(
+        init=False, factory=collections.deque)
+
+    def put(self, producer: int, item: t.Any) -> None:
+        with self._cond:
+            queue = self._queues.get(producer)
+            if queue is None:
+                queue = self._queues[producer] = collections.deque()
+                self._order.append(producer)
+            queue.append(item)
+            self._cond.notify()
+
+    def get(self, timeout: t.Optional[float] = None) -> t.Optional[t.Any]:
+        """
+        Get next request, or ``None`` if there was none for `timeout` seconds.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._order, timeout):
+                return None
+            producer = self._order.popleft()
+            queue = self._queues[producer]
+            item = queue.popleft()
+            if queue:
+                self._order.append(producer)
+            else:
+                del self._queues[producer]
+            return item
+
+    def discard(self, producer: int) -> None:
+        """Drop all pending requests of the producer."""
+        with self._cond:
+            if self._queues.pop(producer, None) is not None:
+                self._order.remove(producer)
+
+
+@attrs.define
+class Server:
+    """
+    Daemon that shares one authenticated :class:`~yumemi.Client` between many
+    local producers. Producers connect to a Unix socket and send commands as
+    length prefixed JSON frames (see :class:`RemoteClient`); commands from all
+    producers are executed one at a time in round-robin order, so they all
+    share the single session and its flood protection.
+    """
+
+    client: Client
+    path: str = attrs.field(factory=default_socket_path)
+    keepalive: float = 30 * 60
+    """Check the session after being idle for this many seconds."""
+    login: t.Optional[t.Callable[[Client], None]] = None
+    """Callback to (re)authenticate the client when the session expires."""
+
+    _socket: t.Optional[socket.socket] = attrs.field(init=False, default=None)
+    _scheduler: _Scheduler = attrs.field(init=False, factory=_Scheduler)
+    _closed: threading.Event = attrs.field(init=False, factory=threading.Event)
+
+    def listen(self) -> None:
+        """Bind the socket, called by :meth:`serve_forever` if needed."""
+        if os.path.exists(self.path):
+            if _is_listening(self.path):
+                raise ClientError(f'Daemon is already running on {self.path}')
+            # Stale socket left by a daemon that was killed.
+            os.unlink(self.path)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._socket.listen()
+
+    def serve_forever(self) -> None:
+        """Serve requests until :meth:`close`."""
+        if self._socket is None:
+            self.listen()
+        assert self._socket is not None
+
+        worker = threading.Thread(target=self._work, daemon=True)
+        worker.start()
+
+        while not self._closed.is_set():
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                break
+            reader = threading.Thread(target=self._read, args=(conn,), daemon=True)
+            reader.start()
+
+        worker.join()
+
+    def close(self) -> None:
+        self._closed.set()
+        # Wake up the worker waiting for requests.
+        self._scheduler.put(-1, None)
+        if self._socket is not None:
+            # Shutdown interrupts accept() blocked in serve_forever().
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._socket.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def _read(self, conn: socket.socket) -> None:
+        lock = threading.Lock()
+        try:
+            while (request := recv_frame(conn)) is not None:
+                self._scheduler.put(id(conn), (conn, lock, request))
+        except (OSError, ValueError, AnidbError):
+            pass
+        finally:
+            self._scheduler.discard(id(conn))
+            conn.close()
+
+    def _work(self) -> None:
+        while True:
+            item = self._scheduler.get(timeout=self.keepalive)
+            if self._closed.is_set():
+                break
+            if item is None:
+                self._keepalive()
+                continue
+            conn, lock, request = item
+            response = self._execute(request)
+            try:
+                with lock:
+                    send_frame(conn, response)
+            except OSError:
+                pass
+
+    def _keepalive(self) -> None:
+        try:
+            alive = self.client.check_session()
+        except AnidbError:
+            alive = False
+
+        if not alive and self.login is not None:
+            try:
+                self.login(self.client)
+            except AnidbError:
+                pass
+
+    def _command(self, command: str,
+                 params: t.Optional[dict[str, t.Any]]) -> Result:
+        """Execute the command, log in again and retry once if the session expired."""
+        try:
+            return self.client.command(command, params)
+        except ClientError as e:
+            if (self.login is None or e.result is None
+                    or e.result.code not in SESSION_EXPIRED_CODES):
+                raise
+        # Eg. the server dropped the session after an IP change.
+        self.login(self.client)
+        return self.client.command(command, params)
+
+    def _execute(self, request: dict[str, t.Any]) -> dict[str, t.Any]:
+        response: dict[str, t.Any] = {'id': request.get('id')}
+        try:
+            command = str(request['command']).upper()
+            if command in SESSION_COMMANDS:
+                raise ClientError(
+                    f'{command} is not allowed, session is owned by the daemon')
+            result = self._command(command, request.get('params'))
+            response['result'] = result_to_dict(result)
+        except AnidbError as e:
+            response['error'] = {
+                'type': 'server' if isinstance(e, ServerError) else 'client',
+                'message': str(e),
+                'result': result_to_dict(e.result) if e.result else None,
+            }
+        except (KeyError, TypeError) as e:
+            response['error'] = {
+                'type': 'client',
+                'message': f'Invalid request, {e}',
+                'result': None,
+            }
+        return response
+
+
+@attrs.define
+class RemoteClient:
+    """
+    Thin client that sends commands through a running :class:`Server` instead
+    of talking to AniDB directly. Session is owned by the daemon, so there is
+    no authentication on this side.
+    """
+
+    path: str = attrs.field(factory=default_socket_path)
+
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _socket: t.Optional[socket.socket] = attrs.field(init=False, default=None)
+    _request_id: int = attrs.field(init=False, default=0)
+
+    def _connect(self) -> socket.socket:
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                self._socket.connect(self.path)
+            except OSError as e:
+                self._socket = None
+                raise ServerError(f'Could not connect to the daemon, {e}') from e
+        return self._socket
+
+    def command(self,
+                command: str,
+                params: t.Optional[dict[str, t.Any]] = None,
+                ) -> Result:
+        """
+        Send a command through the daemon, same as :meth:`Client.command`.
+        """
+        with self._lock:
+            sock = self._connect()
+            self._request_id += 1
+            try:
+                send_frame(sock, {
+                    'id': self._request_id,
+                    'command': command,
+                    'params': params or {},
+                })
+                response = recv_frame(sock)
+            except OSError as e:
+                self.close()
+                raise ServerError(f'Connection to the daemon failed, {e}') from e
+
+        if response is None:
+            self.close()
+            raise ServerError('Daemon closed the connection')
+
+        if 'error' in response:
+            error = response['error']
+            result = result_from_dict(error['result']) if error['result'] else None
+            exc_class = ServerError if error['type'] == 'server' else ClientError
+            raise exc_class(error['message'], result=result)
+
+        return result_from_dict(response['result'])
+
+    def ping(self) -> bool:
+        try:
+            return self.command('PING').code == 300
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        if self._socket is not None:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._socket.close()
+            self._socket = None
@@ -0,0 +1,286 @@
+"""
+Hashing files while they are being downloaded, so the hash is ready as soon
+as the last byte is written.
+
+Only the contiguous prefix of the file is hashed, holes of sparse files
+(eg. pieces a torrent client did not download yet) end the prefix. Files
+preallocated without holes, and files on file systems which can't report
+holes, would have zeros hashed before the data is written. They're hashed
+at once when they have the final size and stop changing instead.
+
+Files downloaded under a temporary name and renamed when complete are never
+followed, the file at `path` doesn't grow.
+
+Progress is saved with :meth:`~yumemi._rhash.RHash.store` to a state file,
+so hashing continues where it stopped after a restart. Following requires
+LibRHash.
+"""
+
+import os
+import struct
+import time
+import typing as t
+
+import attrs
+
+from . import _rhash as rhash
+from .watch import IN_CLOSE_WRITE, IN_MODIFY, Inotify, inotify_available
+
+
+BLOCK_SIZE = 1 << 20
+
+# Magic, hashed bytes, device and inode of the file, followed by the stored
+# RHash context.
+_STATE = struct.Struct('<4sQQQ')
+_STATE_MAGIC = b'YMF1'
+
+
+def default_state_path(path: str) -> str:
+    """Hidden state file next to the followed file."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'.{name}.yumemi-state')
+
+
+def _data_end(fd: int, offset: int, size: int) -> t.Optional[int]:
+    """
+    End of the data following `offset`, before the next hole, ``None`` if
+    the file system can't tell.
+    """
+    if offset >= size:
+        return size
+    if not hasattr(os, 'SEEK_HOLE'):
+        return None
+    try:
+        return min(os.lseek(fd, offset, os.SEEK_HOLE), size)
+    except OSError:
+        return None
+
+
+@attrs.define
+class FollowHasher:
+    """
+    ED2K hash of a file growing to `size` bytes, computed as it's written.
+
+    Example::
+
+        hasher = FollowHasher('episode.mkv', size=367001600)
+        ed2k = hasher.follow()
+    """
+
+    path: str
+    size: int
+    """Final size of the file."""
+    state_path: t.Optional[str] = None
+    """File to save progress to, ``None`` to not save it."""
+    save_interval: float = 10
+    """Seconds between saves of the progress."""
+    settle: float = 5
+    """
+    Seconds the file must stay unchanged to be hashed when it can't be hashed
+    while it's written.
+    """
+    onwarning: t.Optional[t.Callable[[str], None]] = None
+    """Called with a message when the file can't be hashed while it's written."""
+    block_size: int = BLOCK_SIZE
+
+    _hasher: rhash.RHash = attrs.field(init=False)
+    _offset: int = attrs.field(init=False, default=0)
+    _identity: t.Optional[tuple[int, int]] = attrs.field(init=False, default=None)
+    _saved_at: float = attrs.field(init=False, default=0)
+    _digest: t.Optional[str] = attrs.field(init=False, default=None)
+    _incremental: t.Optional[bool] = attrs.field(init=False, default=None)
+    _seen: tuple[int, int] = attrs.field(init=False, default=(0, 0))
+
+    def __attrs_post_init__(self):
+        self._hasher = rhash.RHash(rhash.ED2K)
+        self._saved_at = time.monotonic()
+        if self.state_path is not None:
+            self._load()
+
+    @property
+    def offset(self) -> int:
+        """Bytes hashed so far."""
+        return self._offset
+
+    @property
+    def done(self) -> bool:
+        return self._digest is not None
+
+    def _load(self) -> None:
+        assert self.state_path is not None
+        try:
+            with open(self.state_path, 'rb') as f:
+                data = f.read()
+            magic, offset, dev, ino = _STATE.unpack_from(data)
+            st = os.stat(self.path)
+        except (OSError, struct.error):
+            return
+        if (magic != _STATE_MAGIC or (st.st_dev, st.st_ino) != (dev, ino)
+                or offset > st.st_size):
+            return
+        try:
+            hasher = rhash.RHash.load(data[_STATE.size:])
+        except (RuntimeError, ValueError):
+            return
+        self._hasher = hasher
+        self._offset = offset
+        self._identity = (dev, ino)
+
+    def save(self) -> None:
+        """Save progress to the state file, it's replaced atomically."""
+        if self.state_path is None or self._identity is None or self.done:
+            return
+        try:
+            context = self._hasher.store()
+        except NotImplementedError:
+            # LibRHash older than 1.4.0.
+            return
+        data = _STATE.pack(_STATE_MAGIC, self._offset, *self._identity) + context
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.state_path)
+        self._saved_at = time.monotonic()
+
+    def _remove_state(self) -> None:
+        if self.state_path is not None:
+            try:
+                os.unlink(self.state_path)
+            except FileNotFoundError:
+                pass
+
+    def _restart(self) -> None:
+        self._hasher.close()
+        self._hasher = rhash.RHash(rhash.ED2K)
+        self._offset = 0
+
+    def _warn(self, message: str) -> None:
+        if self.onwarning is not None:
+            self.onwarning(message)
+
+    def _check_incremental(self, fd: int, st: os.stat_result) -> bool:
+        """If written data can be told apart from data not written yet."""
+        if self._offset:
+            # Hashed while written before the restart.
+            return True
+        end = _data_end(fd, 0, st.st_size)
+        if end is None:
+            self._warn('file system does not report holes, hashing after the '
+                       'download completes')
+            return False
+        if (end == st.st_size == self.size
+                and time.time() - st.st_mtime < self.settle):
+            self._warn('file is preallocated, hashing after the download '
+                       'completes')
+            return False
+        return True
+
+    def update(self) -> bool:
+        """
+        Hash bytes written since the last update.
+
+        Returns:
+            ``True`` when the whole file is hashed.
+
+        Raises:
+            ValueError: File is larger than `size`.
+        """
+        if self.done:
+            return True
+        try:
+            f = open(self.path, 'rb', buffering=0)
+        except FileNotFoundError:
+            return False
+
+        with f:
+            st = os.fstat(f.fileno())
+            self._seen = (st.st_size, st.st_mtime_ns)
+            if st.st_size > self.size:
+                raise ValueError(
+                    f'{self.path} has {st.st_size} bytes, expected {self.size}')
+            identity = (st.st_dev, st.st_ino)
+            if identity != self._identity or st.st_size < self._offset:
+                # Replaced or truncated, hashed data are not in the file.
+                if self._offset:
+                    self._restart()
+                self._identity = identity
+                self._incremental = None
+
+            if self._incremental is None:
+                self._incremental = self._check_incremental(f.fileno(), st)
+            if self._incremental:
+                end = _data_end(f.fileno(), self._offset, st.st_size)
+                if end is None:
+                    return False
+            elif (st.st_size < self.size
+                    or time.time() - st.st_mtime < self.settle):
+                # Not complete, or still being written.
+                return False
+            else:
+                end = st.st_size
+            f.seek(self._offset)
+            while self._offset < end:
+                block = f.read(min(self.block_size, end - self._offset))
+                if not block:
+                    break
+                self._hasher.update(block)
+                self._offset += len(block)
+                if time.monotonic() - self._saved_at > self.save_interval:
+                    self.save()
+
+        if self._offset < self.size:
+            return False
+        self._digest = self._hasher.finish().hash()
+        self._remove_state()
+        return True
+
+    def digest(self) -> str:
+        """ED2K hash, available when :meth:`update` returned ``True``."""
+        if self._digest is None:
+            raise ValueError(f'{self.path} is not hashed yet')
+        return self._digest
+
+    def follow(self, timeout: t.Optional[float] = None,
+               poll_interval: float = 1) -> str:
+        """
+        Hash the file as it's written until it has `size` bytes. Writes are
+        noticed immediately with inotify, or every `poll_interval` seconds.
+
+        Args:
+            timeout: Seconds the file may not change before giving up.
+
+        Raises:
+            TimeoutError: File did not change for `timeout` seconds.
+        """
+        source = None
+        progress_at = time.monotonic()
+        try:
+            while True:
+                progress = (self._offset, self._seen)
+                if self.update():
+                    return self.digest()
+
+                now = time.monotonic()
+                if (self._offset, self._seen) != progress:
+                    progress_at = now
+                elif timeout is not None and now - progress_at > timeout:
+                    raise TimeoutError(
+                        f'{self.path} did not change for {timeout:g} seconds')
+
+                if source is None and inotify_available():
+                    try:
+                        source = Inotify(self.path, IN_MODIFY | IN_CLOSE_WRITE)
+                    except OSError:
+                        # Not created yet.
+                        pass
+                    else:
+                        # Written before the watch was added.
+                        continue
+                if source is not None:
+                    source.read(poll_interval)
+                else:
+                    time.sleep(poll_interval)
+        finally:
+            if source is not None:
+                source.close()
+            self.save()
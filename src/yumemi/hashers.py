@@ -0,0 +1,373 @@
+"""
+ED2K hashes with interchangeable backends, so files can be hashed also
+without LibRHash.
+
+ED2K is the MD4 of the MD4 digests of 9500 KiB chunks of the file, or the MD4
+of the file if it's smaller than one chunk. Backends:
+
+- ``rhash`` -- LibRHash (see :mod:`yumemi._rhash`), files are read by the
+  library.
+- ``hashlib`` -- MD4 from :mod:`hashlib`, missing in many builds of
+  OpenSSL 3.
+- ``python`` -- MD4 implemented in Python, always available but slow.
+
+The fastest available backend is chosen by a short benchmark when it's first
+needed, unless the ``YUMEMI_HASH_BACKEND`` environment variable names one.
+"""
+
+import hashlib
+import os
+import struct
+import threading
+import time
+import typing as t
+
+import attrs
+
+
+CHUNK_SIZE = 9728000
+"""Size of ED2K chunks."""
+BLOCK_SIZE = 1 << 20
+"""Size of blocks read from files."""
+BENCHMARK_SIZE = 1 << 16
+"""Bytes hashed by each backend when selecting the fastest one."""
+BACKEND_ENV = 'YUMEMI_HASH_BACKEND'
+
+M = 0xFFFFFFFF
+_WORDS = struct.Struct('<16I')
+
+
+def _compress(state: tuple[int, int, int, int],
+              data: t.Union[bytes, memoryview]) -> tuple[int, int, int, int]:
+    """Process 64 byte blocks of `data` with MD4 rounds, unrolled for speed."""
+    a, b, c, d = state
+    for (x0, x1, x2, x3, x4, x5, x6, x7,
+         x8, x9, x10, x11, x12, x13, x14, x15) in _WORDS.iter_unpack(data):
+        aa, bb, cc, dd = a, b, c, d
+        # Round 1.
+        s = (a + (d ^ (b & (c ^ d))) + x0) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + (c ^ (a & (b ^ c))) + x1) & M
+        d = (s << 7 | s >> 25) & M
+        s = (c + (b ^ (d & (a ^ b))) + x2) & M
+        c = (s << 11 | s >> 21) & M
+        s = (b + (a ^ (c & (d ^ a))) + x3) & M
+        b = (s << 19 | s >> 13) & M
+        s = (a + (d ^ (b & (c ^ d))) + x4) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + (c ^ (a & (b ^ c))) + x5) & M
+        d = (s << 7 | s >> 25) & M
+        s = (c + (b ^ (d & (a ^ b))) + x6) & M
+        c = (s << 11 | s >> 21) & M
+        s = (b + (a ^ (c & (d ^ a))) + x7) & M
+        b = (s << 19 | s >> 13) & M
+        s = (a + (d ^ (b & (c ^ d))) + x8) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + (c ^ (a & (b ^ c))) + x9) & M
+        d = (s << 7 | s >> 25) & M
+        s = (c + (b ^ (d & (a ^ b))) + x10) & M
+        c = (s << 11 | s >> 21) & M
+        s = (b + (a ^ (c & (d ^ a))) + x11) & M
+        b = (s << 19 | s >> 13) & M
+        s = (a + (d ^ (b & (c ^ d))) + x12) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + (c ^ (a & (b ^ c))) + x13) & M
+        d = (s << 7 | s >> 25) & M
+        s = (c + (b ^ (d & (a ^ b))) + x14) & M
+        c = (s << 11 | s >> 21) & M
+        s = (b + (a ^ (c & (d ^ a))) + x15) & M
+        b = (s << 19 | s >> 13) & M
+        # Round 2.
+        s = (a + ((b & c) | (d & (b | c))) + x0 + 0x5A827999) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + ((a & b) | (c & (a | b))) + x4 + 0x5A827999) & M
+        d = (s << 5 | s >> 27) & M
+        s = (c + ((d & a) | (b & (d | a))) + x8 + 0x5A827999) & M
+        c = (s << 9 | s >> 23) & M
+        s = (b + ((c & d) | (a & (c | d))) + x12 + 0x5A827999) & M
+        b = (s << 13 | s >> 19) & M
+        s = (a + ((b & c) | (d & (b | c))) + x1 + 0x5A827999) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + ((a & b) | (c & (a | b))) + x5 + 0x5A827999) & M
+        d = (s << 5 | s >> 27) & M
+        s = (c + ((d & a) | (b & (d | a))) + x9 + 0x5A827999) & M
+        c = (s << 9 | s >> 23) & M
+        s = (b + ((c & d) | (a & (c | d))) + x13 + 0x5A827999) & M
+        b = (s << 13 | s >> 19) & M
+        s = (a + ((b & c) | (d & (b | c))) + x2 + 0x5A827999) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + ((a & b) | (c & (a | b))) + x6 + 0x5A827999) & M
+        d = (s << 5 | s >> 27) & M
+        s = (c + ((d & a) | (b & (d | a))) + x10 + 0x5A827999) & M
+        c = (s << 9 | s >> 23) & M
+        s = (b + ((c & d) | (a & (c | d))) + x14 + 0x5A827999) & M
+        b = (s << 13 | s >> 19) & M
+        s = (a + ((b & c) | (d & (b | c))) + x3 + 0x5A827999) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + ((a & b) | (c & (a | b))) + x7 + 0x5A827999) & M
+        d = (s << 5 | s >> 27) & M
+        s = (c + ((d & a) | (b & (d | a))) + x11 + 0x5A827999) & M
+        c = (s << 9 | s >> 23) & M
+        s = (b + ((c & d) | (a & (c | d))) + x15 + 0x5A827999) & M
+        b = (s << 13 | s >> 19) & M
+        # Round 3.
+        s = (a + (b ^ c ^ d) + x0 + 0x6ED9EBA1) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + (a ^ b ^ c) + x8 + 0x6ED9EBA1) & M
+        d = (s << 9 | s >> 23) & M
+        s = (c + (d ^ a ^ b) + x4 + 0x6ED9EBA1) & M
+        c = (s << 11 | s >> 21) & M
+        s = (b + (c ^ d ^ a) + x12 + 0x6ED9EBA1) & M
+        b = (s << 15 | s >> 17) & M
+        s = (a + (b ^ c ^ d) + x2 + 0x6ED9EBA1) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + (a ^ b ^ c) + x10 + 0x6ED9EBA1) & M
+        d = (s << 9 | s >> 23) & M
+        s = (c + (d ^ a ^ b) + x6 + 0x6ED9EBA1) & M
+        c = (s << 11 | s >> 21) & M
+        s = (b + (c ^ d ^ a) + x14 + 0x6ED9EBA1) & M
+        b = (s << 15 | s >> 17) & M
+        s = (a + (b ^ c ^ d) + x1 + 0x6ED9EBA1) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + (a ^ b ^ c) + x9 + 0x6ED9EBA1) & M
+        d = (s << 9 | s >> 23) & M
+        s = (c + (d ^ a ^ b) + x5 + 0x6ED9EBA1) & M
+        c = (s << 11 | s >> 21) & M
+        s = (b + (c ^ d ^ a) + x13 + 0x6ED9EBA1) & M
+        b = (s << 15 | s >> 17) & M
+        s = (a + (b ^ c ^ d) + x3 + 0x6ED9EBA1) & M
+        a = (s << 3 | s >> 29) & M
+        s = (d + (a ^ b ^ c) + x11 + 0x6ED9EBA1) & M
+        d = (s << 9 | s >> 23) & M
+        s = (c + (d ^ a ^ b) + x7 + 0x6ED9EBA1) & M
+        c = (s << 11 | s >> 21) & M
+        s = (b + (c ^ d ^ a) + x15 + 0x6ED9EBA1) & M
+        b = (s << 15 | s >> 17) & M
+        a = (a + aa) & M
+        b = (b + bb) & M
+        c = (c + cc) & M
+        d = (d + dd) & M
+    return a, b, c, d
+
+
+class MD4:
+    """MD4 in Python with the interface of :mod:`hashlib` objects."""
+
+    name = 'md4'
+    digest_size = 16
+    block_size = 64
+
+    def __init__(self, data: bytes = b''):
+        self._state = (0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476)
+        self._buffer = b''
+        self._length = 0
+        self.update(data)
+
+    def update(self, data: bytes) -> None:
+        self._length += len(data)
+        if self._buffer:
+            data = self._buffer + data
+        end = len(data) - len(data) % 64
+        view = memoryview(data)
+        self._state = _compress(self._state, view[:end])
+        self._buffer = bytes(view[end:])
+
+    def copy(self) -> 'MD4':
+        other = MD4()
+        other._state = self._state
+        other._buffer = self._buffer
+        other._length = self._length
+        return other
+
+    def digest(self) -> bytes:
+        padding = b'\x80' + bytes((55 - self._length) % 64)
+        bits = struct.pack('<Q', self._length * 8 & 0xFFFFFFFFFFFFFFFF)
+        tail = self._buffer + padding + bits
+        return struct.pack('<4I', *_compress(self._state, tail))
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+
+class Hasher(t.Protocol):
+    def update(self, data: bytes) -> None:
+        ...
+
+    def hexdigest(self) -> str:
+        ...
+
+
+class Ed2kHasher:
+    """ED2K hasher built on an MD4 constructor."""
+
+    def __init__(self, md4: t.Callable[[], t.Any]):
+        self._md4 = md4
+        self._chunk = md4()
+        self._chunk_size = 0
+        self._digests: list[bytes] = []
+
+    def update(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            block = view[:CHUNK_SIZE - self._chunk_size]
+            self._chunk.update(block)
+            self._chunk_size += len(block)
+            view = view[len(block):]
+            # Full chunk is closed right away, size which is a multiple of
+            # the chunk size ends with an empty chunk, like in LibRHash.
+            if self._chunk_size == CHUNK_SIZE:
+                self._digests.append(self._chunk.digest())
+                self._chunk = self._md4()
+                self._chunk_size = 0
+
+    def hexdigest(self) -> str:
+        if not self._digests:
+            return self._chunk.hexdigest()
+        root = self._md4()
+        for digest in self._digests:
+            root.update(digest)
+        root.update(self._chunk.digest())
+        return root.hexdigest()
+
+
+class _RHashHasher:
+    def __init__(self) -> None:
+        from . import _rhash as rhash
+        self._hasher = rhash.RHash(rhash.ED2K)
+
+    def update(self, data: bytes) -> None:
+        self._hasher.update(data)
+
+    def hexdigest(self) -> str:
+        return self._hasher.finish().hash()
+
+
+@attrs.define
+class Backend:
+    name: str
+    new: t.Callable[[], Hasher]
+    """Creates an ED2K hasher."""
+
+    def hash_bytes(self, data: bytes) -> str:
+        hasher = self.new()
+        hasher.update(data)
+        return hasher.hexdigest()
+
+    def hash_file(self, path: str) -> str:
+        with open(path, 'rb') as f:
+            return self.hash_stream(f)[0]
+
+    def hash_stream(self, stream: t.BinaryIO,
+                    tee: t.Optional[t.BinaryIO] = None) -> tuple[str, int]:
+        """ED2K hash and size of data read from `stream` until its end."""
+        hasher = self.new()
+        size = 0
+        while block := stream.read(BLOCK_SIZE):
+            hasher.update(block)
+            if tee is not None:
+                tee.write(block)
+            size += len(block)
+        return hasher.hexdigest(), size
+
+
+class RHashBackend(Backend):
+    def hash_file(self, path: str) -> str:
+        from . import _rhash as rhash
+        return rhash.hash_file(path, rhash.ED2K)
+
+
+def _hashlib_md4() -> t.Any:
+    return hashlib.new('md4')
+
+
+def available_backends() -> list[Backend]:
+    """Backends which work in this environment."""
+    backends: list[Backend] = []
+    try:
+        from . import _rhash  # noqa: F401
+    except (ImportError, OSError):
+        pass
+    else:
+        backends.append(RHashBackend('rhash', _RHashHasher))
+    try:
+        _hashlib_md4()
+    except ValueError:
+        pass
+    else:
+        backends.append(Backend('hashlib', lambda: Ed2kHasher(_hashlib_md4)))
+    backends.append(Backend('python', lambda: Ed2kHasher(MD4)))
+    return backends
+
+
+def benchmark(backend: Backend, size: int = BENCHMARK_SIZE) -> float:
+    """Bytes per second hashed by the backend."""
+    data = bytes(size)
+    start = time.perf_counter()
+    backend.hash_bytes(data)
+    return size / max(time.perf_counter() - start, 1e-9)
+
+
+def select_backend(backends: t.Optional[list[Backend]] = None,
+                   name: t.Optional[str] = None) -> Backend:
+    """
+    Backend called `name`, or the fastest backend.
+
+    Raises:
+        ValueError: Backend `name` is not available.
+    """
+    if backends is None:
+        backends = available_backends()
+    if name:
+        for backend in backends:
+            if backend.name == name:
+                return backend
+        raise ValueError(f'hash backend {name!r} is not available, available: '
+                         + ', '.join(b.name for b in backends))
+    if len(backends) == 1:
+        return backends[0]
+    return max(backends, key=benchmark)
+
+
+_backend: t.Optional[Backend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> Backend:
+    """Backend selected by :func:`select_backend`, once per process."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = select_backend(name=os.environ.get(BACKEND_ENV))
+        return _backend
+
+
+def set_backend(name: t.Optional[str]) -> Backend:
+    """Select backend `name`, or the fastest backend if ``None``."""
+    global _backend
+    with _backend_lock:
+        _backend = select_backend(name=name)
+        return _backend
+
+
+def hash_file(path: str) -> str:
+    """ED2K hash of the file with the selected backend."""
+    return get_backend().hash_file(path)
+
+
+def hash_stream(stream: t.BinaryIO,
+                tee: t.Optional[t.BinaryIO] = None) -> tuple[str, int]:
+    """
+    ED2K hash and size of data read from `stream` until its end, eg. a pipe
+    or stdin which can't be read again.
+
+    Args:
+        stream: Binary file object, only its ``read`` method is used.
+        tee: Binary file object all read data is written to, eg. to save the
+            stream to a file while it's hashed.
+    """
+    return get_backend().hash_stream(stream, tee)
+
+
+def hash_bytes(data: bytes) -> str:
+    """ED2K hash of `data` with the selected backend."""
+    return get_backend().hash_bytes(data)
@@ -0,0 +1,145 @@
+"""
+Hashing files from asyncio code without blocking the event loop.
+
+Files are hashed block by block in a shared executor, so many coroutines
+hashing at once don't start more threads than the executor has, and hashing
+stops at the next block when the awaiting task is cancelled.
+
+Example::
+
+    task = hash_file_task('episode.mkv')
+    async for progress in task.progress():
+        print(f'{progress.done / progress.total:.0%}')
+    ed2k = await task
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+import typing as t
+
+import attrs
+
+from . import _rhash as rhash
+
+
+WORKERS = min(4, os.cpu_count() or 1)
+"""Number of threads of the shared executor."""
+BLOCK_SIZE = 1 << 20
+"""Size of blocks read from files, progress is reported after each block."""
+
+_executor: t.Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> concurrent.futures.Executor:
+    """Shared executor for hashing, created with :data:`WORKERS` threads."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=WORKERS,
+                thread_name_prefix='yumemi-hash',
+            )
+        return _executor
+
+
+@attrs.define
+class Progress:
+    path: str
+    done: int
+    """Bytes hashed so far."""
+    total: int
+    """Size of the file."""
+
+
+@attrs.define
+class HashTask:
+    """
+    File being hashed in an executor, created by :func:`hash_file_task`.
+    Await the task for the digest.
+    """
+
+    path: str
+    hash_id: int = rhash.ED2K
+    executor: t.Optional[concurrent.futures.Executor] = None
+    """Executor to hash in, :func:`get_executor` by default."""
+    block_size: int = BLOCK_SIZE
+
+    _loop: asyncio.AbstractEventLoop = attrs.field(init=False)
+    _future: 'asyncio.Future[str]' = attrs.field(init=False)
+    _cancelled: threading.Event = attrs.field(init=False, factory=threading.Event)
+    _updates: 'asyncio.Queue[t.Optional[int]]' = attrs.field(
+        init=False, factory=asyncio.Queue)
+    _total: int = attrs.field(init=False, default=0)
+
+    def __attrs_post_init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._future = asyncio.wrap_future(
+            (self.executor or get_executor()).submit(self._hash),
+            loop=self._loop,
+        )
+        self._future.add_done_callback(self._finished)
+
+    def __await__(self) -> t.Generator[t.Any, None, str]:
+        return self._future.__await__()
+
+    def cancel(self) -> None:
+        """Stop hashing at the next block."""
+        self._future.cancel()
+
+    def _finished(self, future: 'asyncio.Future[str]') -> None:
+        if future.cancelled():
+            self._cancelled.set()
+        self._updates.put_nowait(None)
+
+    def _hash(self) -> str:
+        hasher = rhash.RHash(self.hash_id)
+        done = 0
+        with open(self.path, 'rb') as f:
+            self._total = os.fstat(f.fileno()).st_size
+            while block := f.read(self.block_size):
+                if self._cancelled.is_set():
+                    raise concurrent.futures.CancelledError
+                hasher.update(block)
+                done += len(block)
+                try:
+                    self._loop.call_soon_threadsafe(self._updates.put_nowait, done)
+                except RuntimeError:
+                    # Event loop was closed, nobody waits for the digest.
+                    raise concurrent.futures.CancelledError
+        return hasher.finish().hash()
+
+    async def progress(self) -> t.AsyncIterator[Progress]:
+        """
+        Iterate over progress of the hashing until it's done. Updates are
+        skipped when the consumer is slower than hashing.
+        """
+        while (done := await self._updates.get()) is not None:
+            # Only the latest of queued updates.
+            while not self._updates.empty():
+                update = self._updates.get_nowait()
+                if update is None:
+                    yield Progress(self.path, done, self._total)
+                    return
+                done = update
+            yield Progress(self.path, done, self._total)
+
+
+def hash_file_task(path: str, hash_id: int = rhash.ED2K,
+                   **kwargs: t.Any) -> HashTask:
+    """
+    Start hashing the file in the executor, must be called from a running
+    event loop. See :class:`HashTask` for other arguments.
+    """
+    return HashTask(path, hash_id, **kwargs)
+
+
+async def hash_file_async(path: str, hash_id: int = rhash.ED2K,
+                          **kwargs: t.Any) -> str:
+    """
+    Message digest of the file in its default format, like
+    :func:`~yumemi._rhash.hash_file`, computed in the executor.
+    """
+    return await hash_file_task(path, hash_id, **kwargs)
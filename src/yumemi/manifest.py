@@ -0,0 +1,153 @@
+"""
+Per-directory manifests of ED2K hashes, so files don't have to be hashed
+again, eg. after the library is moved to another machine.
+
+Manifest is a list of ``ed2k://`` links of the files in its directory, each
+optionally followed by the modification time of the file in nanoseconds::
+
+    ed2k://|file|Kono%20Subarashii%20-%2001.mkv|367001600|2f7c2...|/ 1675209600000000000
+
+A hash is trusted only if the file still has the recorded size and
+modification time. Links without modification time (eg. link lists exported
+by other programs) are trusted if the size matches.
+"""
+
+import os
+import re
+import tempfile
+import threading
+import typing as t
+import urllib.parse
+
+import attrs
+
+
+MANIFEST_NAME = '.yumemi.ed2k'
+"""Name of the manifest file in each directory."""
+
+_LINK = re.compile(
+    r'ed2k://\|file\|(?P<name>[^|]+)\|(?P<size>\d+)\|(?P<ed2k>[0-9a-fA-F]{32})\|'
+    r'(?:[^|\s]*\|)*/?(?:\s+(?P<mtime>\d+))?\s*'
+)
+
+
+@attrs.define
+class Entry:
+    name: str
+    size: int
+    ed2k: str
+    mtime_ns: t.Optional[int] = None
+
+    def matches(self, st: os.stat_result) -> bool:
+        """Check if the file with stat `st` is still the hashed file."""
+        return st.st_size == self.size and (
+            self.mtime_ns is None or st.st_mtime_ns == self.mtime_ns)
+
+    def to_link(self) -> str:
+        link = f'ed2k://|file|{urllib.parse.quote(self.name)}|{self.size}|{self.ed2k}|/'
+        if self.mtime_ns is not None:
+            link += f' {self.mtime_ns}'
+        return link
+
+
+def read_manifest(path: str) -> dict[str, Entry]:
+    """
+    Read entries of the manifest file by file name, lines which are not ed2k
+    links are ignored.
+    """
+    entries = {}
+    with open(path, encoding='UTF-8') as f:
+        for line in f:
+            match = _LINK.fullmatch(line.strip())
+            if not match:
+                continue
+            name = urllib.parse.unquote(match['name'])
+            entries[name] = Entry(
+                name=name,
+                size=int(match['size']),
+                ed2k=match['ed2k'].lower(),
+                mtime_ns=int(match['mtime']) if match['mtime'] else None,
+            )
+    return entries
+
+
+def write_manifest(path: str, entries: t.Iterable[Entry]) -> None:
+    """Write the manifest file, it's replaced atomically."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=MANIFEST_NAME)
+    try:
+        with os.fdopen(fd, 'w', encoding='UTF-8') as f:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                f.write(entry.to_link() + '\n')
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@attrs.define
+class Manifests:
+    """
+    Manifests of directories, loaded when a file from the directory is first
+    looked up. Changed manifests are written by :meth:`save`.
+    """
+
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _manifests: dict[str, dict[str, Entry]] = attrs.field(init=False, factory=dict)
+    _dirty: set[str] = attrs.field(init=False, factory=set)
+
+    def _manifest(self, directory: str) -> dict[str, Entry]:
+        manifest = self._manifests.get(directory)
+        if manifest is None:
+            try:
+                manifest = read_manifest(os.path.join(directory, MANIFEST_NAME))
+            except FileNotFoundError:
+                manifest = {}
+            self._manifests[directory] = manifest
+        return manifest
+
+    def lookup(self, path: str,
+               st: t.Optional[os.stat_result] = None) -> t.Optional[str]:
+        """ED2K hash of the file, ``None`` if unknown or the file changed."""
+        directory, name = os.path.split(os.path.abspath(path))
+        if st is None:
+            st = os.stat(path)
+        with self._lock:
+            entry = self._manifest(directory).get(name)
+        if entry is None or not entry.matches(st):
+            return None
+        return entry.ed2k
+
+    def update(self, path: str, ed2k: str,
+               st: t.Optional[os.stat_result] = None) -> None:
+        """Record hash of the file with its current size and mtime."""
+        directory, name = os.path.split(os.path.abspath(path))
+        if st is None:
+            st = os.stat(path)
+        entry = Entry(name, st.st_size, ed2k, st.st_mtime_ns)
+        with self._lock:
+            manifest = self._manifest(directory)
+            if manifest.get(name) != entry:
+                manifest[name] = entry
+                self._dirty.add(directory)
+
+    def remove(self, path: str) -> None:
+        directory, name = os.path.split(os.path.abspath(path))
+        with self._lock:
+            if self._manifest(directory).pop(name, None) is not None:
+                self._dirty.add(directory)
+
+    def entries(self, directory: str) -> list[Entry]:
+        """Entries of the directory's manifest."""
+        with self._lock:
+            return list(self._manifest(os.path.abspath(directory)).values())
+
+    def save(self) -> None:
+        """Write changed manifests."""
+        with self._lock:
+            for directory in self._dirty:
+                write_manifest(
+                    os.path.join(directory, MANIFEST_NAME),
+                    self._manifests[directory].values(),
+                )
+            self._dirty.clear()
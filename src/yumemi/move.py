@@ -0,0 +1,233 @@
+"""
+Moving files without overwriting existing files, also across file systems.
+
+Files on another file system are copied to a temporary file next to the
+target, with the cheapest method the file systems support: reflink
+(``FICLONE``, the data is not copied at all), :func:`os.copy_file_range`
+(copied by the kernel, or by the server for network file systems),
+:func:`os.sendfile`, or plain reads and writes. The temporary file is then
+linked to the target name, which fails if the target exists.
+"""
+
+import errno
+import os
+import shutil
+import sys
+import typing as t
+
+from . import hashers
+
+
+# _IOW(0x94, 9, int), not in fcntl before Python 3.12.
+FICLONE = 0x40049409
+
+# Errors of file systems without hardlinks.
+_NO_LINK_ERRNOS = {errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EMLINK}
+
+COPY_CHUNK_SIZE = 1 << 30
+
+
+class VerifyError(OSError):
+    """Copy of the file has different hash than the original."""
+
+
+class CopyError(OSError):
+    """File changed while it was copied, eg. it's still being written."""
+
+
+def _short_copy(copied: int, size: int) -> CopyError:
+    return CopyError(errno.EIO, f'Copied {copied} of {size} bytes, file shrank')
+
+
+def _link_or_rename(src: str, dst: str) -> None:
+    """
+    Give `src` the name `dst`, fails with :exc:`FileExistsError` if `dst`
+    exists. Link is atomic, file systems without hardlinks fall back to
+    checking and renaming.
+    """
+    try:
+        os.link(src, dst, follow_symlinks=False)
+    except OSError as e:
+        if e.errno not in _NO_LINK_ERRNOS:
+            raise
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, 'File exists', dst)
+        os.rename(src, dst)
+    else:
+        os.unlink(src)
+
+
+def _open_part(path: str) -> int:
+    """
+    Create and lock the temporary file of a copy. A file left by an
+    interrupted copy is reused, it's not locked anymore.
+
+    Raises:
+        CopyError: Another copy of the file is in progress.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        # No advisory locks, a left file can't be told from a copy in progress.
+        try:
+            return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            raise CopyError(errno.EEXIST, 'Another copy is in progress', path) \
+                from None
+
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise CopyError(errno.EEXIST, 'Another copy is in progress',
+                                path) from None
+            st = os.fstat(fd)
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            if current is not None and current.st_ino == st.st_ino \
+                    and current.st_dev == st.st_dev:
+                os.ftruncate(fd, 0)
+                return fd
+        except BaseException:
+            os.close(fd)
+            raise
+        # Finished by another copy before it was locked, create a new one.
+        os.close(fd)
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError:
+        return False
+    return True
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int) -> bool:
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    copied = 0
+    try:
+        while copied < size:
+            n = os.copy_file_range(src_fd, dst_fd, min(size - copied, COPY_CHUNK_SIZE))
+            if n == 0:
+                raise _short_copy(copied, size)
+            copied += n
+    except OSError as e:
+        if copied == 0 and e.errno in {errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                       errno.ENOTSUP, errno.EOPNOTSUPP}:
+            return False
+        raise
+    return True
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int) -> bool:
+    if not hasattr(os, 'sendfile'):
+        return False
+    copied = 0
+    try:
+        while copied < size:
+            n = os.sendfile(dst_fd, src_fd, None, min(size - copied, COPY_CHUNK_SIZE))
+            if n == 0:
+                raise _short_copy(copied, size)
+            copied += n
+    except OSError as e:
+        if copied == 0 and e.errno in {errno.EINVAL, errno.ENOSYS}:
+            return False
+        raise
+    return True
+
+
+def copy_data(src_fd: int, dst_fd: int, size: int) -> str:
+    """
+    Copy `size` bytes from the start of `src_fd` to empty `dst_fd`.
+
+    Returns:
+        Method used, ``reflink``, ``copy_file_range``, ``sendfile`` or
+        ``copy``.
+    """
+    if _reflink(src_fd, dst_fd):
+        return 'reflink'
+    if _copy_file_range(src_fd, dst_fd, size):
+        return 'copy_file_range'
+    if _sendfile(src_fd, dst_fd, size):
+        return 'sendfile'
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    os.lseek(dst_fd, 0, os.SEEK_SET)
+    with open(src_fd, 'rb', closefd=False) as fsrc, \
+         open(dst_fd, 'wb', closefd=False) as fdst:
+        shutil.copyfileobj(fsrc, fdst, 1 << 20)
+    return 'copy'
+
+
+def move_file(src: str, dst: str, *, ed2k: t.Optional[str] = None) -> str:
+    """
+    Move file `src` to `dst`, fails with :exc:`FileExistsError` if `dst`
+    exists.
+
+    Files are renamed on the same file system, and copied to a temporary
+    file in the target directory and then renamed when moving to another
+    file system.
+
+    Args:
+        src: File to move.
+        dst: New path of the file.
+        ed2k: Known ED2K hash of the file, copy is verified against it.
+
+    Returns:
+        How the file was moved, ``rename`` or the copy method (see
+        :func:`copy_data`).
+
+    Raises:
+        FileExistsError: Target exists.
+        CopyError: File changed while it was copied, `src` is kept, or
+            another copy to `dst` is in progress.
+        VerifyError: Copy does not match `ed2k`, `src` is kept.
+    """
+    try:
+        _link_or_rename(src, dst)
+        return 'rename'
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    if os.path.lexists(dst):
+        raise FileExistsError(errno.EEXIST, 'File exists', dst)
+
+    directory, name = os.path.split(dst)
+    tmp = os.path.join(directory, f'.{name}.yumemi-part')
+
+    with open(src, 'rb') as fsrc:
+        st = os.fstat(fsrc.fileno())
+        fd = _open_part(tmp)
+        try:
+            method = copy_data(fsrc.fileno(), fd, st.st_size)
+            os.fsync(fd)
+            copied = os.fstat(fd).st_size
+            st_after = os.fstat(fsrc.fileno())
+            if (copied != st.st_size or st_after.st_size != st.st_size
+                    or st_after.st_mtime_ns != st.st_mtime_ns):
+                raise CopyError(errno.EIO, 'File changed while it was copied', src)
+            shutil.copystat(src, tmp)
+
+            if ed2k is not None and hashers.hash_file(tmp) != ed2k:
+                raise VerifyError(errno.EIO, 'Copy does not match ED2K hash', tmp)
+
+            _link_or_rename(tmp, dst)
+        except BaseException:
+            # Still locked, it's the file of this copy.
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            raise
+        finally:
+            os.close(fd)
+
+    os.unlink(src)
+    return method
@@ -0,0 +1,188 @@
+"""
+Editing mylist state of many files at once, with ``MYLISTADD`` of episode
+ranges instead of one command per file.
+
+``MYLISTADD`` also takes an anime, a group and an episode number instead of a
+file, a negative episode number means all episodes up to it. Files are looked
+up with ``FILE`` (answered from the client's
+:class:`~yumemi.cache.ResultCache` for files seen before), grouped by anime
+and group, and each group is edited with as few commands as possible, eg.
+a whole season with a single ``epno=-12``.
+
+Files which can't be grouped (unknown to AniDB, or released without a group)
+are edited one by one.
+"""
+
+import collections
+import re
+import typing as t
+
+import attrs
+
+from .anidb import Client, Result
+from .prefetch import file_ids
+
+
+FILE_PARAMS = {'fmask': '50000000', 'amask': '00008000'}
+"""``FILE`` masks with only the fields needed for grouping, aid, gid, epno."""
+
+# Episode number bit of the FILE amask.
+_AMASK_EPNO = 0x8000
+
+_EPNO_RE = re.compile(r'([A-Z]?)0*(\d+)')
+
+
+def normalize_epno(epno: str) -> t.Optional[str]:
+    """Episode number without leading zeros (``S01`` -> ``S1``), if valid."""
+    m = _EPNO_RE.fullmatch(epno.strip().upper())
+    if m is None:
+        return None
+    return m.group(1) + m.group(2)
+
+
+def episode_ranges(epnos: t.Iterable[str]) -> list[str]:
+    """
+    Fewest ``epno`` values covering the episodes.
+
+    Regular episodes from 1 up to N are covered by ``-N``, other episodes
+    and specials (``S1``, ``C1``, ...) are listed one by one.
+
+    Example::
+
+        >>> episode_ranges(['1', '2', '3', '5', 'S1'])
+        ['-3', '5', 'S1']
+    """
+    numbers = set()
+    specials = set()
+    for epno in epnos:
+        if epno.isdigit():
+            numbers.add(int(epno))
+        else:
+            specials.add(epno)
+
+    ranges = []
+    count = 0
+    while count + 1 in numbers:
+        count += 1
+    if count > 1:
+        ranges.append(f'-{count}')
+        numbers.difference_update(range(1, count + 1))
+    ranges.extend(str(n) for n in sorted(numbers))
+    ranges.extend(sorted(specials))
+    return ranges
+
+
+def file_episode(result: Result) -> t.Optional[tuple[str, str, str]]:
+    """
+    ``aid``, ``gid`` and ``epno`` of a ``FILE`` result, ``None`` if its masks
+    don't include them or the file has no group.
+    """
+    ids = file_ids(result)
+    if 'aid' not in ids or 'gid' not in ids:
+        return None
+    try:
+        fmask = int(str(result.params['fmask']), 16)
+        amask = int(str(result.params['amask']), 16)
+    except (KeyError, ValueError):
+        return None
+    if not amask & _AMASK_EPNO:
+        return None
+    # Fields follow fid in order of fmask bits and then amask bits.
+    index = 1 + bin(fmask).count('1') + bin(amask >> 16).count('1')
+    try:
+        epno = normalize_epno(result.data[0][index])
+    except IndexError:
+        return None
+    if epno is None:
+        return None
+    return ids['aid'], ids['gid'], epno
+
+
+@attrs.define
+class MylistEdit:
+    """One ``MYLISTADD`` edit and the files it covers."""
+
+    params: dict[str, t.Any]
+    """
+    What is edited, ``aid``, ``gid`` and ``epno`` of an episode range, or
+    ``size`` and ``ed2k`` of a single file.
+    """
+    files: list[tuple[str, int]]
+    """ED2K hashes and sizes of the files."""
+
+
+def plan_edits(client: Client,
+               files: t.Iterable[tuple[str, int]],
+               *,
+               file_params: t.Optional[dict[str, t.Any]] = None,
+               ) -> list[MylistEdit]:
+    """
+    Look up files and group them into the fewest edits.
+
+    Args:
+        client: Authenticated client, preferably with a cache.
+        files: ED2K hashes and sizes of the files.
+        file_params: ``FILE`` masks, they must include aid, gid and epno.
+            Lookups with the masks used before are answered from the cache.
+
+    Raises:
+        ClientError: Raised for client side errors of the commands.
+        ServerError: When something went wrong on the server side.
+    """
+    file_params = file_params or FILE_PARAMS
+    episodes: collections.defaultdict[
+        tuple[str, str], dict[str, list[tuple[str, int]]]
+    ] = collections.defaultdict(dict)
+    single = []
+
+    for ed2k, size in dict.fromkeys(files):
+        result = client.command('FILE', {'size': size, 'ed2k': ed2k, **file_params})
+        episode = file_episode(result)
+        if episode is None:
+            single.append(MylistEdit({'size': size, 'ed2k': ed2k}, [(ed2k, size)]))
+            continue
+        aid, gid, epno = episode
+        episodes[aid, gid].setdefault(epno, []).append((ed2k, size))
+
+    edits = []
+    for (aid, gid), group in episodes.items():
+        for epno in episode_ranges(group):
+            if epno.startswith('-'):
+                covered = [str(n) for n in range(1, -int(epno) + 1)]
+            else:
+                covered = [epno]
+            edits.append(MylistEdit(
+                {'aid': aid, 'gid': gid, 'epno': epno},
+                [file for e in covered for file in group[e]],
+            ))
+    return edits + single
+
+
+def mylistedit_many(client: Client,
+                    files: t.Iterable[tuple[str, int]],
+                    params: dict[str, t.Any],
+                    **kwargs: t.Any,
+                    ) -> t.Iterator[tuple[MylistEdit, Result]]:
+    """
+    Edit mylist entries of files, yielding each edit and its ``MYLISTADD``
+    result as soon as it's done.
+
+    All entries of the anime's episodes from the group are edited, including
+    other files of the episodes which are not in `files`.
+
+    Args:
+        client: Authenticated client.
+        files: ED2K hashes and sizes of the files.
+        params: Changed ``MYLISTADD`` parameters, eg. ``{'viewed': True}``.
+        **kwargs: Passed to :func:`plan_edits`.
+
+    Raises:
+        ClientError: Raised for client side errors of the commands.
+        ServerError: When something went wrong on the server side.
+    """
+    for edit in plan_edits(client, files, **kwargs):
+        yield edit, client.command('MYLISTADD', {
+            **edit.params,
+            **params,
+            'edit': True,
+        })
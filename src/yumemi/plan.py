@@ -0,0 +1,240 @@
+"""
+Estimates of how long adding files takes, dominated by hashing and by the
+flood protection delays between packets (see :class:`~yumemi.Connection`).
+"""
+
+import os
+import time
+import typing as t
+
+import attrs
+
+from . import hashers
+from .anidb import Connection
+from .cache import ResultCache
+from .manifest import Manifests
+from .unknown import UnknownFiles
+
+
+# Delays between packets of the connection's flood protection policies.
+SHORT_TERM_DELAY = t.cast(float, attrs.fields(Connection).short_term_delay.default)
+LONG_TERM_DELAY = t.cast(float, attrs.fields(Connection).long_term_delay.default)
+# Packets sent before the short term delay is enforced.
+BURST_PACKETS = 5
+# AUTH and LOGOUT.
+SESSION_PACKETS = 2
+
+
+def format_duration(seconds: float) -> str:
+    seconds = round(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f'{hours}h {minutes}m'
+    if minutes:
+        return f'{minutes}m {seconds}s'
+    return f'{seconds}s'
+
+
+def format_size(size: float) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} TiB'
+
+
+def measure_hash_rate(size: int = 16 << 20, max_time: float = 0.5) -> float:
+    """
+    Bytes per second the ED2K hash is computed at, without reading files.
+    Hashing stops after `max_time` seconds with slow backends.
+    """
+    block = bytes(1 << 20)
+    hasher = hashers.get_backend().new()
+    done = 0
+    start = time.perf_counter()
+    while done < size and time.perf_counter() - start < max_time:
+        hasher.update(block)
+        done += len(block)
+    hasher.hexdigest()
+    return done / max(time.perf_counter() - start, 1e-9)
+
+
+@attrs.define
+class PlanFile:
+    path: str
+    size: int
+    hash: bool
+    """File must be hashed, its hash is not in a manifest."""
+    skip: bool = False
+    """File is unknown to AniDB and not checked again yet, nothing is sent."""
+    cached: bool = False
+    """``FILE`` result is cached, it's not sent."""
+
+
+@attrs.define
+class Plan:
+    """Files to add with the number of packets and bytes to hash."""
+
+    files: list[PlanFile] = attrs.field(factory=list)
+    file_commands: bool = False
+    """``FILE`` command is sent for every file (when renaming)."""
+    hash_rate: float = 100 << 20
+    """Bytes hashed per second."""
+
+    @property
+    def size(self) -> int:
+        return sum(f.size for f in self.files)
+
+    @property
+    def hash_files(self) -> list[PlanFile]:
+        return [f for f in self.files if f.hash]
+
+    @property
+    def hash_size(self) -> int:
+        return sum(f.size for f in self.hash_files)
+
+    @property
+    def skip_files(self) -> list[PlanFile]:
+        return [f for f in self.files if f.skip]
+
+    @property
+    def cached_files(self) -> list[PlanFile]:
+        return [f for f in self.files if f.cached]
+
+    def file_packets(self, file: PlanFile) -> int:
+        if file.skip:
+            return 0
+        return 2 if self.file_commands and not file.cached else 1
+
+    @property
+    def packets(self) -> int:
+        """Upper bound of packets sent, ``FILE`` is not sent for unknown files."""
+        return SESSION_PACKETS + sum(self.file_packets(f) for f in self.files)
+
+    def packets_time(self, delay: float) -> float:
+        """Seconds to send the packets with `delay` between packets."""
+        return max(self.packets - BURST_PACKETS, 0) * delay
+
+    def hash_time(self) -> float:
+        return self.hash_size / self.hash_rate
+
+    def eta(self, delay: float) -> float:
+        """
+        Seconds to add all files. Files are hashed while packets of other
+        files are sent, so it's the longer of both.
+        """
+        return max(self.hash_time(), self.packets_time(delay))
+
+    def file_cost(self, file: PlanFile, delay: float) -> float:
+        """Estimated seconds to process one file."""
+        hash_time = file.size / self.hash_rate if file.hash else 0
+        return max(hash_time, self.file_packets(file) * delay)
+
+
+def make_plan(paths: t.Iterable[str], *,
+              manifests: t.Optional[Manifests] = None,
+              file_commands: bool = False,
+              file_params: t.Optional[dict[str, t.Any]] = None,
+              cache: t.Optional[ResultCache] = None,
+              unknown_files: t.Optional[UnknownFiles] = None,
+              hash_rate: t.Optional[float] = None,
+              onerror: t.Optional[t.Callable[[str, Exception], None]] = None,
+              ) -> Plan:
+    """
+    Stat files and look up their hashes in `manifests`.
+
+    Only files with hashes in `manifests` can be found in `cache` and
+    `unknown_files`, packets of other files are counted as if they were
+    sent.
+
+    Args:
+        paths: Paths of the files.
+        manifests: Files with hashes in manifests are not hashed.
+        file_commands: ``FILE`` command is sent for every file.
+        file_params: Other parameters of the ``FILE`` command (masks), to
+            look it up in `cache`.
+        cache: ``FILE`` is not sent for files with cached results.
+        unknown_files: Nothing is sent for files unknown to AniDB until it's
+            time to check them again.
+        hash_rate: Bytes hashed per second, measured if not given.
+        onerror: Called with a path and an exception for files which can't
+            be used (eg. removed after they were scanned), they're skipped.
+    """
+    plan = Plan(
+        file_commands=file_commands,
+        hash_rate=hash_rate or measure_hash_rate(),
+    )
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            if onerror is not None:
+                onerror(path, e)
+            continue
+        ed2k = manifests.lookup(path, st) if manifests is not None else None
+        file = PlanFile(path, st.st_size, ed2k is None)
+        if ed2k is None:
+            pass
+        elif (unknown_files is not None
+              and not unknown_files.should_check(ed2k, st.st_size)):
+            file.skip = True
+        elif file_commands and cache is not None:
+            params = {'ed2k': ed2k, 'size': st.st_size, **(file_params or {})}
+            file.cached = cache.get('FILE', params) is not None
+        plan.files.append(file)
+    return plan
+
+
+@attrs.define
+class Tracker:
+    """
+    Tracks progress of a planned run. The estimate of remaining time is
+    corrected by how long the processed files took compared to the plan.
+    """
+
+    plan: Plan
+    delay: float = SHORT_TERM_DELAY
+
+    _start: float = attrs.field(init=False)
+    _costs: dict[str, float] = attrs.field(init=False)
+    _remaining_cost: float = attrs.field(init=False)
+    _done_cost: float = attrs.field(init=False, default=0)
+    _done_files: int = attrs.field(init=False, default=0)
+    _done_size: int = attrs.field(init=False, default=0)
+
+    def __attrs_post_init__(self):
+        self._start = time.monotonic()
+        self._costs = {
+            f.path: self.plan.file_cost(f, self.delay) for f in self.plan.files
+        }
+        self._remaining_cost = sum(self._costs.values())
+
+    def done(self, path: str, size: int) -> None:
+        """Mark file as processed."""
+        cost = self._costs.pop(path, 0)
+        self._done_cost += cost
+        self._remaining_cost -= cost
+        self._done_files += 1
+        self._done_size += size
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._start
+
+    def throughput(self) -> float:
+        """Bytes of files processed per second."""
+        return self._done_size / max(self.elapsed, 1e-9)
+
+    def eta(self) -> float:
+        """Seconds remaining."""
+        if self._done_cost <= 0:
+            return self._remaining_cost
+        return self._remaining_cost * self.elapsed / self._done_cost
+
+    def status(self) -> str:
+        return (
+            f'{self._done_files}/{len(self.plan.files)} files, '
+            f'{format_size(self.throughput())}/s, '
+            f'ETA {format_duration(self.eta())}'
+        )
@@ -0,0 +1,178 @@
+import concurrent.futures
+import errno
+import threading
+import typing as t
+
+import attrs
+
+from .anidb import Client, Connection, Result
+from .exceptions import ClientError
+
+
+T = t.TypeVar('T')
+
+
+@attrs.define
+class Account:
+    username: str
+    password: str = attrs.field(repr=False)
+    api_key: t.Optional[str] = attrs.field(default=None, repr=False)
+    """API key to encrypt the session, not encrypted if not set."""
+
+
+@attrs.define
+class ClientPool:
+    """
+    Authenticated :class:`~yumemi.Client` sessions for several AniDB accounts.
+
+    Every account has its own connection, bound to a free local port from
+    `ports`, with its own flood protection, and its own worker thread. Work
+    submitted for different accounts runs concurrently, work for one account
+    runs in order.
+
+    Clients are logged in when they are first needed.
+    """
+
+    client_name: str
+    client_version: int
+    ports: t.Sequence[int] = range(8888, 8988)
+    """Local ports to bind the connections to."""
+    connection_options: dict[str, t.Any] = attrs.field(factory=dict)
+    """Other :class:`~yumemi.Connection` arguments, eg. `server_host`."""
+
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _accounts: dict[str, Account] = attrs.field(init=False, factory=dict)
+    _account_locks: dict[str, threading.Lock] = attrs.field(
+        init=False, factory=dict)
+    _clients: dict[str, Client] = attrs.field(init=False, factory=dict)
+    _connections: dict[str, Connection] = attrs.field(init=False, factory=dict)
+    _executors: dict[str, concurrent.futures.ThreadPoolExecutor] = attrs.field(
+        init=False, factory=dict)
+
+    def __enter__(self) -> 'ClientPool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def add_account(self, name: str, username: str, password: str,
+                    api_key: t.Optional[str] = None) -> None:
+        """
+        Register an account under `name` which is used to route work to it.
+        """
+        with self._lock:
+            if name in self._accounts:
+                raise ClientError(f'Account {name!r} already exists')
+            self._accounts[name] = Account(username, password, api_key)
+            self._account_locks[name] = threading.Lock()
+            self._executors[name] = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix=f'yumemi-{name}',
+            )
+
+    def _connect(self) -> Connection:
+        used_ports = {c.local_port for c in self._connections.values()}
+        for port in self.ports:
+            if port in used_ports:
+                continue
+            try:
+                return Connection(local_port=port, **self.connection_options)
+            except OSError as e:
+                if e.errno != errno.EADDRINUSE:
+                    raise
+        raise ClientError('No free local port for a new connection')
+
+    def client(self, name: str) -> Client:
+        """
+        Authenticated client for the account.
+
+        Raises:
+            KeyError: Account does not exist.
+            ClientError: Raised when authentication failed.
+        """
+        # Only the account is locked during login, so other accounts don't
+        # wait for it.
+        with self._account_locks[name]:
+            client = self._clients.get(name)
+            if client is not None:
+                return client
+
+            with self._lock:
+                connection = self._connect()
+                self._connections[name] = connection
+
+            account = self._accounts[name]
+            client = Client(
+                self.client_name,
+                self.client_version,
+                connection=connection,
+            )
+            try:
+                if account.api_key:
+                    client.encrypt(account.username, account.api_key)
+                client.auth(account.username, account.password)
+            except Exception:
+                with self._lock:
+                    del self._connections[name]
+                connection.close()
+                raise
+
+            self._clients[name] = client
+            return client
+
+    def command(self,
+                name: str,
+                command: str,
+                params: t.Optional[dict[str, t.Any]] = None,
+                ) -> Result:
+        """Send a command with the account's client, see :meth:`Client.command`."""
+        return self.client(name).command(command, params)
+
+    def submit(self,
+               name: str,
+               command: str,
+               params: t.Optional[dict[str, t.Any]] = None,
+               ) -> 'concurrent.futures.Future[Result]':
+        """
+        Send a command with the account's client in its worker thread.
+
+        Returns:
+            Future of the command result.
+        """
+        return self._executors[name].submit(self.command, name, command, params)
+
+    def run(self,
+            name: str,
+            func: t.Callable[..., T],
+            *args: t.Any,
+            **kwargs: t.Any,
+            ) -> 'concurrent.futures.Future[T]':
+        """
+        Call ``func(client, *args, **kwargs)`` with the account's client in its
+        worker thread, eg. to process a batch of files for the account.
+
+        Returns:
+            Future of the function result.
+        """
+        def call() -> T:
+            return func(self.client(name), *args, **kwargs)
+
+        return self._executors[name].submit(call)
+
+    def close(self) -> None:
+        """Wait for submitted work, logout all clients and close connections."""
+        with self._lock:
+            executors = list(self._executors.values())
+        for executor in executors:
+            executor.shutdown()
+
+        with self._lock:
+            for client in self._clients.values():
+                try:
+                    client.logout()
+                except Exception:
+                    pass
+            for connection in self._connections.values():
+                connection.close()
+            self._clients.clear()
+            self._connections.clear()
@@ -0,0 +1,152 @@
+"""
+Fetching results of lookup commands in the background, into the client's
+:class:`~yumemi.cache.ResultCache`, while the flood protection would otherwise
+leave the slot unused (eg. while the next file is being hashed).
+
+Commands are sent only when no other command is being sent and a packet can
+be sent right away, so a prefetched command delays a command issued meanwhile
+by at most one round trip and one flood protection delay.
+
+Example::
+
+    client = Client('myclient', 1, cache=ResultCache())
+    with Prefetcher(client) as prefetcher:
+        result = client.command('FILE', {'size': size, 'ed2k': ed2k})
+        prefetcher.follow(result)  # ANIME, EPISODE and GROUP of the file
+        ...
+"""
+
+import collections
+import threading
+import typing as t
+
+import attrs
+
+from .anidb import Client, Result
+from .cache import Key, ResultCache, cache_key
+from .exceptions import AnidbError
+
+
+# Fields of the first byte of FILE fmask, following fid.
+_FMASK_IDS = [(0x40, 'aid'), (0x20, 'eid'), (0x10, 'gid')]
+
+
+def file_ids(result: Result) -> dict[str, str]:
+    """
+    ``aid``, ``eid`` and ``gid`` of a ``FILE`` result which are included by
+    its ``fmask``.
+    """
+    if result.command != 'FILE' or result.code != 220 or not result.data:
+        return {}
+    try:
+        first_byte = int(str(result.params.get('fmask', ''))[:2], 16)
+    except ValueError:
+        return {}
+    names = [name for bit, name in _FMASK_IDS if first_byte & bit]
+    # Fields are ordered by mask bits, fid is always first.
+    return {
+        name: value
+        for name, value in zip(names, result.data[0][1:])
+        if value and value != '0'
+    }
+
+
+@attrs.define
+class Prefetcher:
+    """
+    Sends queued lookup commands in idle slots of the `client`'s flood
+    protection. The client gets a :class:`~yumemi.cache.ResultCache` if it
+    has none.
+    """
+
+    client: Client
+    max_queue: int = 64
+    """Queued commands, the oldest are dropped when the queue is full."""
+    poll_interval: float = 0.1
+    """Seconds to wait before checking again if the client is idle."""
+
+    _cache: ResultCache = attrs.field(init=False)
+    _condition: threading.Condition = attrs.field(
+        init=False, factory=threading.Condition)
+    _queue: 'collections.OrderedDict[Key, tuple[str, dict[str, t.Any]]]' = \
+        attrs.field(init=False, factory=collections.OrderedDict)
+    _closed: bool = attrs.field(init=False, default=False)
+    _thread: threading.Thread = attrs.field(init=False)
+
+    def __attrs_post_init__(self):
+        if self.client.cache is None:
+            self.client.cache = ResultCache()
+        self._cache = self.client.cache
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'Prefetcher':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def prefetch(self, command: str,
+                 params: t.Optional[dict[str, t.Any]] = None) -> None:
+        """Queue the command unless its result is cached or queued."""
+        command = command.upper()
+        params = params or {}
+        key = cache_key(command, params)
+        if key in self._cache:
+            return
+        with self._condition:
+            if self._closed or key in self._queue:
+                return
+            self._queue[key] = (command, params)
+            while len(self._queue) > self.max_queue:
+                self._queue.popitem(last=False)
+            self._condition.notify()
+
+    def follow(self, result: Result) -> None:
+        """Queue lookups of the anime, episode and group of a ``FILE`` result."""
+        ids = file_ids(result)
+        if 'aid' in ids:
+            self.prefetch('ANIME', {'aid': ids['aid']})
+        if 'eid' in ids:
+            self.prefetch('EPISODE', {'eid': ids['eid']})
+        if 'gid' in ids:
+            self.prefetch('GROUP', {'gid': ids['gid']})
+
+    @property
+    def pending(self) -> int:
+        """Number of queued commands."""
+        with self._condition:
+            return len(self._queue)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                key, (command, params) = next(iter(self._queue.items()))
+
+            if key not in self._cache:
+                try:
+                    result = self.client.command_if_idle(command, params)
+                except AnidbError:
+                    # Not found or failed, it's not retried.
+                    pass
+                else:
+                    if result is None:
+                        # Client is busy, try again later.
+                        with self._condition:
+                            self._condition.wait(self.poll_interval)
+                        continue
+
+            with self._condition:
+                self._queue.pop(key, None)
+
+    def close(self) -> None:
+        """Drop queued commands and stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._queue.clear()
+            self._condition.notify_all()
+        self._thread.join()
@@ -0,0 +1,134 @@
+import asyncio
+import collections
+import queue
+import threading
+import typing as t
+
+import attrs
+
+from .anidb import Client, parse_reply
+from .exceptions import AnidbError
+
+
+# Codes of notification packets sent by the server (not replies to commands).
+NOTIFICATION_CODES = range(720, 800)
+
+
+@attrs.define
+class Notification:
+    code: int
+    """Notification type, eg. 720 for new file, 794 for new message."""
+    nid: int
+    """Notify packet ID, acknowledged with ``PUSHACK``."""
+    message: str
+    data: tuple[tuple[str, ...], ...]
+
+
+@attrs.define
+class PushListener:
+    """
+    Receives notifications (see ``PUSH`` command in `AniDB Wiki`_) pushed by
+    the server to the client's socket.
+
+    Once started, packets are received in a background thread. Notifications
+    are separated from command replies, acknowledged with ``PUSHACK`` and
+    delivered to subscribed callbacks and :meth:`notifications` iterators.
+    The server resends a notification until it's acknowledged, repeated
+    notifications are delivered only once.
+
+    .. _AniDB Wiki: https://wiki.anidb.net/w/UDP_API_Definition
+
+    Example::
+
+        listener = PushListener(client)
+        listener.subscribe(print)
+        listener.start()
+        listener.enable(notify=True, msg=True)
+    """
+
+    client: Client
+
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _callbacks: list[t.Callable[[Notification], None]] = attrs.field(
+        init=False, factory=list)
+    _acks: queue.Queue = attrs.field(init=False, factory=queue.Queue)
+    _seen: collections.deque = attrs.field(
+        init=False, factory=lambda: collections.deque(maxlen=1000))
+
+    def subscribe(self, callback: t.Callable[[Notification], None]) -> None:
+        """
+        Call `callback` for every notification. Callbacks are called from the
+        receiver thread and should not block.
+        """
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def unsubscribe(self, callback: t.Callable[[Notification], None]) -> None:
+        with self._lock:
+            self._callbacks.remove(callback)
+
+    def start(self) -> None:
+        """Start receiving packets in a background thread."""
+        self.client._connection.start_receiver(self._handle)
+        threading.Thread(target=self._acknowledge, daemon=True).start()
+
+    def enable(self, notify: bool = True, msg: bool = True,
+               buddy: bool = False) -> None:
+        """
+        Enable notifications with ``PUSH`` command.
+
+        Args:
+            notify: Notifications about new files, etc.
+            msg: Notifications about new private messages.
+            buddy: Notifications about buddy events.
+        """
+        self.client.command('PUSH', {'notify': notify, 'msg': msg, 'buddy': buddy})
+
+    async def notifications(self) -> t.AsyncIterator[Notification]:
+        """Iterate over notifications received from now on."""
+        loop = asyncio.get_running_loop()
+        notifications: asyncio.Queue[Notification] = asyncio.Queue()
+
+        def callback(notification: Notification) -> None:
+            loop.call_soon_threadsafe(notifications.put_nowait, notification)
+
+        self.subscribe(callback)
+        try:
+            while True:
+                yield await notifications.get()
+        finally:
+            self.unsubscribe(callback)
+
+    def _handle(self, data: bytes) -> bool:
+        code, message, lines = parse_reply(
+            self.client._codec.decode(data).split('\n'))
+        if code not in NOTIFICATION_CODES:
+            return False
+
+        nid_str, message = message.split(' ', maxsplit=1)
+        notification = Notification(code, int(nid_str), message, lines)
+        self._acks.put(notification.nid)
+
+        with self._lock:
+            if notification.nid in self._seen:
+                return True
+            self._seen.append(notification.nid)
+            callbacks = list(self._callbacks)
+
+        for callback in callbacks:
+            try:
+                callback(notification)
+            except Exception:
+                pass
+
+        return True
+
+    def _acknowledge(self) -> None:
+        # Acknowledged from own thread, the receiver thread must keep receiving
+        # while PUSHACK waits for its reply.
+        while True:
+            nid = self._acks.get()
+            try:
+                self.client.command('PUSHACK', {'nid': nid})
+            except AnidbError:
+                pass
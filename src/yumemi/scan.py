@@ -0,0 +1,109 @@
+import os
+import stat
+import typing as t
+
+import attrs
+
+
+VIDEO_EXTENSIONS = frozenset({
+    '.3gp', '.asf', '.avi', '.divx', '.flv', '.m2ts', '.m4v', '.mkv', '.mov',
+    '.mp4', '.mpeg', '.mpg', '.ogm', '.ogv', '.rm', '.rmvb', '.ts', '.webm',
+    '.wmv',
+})
+"""Extensions of files that are picked up when scanning directories."""
+
+
+def read_paths0(stream: t.BinaryIO, chunk_size: int = 64 * 1024) -> t.Iterator[str]:
+    """
+    Read null-delimited paths (eg. output of ``find -print0``) from a binary
+    stream. Paths are yielded as soon as they are read.
+    """
+    rest = b''
+    while chunk := stream.read(chunk_size):
+        *paths, rest = (rest + chunk).split(b'\0')
+        for path in paths:
+            if path:
+                yield os.fsdecode(path)
+    if rest:
+        yield os.fsdecode(rest)
+
+
+@attrs.define
+class Scanner:
+    """
+    Lazily expand paths to files.
+
+    Directories are scanned with :func:`os.scandir` only when `recursive` is
+    set, and only files with one of `extensions` and at least `min_size`
+    bytes are taken from them. Paths of files given explicitly are taken as
+    they are.
+
+    Each file is yielded only once, even if it's reachable through several
+    hardlinks.
+    """
+
+    recursive: bool = False
+    extensions: t.Optional[frozenset[str]] = VIDEO_EXTENSIONS
+    """Lower-case extensions including the dot, ``None`` to take all files."""
+    min_size: int = 0
+    onerror: t.Optional[t.Callable[[str, Exception], None]] = None
+    """Called with a path and an exception for paths that can't be used."""
+
+    _seen: set[tuple[int, int]] = attrs.field(init=False, factory=set)
+
+    def _error(self, path: str, exc: Exception) -> None:
+        if self.onerror is not None:
+            self.onerror(path, exc)
+
+    def _first_link(self, st: os.stat_result) -> bool:
+        key = (st.st_dev, st.st_ino)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        return True
+
+    def _match(self, name: str, st: os.stat_result) -> bool:
+        if st.st_size < self.min_size:
+            return False
+        if self.extensions is None:
+            return True
+        return os.path.splitext(name)[1].lower() in self.extensions
+
+    def scan(self, paths: t.Iterable[str]) -> t.Iterator[str]:
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                self._error(path, e)
+                continue
+
+            if stat.S_ISDIR(st.st_mode):
+                if self.recursive:
+                    yield from self._scan_dir(path)
+                else:
+                    self._error(path, IsADirectoryError(f'{path} is a directory'))
+            elif stat.S_ISREG(st.st_mode):
+                if self._first_link(st):
+                    yield path
+            else:
+                self._error(path, ValueError(f'{path} is not a regular file'))
+
+    def _scan_dir(self, path: str) -> t.Iterator[str]:
+        try:
+            with os.scandir(path) as it:
+                # Sorted so the order does not depend on the file system.
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            self._error(path, e)
+            return
+
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._scan_dir(entry.path)
+                elif entry.is_file():
+                    st = entry.stat()
+                    if self._match(entry.name, st) and self._first_link(st):
+                        yield entry.path
+            except OSError as e:
+                self._error(entry.path, e)
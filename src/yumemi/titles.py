@@ -0,0 +1,331 @@
+"""
+Offline search in the `anime titles dump`_ published by AniDB, so looking up
+an anime ID by its title doesn't cost any API packets.
+
+.. _anime titles dump: https://wiki.anidb.net/API#Anime_Titles
+
+Example::
+
+    index = TitleIndex.open('anime-titles.dat.gz')
+    for match in index.search('shingeki no kyojin'):
+        print(match.aid, match.title, match.score)
+"""
+
+import array
+import bisect
+import collections
+import gzip
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import typing as t
+import unicodedata
+
+import attrs
+
+
+_MAGIC = b'YUMTITL1'
+# Magic, byte order, dump size, dump mtime, titles, grams, postings, strings,
+# padded to keep the following sections aligned.
+_HEADER = struct.Struct('<8sBxxxqqIIIIxxxx')
+
+MAX_POSTINGS = 2048
+"""Entries of posting lists scanned by a search at most."""
+
+# Title types in the dump.
+TITLE_PRIMARY = 1
+TITLE_SYNONYM = 2
+TITLE_SHORT = 3
+TITLE_OFFICIAL = 4
+
+
+def normalize(title: str) -> str:
+    """
+    Normalize title for matching: compatibility characters are unified, case
+    folded, diacritics removed from latin letters (macrons in romaji) and
+    punctuation replaced by spaces.
+    """
+    chars: list[str] = []
+    for char in unicodedata.normalize('NFKD', title.casefold()):
+        category = unicodedata.category(char)
+        if category == 'Mn' and chars and chars[-1].isascii():
+            continue
+        if category[0] in 'PSZC':
+            char = ' '
+        chars.append(char)
+    return ' '.join(unicodedata.normalize('NFKC', ''.join(chars)).split())
+
+
+def _grams(normalized: str) -> set[int]:
+    """
+    Trigrams of the normalized title, each packed to one integer (three code
+    points, 21 bits each).
+    """
+    padded = f' {normalized} '
+    return {
+        (ord(padded[i]) << 42) | (ord(padded[i + 1]) << 21) | ord(padded[i + 2])
+        for i in range(len(padded) - 2)
+    }
+
+
+def read_dump(path: str) -> t.Iterator[tuple[int, int, str, str]]:
+    """
+    Read ``aid|type|language|title`` lines of the dump, gzipped or plain.
+    """
+    with open(path, 'rb') as f:
+        gzipped = f.read(2) == b'\x1f\x8b'
+    opener = gzip.open if gzipped else open
+    with opener(path, 'rt', encoding='UTF-8') as f:  # type: ignore[operator]
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            aid, type_, language, title = line.rstrip('\n').split('|', maxsplit=3)
+            yield int(aid), int(type_), language, title
+
+
+@attrs.define
+class Match:
+    aid: int
+    title: str
+    """Best matching title of the anime."""
+    score: float
+    """Similarity of the titles, from 0 to 1."""
+
+
+def build(dump_path: str, index_path: str) -> None:
+    """Build the index file from the dump."""
+    dump_stat = os.stat(dump_path)
+
+    aids = array.array('I')
+    title_offsets = array.array('I', [0])
+    gram_counts = array.array('I')
+    strings = bytearray()
+    postings_by_gram: dict[int, array.array] = collections.defaultdict(
+        lambda: array.array('I'))
+
+    for title_id, (aid, _, _, title) in enumerate(read_dump(dump_path)):
+        title_grams = _grams(normalize(title))
+        aids.append(aid)
+        strings += title.encode('UTF-8')
+        title_offsets.append(len(strings))
+        gram_counts.append(len(title_grams))
+        for gram in title_grams:
+            postings_by_gram[gram].append(title_id)
+
+    grams = array.array('Q', sorted(postings_by_gram))
+    gram_offsets = array.array('I', [0])
+    postings = array.array('I')
+    for gram in grams:
+        postings.extend(postings_by_gram[gram])
+        gram_offsets.append(len(postings))
+
+    header = _HEADER.pack(
+        _MAGIC,
+        sys.byteorder == 'little',
+        dump_stat.st_size,
+        dump_stat.st_mtime_ns,
+        len(aids),
+        len(grams),
+        len(postings),
+        len(strings),
+    )
+
+    # Written to a temporary file and moved over the old index, so readers
+    # with the old index mapped are not affected.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            # Grams first, the header keeps them 8 bytes aligned.
+            for section in (grams, aids, title_offsets, gram_counts, gram_offsets,
+                            postings):
+                section.tofile(f)
+            f.write(strings)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@attrs.define
+class TitleIndex:
+    """
+    Memory mapped trigram index of anime titles.
+
+    Use :meth:`open` to create the index, it's built from the dump when the
+    index file does not exist or the dump has changed since.
+    """
+
+    dump_path: str
+    index_path: str
+
+    _mmap: t.Optional[mmap.mmap] = attrs.field(init=False, default=None)
+    _dump_stat: tuple[int, int] = attrs.field(init=False, default=(0, 0))
+    _grams: memoryview = attrs.field(init=False)
+    _aids: memoryview = attrs.field(init=False)
+    _title_offsets: memoryview = attrs.field(init=False)
+    _gram_counts: memoryview = attrs.field(init=False)
+    _gram_offsets: memoryview = attrs.field(init=False)
+    _postings: memoryview = attrs.field(init=False)
+    _strings: memoryview = attrs.field(init=False)
+
+    def __attrs_post_init__(self):
+        self._clear()
+
+    @classmethod
+    def open(cls, dump_path: str,
+             index_path: t.Optional[str] = None) -> 'TitleIndex':
+        """
+        Open index of the dump, by default stored next to the dump with
+        ``.idx`` suffix.
+        """
+        index = cls(dump_path, index_path or dump_path + '.idx')
+        index.reload()
+        return index
+
+    def reload(self) -> None:
+        """Rebuild the index if the dump has changed and map it again."""
+        dump_stat = os.stat(self.dump_path)
+        dump_key = (dump_stat.st_size, dump_stat.st_mtime_ns)
+        if self._mmap is not None and self._dump_stat == dump_key:
+            return
+
+        if not self._load(dump_key):
+            build(self.dump_path, self.index_path)
+            if not self._load(dump_key):
+                raise RuntimeError(f'Invalid index {self.index_path}')
+
+    def _load(self, dump_key: tuple[int, int]) -> bool:
+        try:
+            with open(self.index_path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+
+        if len(mm) < _HEADER.size:
+            mm.close()
+            return False
+        (magic, little_endian, dump_size, dump_mtime, n_titles, n_grams,
+         n_postings, n_strings) = _HEADER.unpack_from(mm)
+        if (magic != _MAGIC
+                or little_endian != (sys.byteorder == 'little')
+                or (dump_size, dump_mtime) != dump_key):
+            mm.close()
+            return False
+
+        self.close()
+
+        view = memoryview(mm)
+        offset = _HEADER.size
+
+        def section(typecode: str, count: int) -> memoryview:
+            nonlocal offset
+            size = count * array.array(typecode).itemsize
+            data = view[offset:offset + size].cast(typecode)  # type: ignore[call-overload]
+            offset += size
+            return data
+
+        self._grams = section('Q', n_grams)
+        self._aids = section('I', n_titles)
+        self._title_offsets = section('I', n_titles + 1)
+        self._gram_counts = section('I', n_titles)
+        self._gram_offsets = section('I', n_grams + 1)
+        self._postings = section('I', n_postings)
+        self._strings = view[offset:offset + n_strings]
+
+        self._mmap = mm
+        self._dump_stat = dump_key
+        return True
+
+    def _clear(self) -> None:
+        """Empty index, until the index file is loaded."""
+        empty = memoryview(b'')
+        self._grams = empty.cast('Q')
+        self._aids = empty.cast('I')
+        self._title_offsets = empty.cast('I')
+        self._gram_counts = empty.cast('I')
+        self._gram_offsets = empty.cast('I')
+        self._postings = empty.cast('I')
+        self._strings = empty
+
+    def close(self) -> None:
+        if self._mmap is None:
+            return
+        for name in ('_grams', '_aids', '_title_offsets', '_gram_counts',
+                     '_gram_offsets', '_postings', '_strings'):
+            getattr(self, name).release()
+        self._clear()
+        self._mmap.close()
+        self._mmap = None
+
+    def __len__(self) -> int:
+        return len(self._aids)
+
+    def _title(self, title_id: int) -> str:
+        start = self._title_offsets[title_id]
+        end = self._title_offsets[title_id + 1]
+        return bytes(self._strings[start:end]).decode('UTF-8')
+
+    def search(self, query: str, limit: int = 10, min_score: float = 0.3,
+               max_postings: int = MAX_POSTINGS) -> list[Match]:
+        """
+        Find anime with titles similar to the `query`, best matches first.
+
+        Titles are compared by their trigrams (Dice coefficient), so the query
+        may contain typos, missing words or different word order.
+
+        Candidates are found by the query's rarest trigrams, at most
+        `max_postings` entries of their posting lists are scanned, so common
+        trigrams (eg. `` no``) don't slow the search down. Other trigrams are
+        looked up only for the best candidates, a query of only very common
+        trigrams may miss some matches.
+        """
+        query_grams = _grams(normalize(query))
+        if not query_grams:
+            return []
+
+        ranges = []
+        for gram in query_grams:
+            i = bisect.bisect_left(self._grams, gram)  # type: ignore[arg-type]
+            if i < len(self._grams) and self._grams[i] == gram:
+                ranges.append((self._gram_offsets[i], self._gram_offsets[i + 1]))
+        ranges.sort(key=lambda r: r[1] - r[0])
+
+        # Number of grams each title has in common with the query.
+        common: collections.Counter[int] = collections.Counter()
+        budget = max_postings
+        scanned = 0
+        for start, end in ranges:
+            if scanned and end - start > budget:
+                break
+            common.update(self._postings[start:min(end, start + budget)])
+            budget -= min(end - start, budget)
+            scanned += 1
+        if scanned < len(ranges):
+            # Look up the best candidates in the other lists, they're sorted.
+            candidates = common.most_common(limit * 4)
+            common = collections.Counter(dict(candidates))
+            for start, end in ranges[scanned:]:
+                for title_id, _ in candidates:
+                    i = bisect.bisect_left(
+                        self._postings, title_id, start, end)  # type: ignore[arg-type]
+                    if i < end and self._postings[i] == title_id:
+                        common[title_id] += 1
+
+        best: dict[int, tuple[float, int]] = {}
+        for title_id, count in common.items():
+            score = 2 * count / (len(query_grams) + self._gram_counts[title_id])
+            if score < min_score:
+                continue
+            aid = self._aids[title_id]
+            if aid not in best or best[aid][0] < score:
+                best[aid] = (score, title_id)
+
+        top = heapq.nlargest(limit, best.items(), key=lambda item: item[1][0])
+        return [
+            Match(aid=aid, title=self._title(title_id), score=score)
+            for aid, (score, title_id) in top
+        ]
@@ -0,0 +1,77 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import typing as t
+
+import attrs
+
+
+@attrs.define
+class Tracer:
+    """
+    Records spans in the Chrome trace event format, the trace can be opened in
+    Perfetto or ``chrome://tracing``.
+
+    Pass the tracer to :class:`~yumemi.Client` to record every command, rate
+    limiter delay, send and receive.
+    """
+
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _events: list[dict[str, t.Any]] = attrs.field(init=False, factory=list)
+    _threads: set[int] = attrs.field(init=False, factory=set)
+    _origin: int = attrs.field(init=False, factory=time.perf_counter_ns)
+
+    def _now(self) -> float:
+        """Microseconds since the tracer was created."""
+        return (time.perf_counter_ns() - self._origin) / 1000
+
+    def _add(self, event: dict[str, t.Any]) -> None:
+        thread = threading.current_thread()
+        event['pid'] = os.getpid()
+        event['tid'] = thread.ident
+        with self._lock:
+            if thread.ident not in self._threads:
+                self._threads.add(t.cast(int, thread.ident))
+                self._events.append({
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': event['pid'],
+                    'tid': event['tid'],
+                    'args': {'name': thread.name},
+                })
+            self._events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = '',
+             **args: t.Any) -> t.Iterator[dict[str, t.Any]]:
+        """
+        Record duration of the ``with`` block. Yields dictionary of the span
+        arguments, which may be updated inside the block.
+        """
+        start = self._now()
+        try:
+            yield args
+        finally:
+            self._add({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': start,
+                'dur': self._now() - start,
+                'args': args,
+            })
+
+    def dump(self, fp: t.TextIO) -> None:
+        """Write the trace as JSON to a file object."""
+        with self._lock:
+            json.dump({'traceEvents': self._events, 'displayTimeUnit': 'ms'}, fp)
+
+
+def span(tracer: t.Optional[Tracer], name: str, category: str = '',
+         **args: t.Any) -> t.ContextManager[dict[str, t.Any]]:
+    """:meth:`Tracer.span` if `tracer` is set, otherwise does nothing."""
+    if tracer is None:
+        return contextlib.nullcontext(args)
+    return tracer.span(name, category, **args)
@@ -0,0 +1,124 @@
+"""
+Negative cache of files AniDB doesn't know (``320 NO SUCH FILE``), so they
+are not sent again on every run.
+
+Raw or not yet released files may become known later, each file is checked
+again after a growing interval (by default 1 hour, 1 day and then every
+week) or whenever the caller decides to ignore the cache.
+"""
+
+import json
+import os
+import threading
+import time
+import typing as t
+
+import attrs
+
+
+BACKOFF = (60 * 60, 24 * 60 * 60, 7 * 24 * 60 * 60)
+"""Seconds to wait before the first, second, ... check again."""
+
+Key = tuple[str, int]
+
+
+@attrs.define
+class UnknownFiles:
+    """
+    ED2K hashes and sizes of unknown files with the number of failed checks
+    and the time of the last one.
+
+    Example::
+
+        unknown = UnknownFiles('unknown.json')
+        if unknown.should_check(ed2k, size):
+            result = client.command('MYLISTADD', {'ed2k': ed2k, 'size': size})
+            if result.code == 320:
+                unknown.failed(ed2k, size)
+            else:
+                unknown.found(ed2k, size)
+        unknown.save()
+    """
+
+    path: t.Optional[str] = None
+    """File the cache is loaded from and saved to, ``None`` to keep it in memory."""
+    backoff: tuple[float, ...] = BACKOFF
+
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _files: dict[Key, tuple[int, float]] = attrs.field(init=False, factory=dict)
+
+    def __attrs_post_init__(self):
+        if self.path is not None:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def __contains__(self, key: Key) -> bool:
+        return self._key(*key) in self._files
+
+    @staticmethod
+    def _key(ed2k: str, size: int) -> Key:
+        return ed2k.lower(), int(size)
+
+    def _delay(self, failures: int) -> float:
+        return self.backoff[min(failures, len(self.backoff)) - 1]
+
+    def next_check(self, ed2k: str, size: int) -> t.Optional[float]:
+        """Time (:func:`time.time`) of the next check, ``None`` if not unknown."""
+        with self._lock:
+            item = self._files.get(self._key(ed2k, size))
+        if item is None:
+            return None
+        failures, checked = item
+        return checked + self._delay(failures)
+
+    def should_check(self, ed2k: str, size: int) -> bool:
+        """If the file is not known to be unknown, or it's time to check again."""
+        next_check = self.next_check(ed2k, size)
+        return next_check is None or time.time() >= next_check
+
+    def failed(self, ed2k: str, size: int) -> float:
+        """Record a check which found the file unknown, returns the next delay."""
+        key = self._key(ed2k, size)
+        with self._lock:
+            failures = self._files.get(key, (0, 0.0))[0] + 1
+            self._files[key] = (failures, time.time())
+        return self._delay(failures)
+
+    def found(self, ed2k: str, size: int) -> None:
+        """Forget the file, AniDB knows it."""
+        with self._lock:
+            self._files.pop(self._key(ed2k, size), None)
+
+    def _load(self) -> None:
+        assert self.path is not None
+        try:
+            with open(self.path) as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            # Missing or damaged, start empty.
+            return
+        with self._lock:
+            for item in items:
+                try:
+                    key = self._key(str(item['ed2k']), item['size'])
+                    self._files[key] = (max(int(item['failures']), 1),
+                                        float(item['checked']))
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+    def save(self) -> None:
+        """Write the cache to `path`, it's replaced atomically."""
+        if self.path is None:
+            return
+        with self._lock:
+            items = [
+                {'ed2k': ed2k, 'size': size, 'failures': failures,
+                 'checked': checked}
+                for (ed2k, size), (failures, checked) in self._files.items()
+            ]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(items, f)
+        os.replace(tmp_path, self.path)
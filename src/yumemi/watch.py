@@ -0,0 +1,231 @@
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+import typing as t
+from stat import S_ISREG
+
+import attrs
+
+
+# Flags from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct('iIII')
+
+
+def _load_libc() -> t.Optional[ctypes.CDLL]:
+    name = ctypes.util.find_library('c')
+    if not name:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    return libc
+
+
+_LIBC = _load_libc()
+
+
+def inotify_available() -> bool:
+    return _LIBC is not None
+
+
+def _stat(path: str) -> t.Optional[tuple[int, int]]:
+    """Size and modification time of a regular file, ``None`` otherwise."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not S_ISREG(stat.st_mode):
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class Inotify:
+    """
+    Minimal inotify binding, reports names of files changed in a directory
+    (or the file itself when `path` is a file).
+    """
+
+    def __init__(self, path: str, mask: int):
+        assert _LIBC is not None
+        self._fd = _LIBC.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        if _LIBC.inotify_add_watch(self._fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, os.strerror(errno), path)
+
+    def read(self, timeout: float) -> t.Optional[list[str]]:
+        """
+        Wait for events at most `timeout` seconds.
+
+        Returns:
+            Names of changed files or ``None`` if the event queue overflowed
+            and some events were lost.
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+
+        buf = os.read(self._fd, 64 * 1024)
+        names = []
+        offset = 0
+        while offset < len(buf):
+            _, mask, _, length = _EVENT.unpack_from(buf, offset)
+            offset += _EVENT.size
+            name = buf[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if not mask & IN_ISDIR:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class _Poller:
+    """Fallback for :class:`Inotify` which periodically scans the directory."""
+
+    def __init__(self, path: str, interval: float):
+        self._path = path
+        self._interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        with os.scandir(self._path) as it:
+            for entry in it:
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    pass
+        return snapshot
+
+    def read(self, timeout: float) -> t.Optional[list[str]]:
+        time.sleep(min(timeout, self._interval))
+        snapshot = self._scan()
+        names = [
+            name
+            for name, stat in snapshot.items()
+            if self._snapshot.get(name) != stat
+        ]
+        self._snapshot = snapshot
+        return names
+
+    def close(self) -> None:
+        pass
+
+
+@attrs.define
+class Watcher:
+    """
+    Watch a directory for new files and yield them once they are complete.
+
+    Files are reported when they are closed after writing or moved into the
+    directory (inotify), or when their size or modification time changes
+    (polling fallback). A file is yielded after it has not changed for
+    `settle` seconds, so files that are still being written are not picked up
+    too early.
+
+    Ready files are put into a queue of at most `queue_size` items. When the
+    consumer can't keep up, the watcher blocks and events wait in the kernel
+    instead of piling up in memory.
+    """
+
+    path: str
+    settle: float = 5
+    queue_size: int = 16
+    poll: bool = False
+    """Use polling even if inotify is available."""
+    poll_interval: float = 2
+
+    _queue: queue.Queue = attrs.field(init=False)
+    _closed: threading.Event = attrs.field(init=False, factory=threading.Event)
+    _thread: t.Optional[threading.Thread] = attrs.field(init=False, default=None)
+
+    def __attrs_post_init__(self):
+        self._queue = queue.Queue(self.queue_size)
+
+    def _source(self) -> t.Union[Inotify, _Poller]:
+        if not self.poll and inotify_available():
+            return Inotify(self.path, IN_CLOSE_WRITE | IN_MOVED_TO)
+        return _Poller(self.path, self.poll_interval)
+
+    def start(self) -> None:
+        """Start watching the directory in a background thread."""
+        source = self._source()
+        self._thread = threading.Thread(target=self._run, args=(source,), daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._closed.set()
+
+    def __iter__(self) -> t.Iterator[str]:
+        if self._thread is None:
+            self.start()
+        while not self._closed.is_set():
+            try:
+                yield self._queue.get(timeout=1)
+            except queue.Empty:
+                pass
+
+    def _put(self, path: str) -> None:
+        while not self._closed.is_set():
+            try:
+                self._queue.put(path, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def _run(self, source: t.Union[Inotify, _Poller]) -> None:
+        # Path -> (time when the file is considered complete, file stat).
+        pending: dict[str, tuple[float, t.Optional[tuple[int, int]]]] = {}
+
+        try:
+            while not self._closed.is_set():
+                now = time.monotonic()
+                deadline = min((d for d, _ in pending.values()), default=now + 1)
+                names = source.read(max(deadline - now, 0))
+                if names is None:
+                    # Events were lost, treat every file as changed.
+                    names = os.listdir(self.path)
+
+                now = time.monotonic()
+                for name in names:
+                    path = os.path.join(self.path, name)
+                    pending[path] = (now + self.settle, _stat(path))
+
+                for path, (deadline, stat) in list(pending.items()):
+                    if deadline > now:
+                        continue
+                    current_stat = _stat(path)
+                    if current_stat is None:
+                        del pending[path]
+                    elif current_stat != stat:
+                        # Still being written, wait until it settles.
+                        pending[path] = (now + self.settle, current_stat)
+                    else:
+                        del pending[path]
+                        self._put(path)
+        finally:
+            source.close()
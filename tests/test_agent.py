@@ -0,0 +1,126 @@
+import socket
+import threading
+
+import pytest
+
+import yumemi
+from yumemi.agent import AgentClient, Coordinator, HashAgent, parse_agent
+
+
+ED2K = '47c61a0fa8738ba77308a8a600f88e4b'
+
+
+@pytest.fixture
+def start_agent():
+    agents = []
+
+    def start(root):
+        agent = HashAgent(str(root), port=0)
+        agent.listen()
+        threading.Thread(target=agent.serve_forever, daemon=True).start()
+        agents.append(agent)
+        return agent
+
+    yield start
+    for agent in agents:
+        agent.close()
+
+
+def test_parse_agent():
+    assert parse_agent('/mnt/nas=nas.local') == ('/mnt/nas', ('nas.local', 9001))
+    assert parse_agent('/mnt/a=b=10.0.0.2:1') == ('/mnt/a=b', ('10.0.0.2', 1))
+    with pytest.raises(ValueError):
+        parse_agent('nas.local:9001')
+
+
+def test_agent_client(tmp_path, start_agent):
+    (tmp_path / 'a.mkv').write_bytes(b'\x00')
+    agent = start_agent(tmp_path)
+
+    client = AgentClient('127.0.0.1', agent.port)
+    futures = [client.hash('a.mkv'), client.hash('missing.mkv'), client.hash('../x')]
+
+    result = futures[0].result(timeout=5)
+    assert result.size == 1
+    assert result.ed2k == ED2K
+    assert result.mtime_ns == (tmp_path / 'a.mkv').stat().st_mtime_ns
+    with pytest.raises(yumemi.ClientError):
+        futures[1].result(timeout=5)
+    with pytest.raises(yumemi.ClientError, match='outside'):
+        futures[2].result(timeout=5)
+
+    client.close()
+
+
+def test_coordinator(tmp_path, start_agent):
+    nas1 = tmp_path / 'nas1'
+    nas2 = tmp_path / 'nas2'
+    for directory in (nas1, nas2):
+        directory.mkdir()
+        (directory / 'a.mkv').write_bytes(b'\x00')
+    (tmp_path / 'local.mkv').write_bytes(b'\x00')
+    agent1 = start_agent(nas1)
+    # Agent sees a different file than the coordinator.
+    agent2_root = tmp_path / 'agent2'
+    agent2_root.mkdir()
+    (agent2_root / 'a.mkv').write_bytes(b'\x00\x00')
+    agent2 = start_agent(agent2_root)
+    errors = []
+
+    coordinator = Coordinator(
+        {
+            str(nas1): ('127.0.0.1', agent1.port),
+            str(nas2): ('127.0.0.1', agent2.port),
+        },
+        window=2,
+        onerror=lambda path, e: errors.append(path),
+    )
+    paths = [
+        (str(nas1 / 'a.mkv'), None),
+        (str(nas2 / 'a.mkv'), None),
+        (str(tmp_path / 'local.mkv'), None),
+        (str(nas1 / 'known.mkv'), 'known'),
+    ]
+
+    assert list(coordinator.hashes(paths)) == [
+        (str(nas1 / 'a.mkv'), ED2K),
+        (str(nas2 / 'a.mkv'), None),
+        (str(tmp_path / 'local.mkv'), None),
+        (str(nas1 / 'known.mkv'), 'known'),
+    ]
+    assert errors == [str(nas2 / 'a.mkv')]
+
+    coordinator.close()
+
+
+def test_agent_client_unavailable(mocker):
+    create_connection = mocker.patch(
+        'socket.create_connection', side_effect=ConnectionRefusedError)
+    client = AgentClient('127.0.0.1', 1)
+
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            client.hash('a.mkv').result(timeout=5)
+    # Not connected again for every file.
+    assert create_connection.call_count == 1
+
+
+def test_coordinator_hung_agent(tmp_path):
+    server = socket.create_server(('127.0.0.1', 0))
+    (tmp_path / 'a.mkv').write_bytes(b'\x00')
+    (tmp_path / 'b.mkv').write_bytes(b'\x00')
+    errors = []
+
+    # Connection is accepted but never answered.
+    coordinator = Coordinator(
+        {str(tmp_path): ('127.0.0.1', server.getsockname()[1])},
+        timeout=0.1,
+        onerror=lambda path, e: errors.append(type(e)),
+    )
+    paths = [(str(tmp_path / 'a.mkv'), None), (str(tmp_path / 'b.mkv'), None)]
+
+    assert list(coordinator.hashes(paths)) == paths
+    assert errors == [TimeoutError, TimeoutError]
+
+    coordinator.close()
+    server.close()
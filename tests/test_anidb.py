@@ -1,3 +1,5 @@
+import socket
+
 import pytest
 
 import yumemi
@@ -110,7 +112,7 @@ def test_client_command(connection_mock, expected_result, send_data, recv_data):
     assert result.message == expected_result.message
     assert result.data == expected_result.data
 
-    connection_mock.send.assert_called_with(send_data)
+    connection_mock.send.assert_called_with(send_data, codec=client._codec)
 
 
 def test_client_command_error(connection_mock):
@@ -121,3 +123,93 @@ def test_client_command_error(connection_mock):
 
     with pytest.raises(yumemi.ServerError):
         client.command('PING')
+
+
+def test_client_connection(mocker):
+    connection = mocker.Mock(spec=yumemi.Connection)
+    connection.recv.return_value = b'300 PONG'
+
+    client = yumemi.Client('test', 1, connection=connection)
+
+    assert client.ping()
+    connection.send.assert_called_with(b'PING', codec=client._codec)
+
+
+def test_client_circuit_breaker(mocker, connection_mock):
+    monotonic = mocker.patch('time.monotonic', return_value=100)
+    connection_mock.recv.side_effect = yumemi.ServerError('no data')
+
+    client = yumemi.Client('test', 1, failure_threshold=2, cooldown=30)
+
+    for _ in range(2):
+        with pytest.raises(yumemi.ServerError, match='no data'):
+            client.command('PING')
+    assert connection_mock.send.call_count == 2
+
+    # Open, fails without sending.
+    with pytest.raises(yumemi.ServerError, match='unavailable'):
+        client.command('PING')
+    assert not client.ping()
+    assert connection_mock.send.call_count == 2
+
+    # Failed probe opens the circuit again.
+    monotonic.return_value = 131
+    with pytest.raises(yumemi.ServerError, match='no data'):
+        client.command('VERSION')
+    connection_mock.send.assert_called_with(b'PING', codec=client._codec)
+    with pytest.raises(yumemi.ServerError, match='unavailable'):
+        client.command('VERSION')
+
+    monotonic.return_value = 162
+    connection_mock.recv.side_effect = [b'300 PONG', b'998 VERSION']
+    assert client.command('VERSION').code == 998
+    assert connection_mock.send.call_args_list[-2:] == [
+        mocker.call(b'PING', codec=client._codec),
+        mocker.call(b'VERSION', codec=client._codec),
+    ]
+
+
+@pytest.fixture
+def udp_server():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    yield server
+    server.close()
+
+
+def test_connection_resolve_cache(mocker, udp_server):
+    getaddrinfo = mocker.patch('socket.getaddrinfo')
+    getaddrinfo.return_value = [
+        (socket.AF_INET, socket.SOCK_DGRAM, 0, '', udp_server.getsockname()),
+    ]
+    connection = yumemi.Connection(local_port=0)
+
+    connection.send(b'PING')
+    connection.send(b'PING')
+    assert getaddrinfo.call_count == 1
+
+    # Expired address is resolved again, last known address is used when
+    # resolving fails.
+    connection._address_time -= connection.dns_ttl
+    getaddrinfo.side_effect = socket.gaierror('Temporary failure')
+    connection.send(b'PING')
+    assert getaddrinfo.call_count == 2
+
+    assert udp_server.recv(1400) == b'PING'
+
+
+def test_connection_resolve_error(mocker):
+    mocker.patch('socket.getaddrinfo').side_effect = socket.gaierror('Failure')
+    connection = yumemi.Connection(local_port=0)
+
+    with pytest.raises(yumemi.ServerError):
+        connection.send(b'PING')
+
+
+def test_connection_port_in_use(mocker, udp_server):
+    close = mocker.spy(socket.socket, 'close')
+
+    with pytest.raises(OSError):
+        yumemi.Connection(local_port=udp_server.getsockname()[1])
+    # Socket of the failed connection is not leaked.
+    assert close.call_count == 1
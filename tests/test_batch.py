@@ -0,0 +1,136 @@
+import time
+
+import pytest
+
+import yumemi
+from yumemi.batch import mylistadd_many
+from yumemi.unknown import UnknownFiles
+
+
+def make_result(command, code, message):
+    return yumemi.Result(
+        command=command,
+        params={},
+        code=code,
+        message=message,
+        data=((),),
+    )
+
+
+def test_mylistadd_many(mocker, tmp_path):
+    (tmp_path / 'a.mkv').write_bytes(b'\x00')
+    (tmp_path / 'b.mkv').write_bytes(b'')
+    (tmp_path / 'c.mkv').write_bytes(b'\x00')
+
+    client = mocker.Mock(spec=yumemi.Client)
+    client.command.side_effect = [
+        make_result('MYLISTADD', 210, 'MYLIST ENTRY ADDED'),
+        make_result('FILE', 220, 'FILE'),
+        make_result('MYLISTADD', 320, 'NO SUCH FILE'),
+    ]
+
+    paths = [str(tmp_path / name) for name in ('a.mkv', 'missing.mkv', 'b.mkv')]
+    results = list(mylistadd_many(
+        client,
+        paths,
+        {'viewed': True},
+        file_params={'fmask': '78', 'amask': '30'},
+        window=2,
+    ))
+
+    assert [r.path for r in results] == paths
+    assert results[0].ed2k == '47c61a0fa8738ba77308a8a600f88e4b'
+    assert results[0].size == 1
+    assert results[0].mylistadd.code == 210
+    assert results[0].file.code == 220
+    assert isinstance(results[1].error, FileNotFoundError)
+    assert results[1].mylistadd is None
+    assert results[2].mylistadd.code == 320
+    assert results[2].file is None
+
+    assert client.command.call_args_list == [
+        mocker.call('MYLISTADD', {
+            'ed2k': '47c61a0fa8738ba77308a8a600f88e4b',
+            'size': 1,
+            'viewed': True,
+        }),
+        mocker.call('FILE', {
+            'ed2k': '47c61a0fa8738ba77308a8a600f88e4b',
+            'size': 1,
+            'fmask': '78',
+            'amask': '30',
+        }),
+        mocker.call('MYLISTADD', {
+            'ed2k': '31d6cfe0d16ae931b73c59d7e0c089c0',
+            'size': 0,
+            'viewed': True,
+        }),
+    ]
+
+
+def test_mylistadd_many_lazy(mocker, tmp_path):
+    (tmp_path / 'a.mkv').write_bytes(b'\x00')
+    consumed = []
+
+    def paths():
+        for i in range(10):
+            consumed.append(i)
+            yield str(tmp_path / 'a.mkv')
+
+    client = mocker.Mock(spec=yumemi.Client)
+    client.command.return_value = make_result('MYLISTADD', 210, 'ADDED')
+
+    results = mylistadd_many(client, paths(), window=3)
+    next(results)
+    # Paths are taken in a thread, wait until it's blocked by the window.
+    for _ in range(100):
+        if len(consumed) == 4:
+            break
+        time.sleep(0.01)
+    results.close()
+    time.sleep(0.05)
+
+    # The first file and the window hashed ahead of it.
+    assert len(consumed) == 4
+
+
+def test_mylistadd_many_unknown(mocker, tmp_path):
+    (tmp_path / 'a.mkv').write_bytes(b'\x00')
+    (tmp_path / 'b.mkv').write_bytes(b'')
+    unknown = UnknownFiles()
+    unknown.failed('31d6cfe0d16ae931b73c59d7e0c089c0', 0)
+
+    client = mocker.Mock(spec=yumemi.Client)
+    client.command.return_value = make_result('MYLISTADD', 320, 'NO SUCH FILE')
+
+    paths = [str(tmp_path / 'a.mkv'), str(tmp_path / 'b.mkv')]
+    results = list(mylistadd_many(client, paths, unknown_files=unknown))
+
+    assert results[0].mylistadd.code == 320
+    assert results[0].next_check > time.time()
+    assert ('47c61a0fa8738ba77308a8a600f88e4b', 1) in unknown
+    # Not sent until it's time to check it again.
+    assert results[1].mylistadd is None
+    assert results[1].next_check > time.time()
+    assert client.command.call_count == 1
+
+    list(mylistadd_many(client, paths, unknown_files=unknown, recheck=True))
+    assert client.command.call_count == 3
+
+
+def test_mylistadd_many_errors(mocker, tmp_path):
+    (tmp_path / 'a.mkv').write_bytes(b'\x00')
+    client = mocker.Mock(spec=yumemi.Client)
+    client.command.side_effect = [
+        yumemi.ServerError('Received no data from the API'),
+        make_result('MYLISTADD', 210, 'MYLIST ENTRY ADDED'),
+        yumemi.ClientError.from_result(make_result('MYLISTADD', 555, 'BANNED')),
+    ]
+
+    results = mylistadd_many(client, [str(tmp_path / 'a.mkv')] * 3)
+    result = next(results)
+    assert isinstance(result.error, yumemi.ServerError)
+    assert result.mylistadd is None
+    assert next(results).mylistadd.code == 210
+    with pytest.raises(yumemi.ClientError):
+        next(results)
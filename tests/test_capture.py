@@ -0,0 +1,128 @@
+import gzip
+import socket
+import threading
+import zlib
+
+import pytest
+
+import yumemi
+from yumemi.anidb import CodecCrypt, CodecPlain
+from yumemi.capture import Recorder, ReplayConnection, read_capture, redact
+
+
+REPLIES = {
+    b'AUTH': b'\0\0' + zlib.compress(b'200 sEsSkEy LOGIN ACCEPTED'),
+    b'FILE': b'220 FILE\n1|2|3',
+    b'LOGOUT': b'203 LOGGED OUT',
+}
+
+
+@pytest.fixture
+def udp_server():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+
+    def serve():
+        while True:
+            try:
+                data, address = server.recvfrom(1400)
+            except OSError:
+                return
+            reply = REPLIES.get(data.split(b' ', 1)[0])
+            if reply is not None:
+                server.sendto(reply, address)
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield server
+    server.close()
+
+
+def test_redact():
+    assert redact('AUTH user=bob&pass=a&amp;b&protover=3') == (
+        'AUTH user=bob&pass=REDACTED&protover=3')
+    assert redact('FILE fid=1&s=sEsSkEy') == 'FILE fid=1&s=REDACTED'
+    assert redact('201 sEsSkEy LOGIN ACCEPTED') == '201 REDACTED LOGIN ACCEPTED'
+    assert redact('209 sAlT ENCRYPTION ENABLED') == '209 REDACTED ENCRYPTION ENABLED'
+    assert redact('220 FILE\n1|pass=2') == '220 FILE\n1|pass=2'
+
+
+def test_record_replay(tmp_path, udp_server):
+    path = str(tmp_path / 'capture.jsonl.gz')
+
+    with Recorder(path) as recorder:
+        connection = yumemi.Connection(
+            server_host='127.0.0.1',
+            server_port=udp_server.getsockname()[1],
+            local_port=0,
+            short_term_delay=0,
+            long_term_delay=0,
+            recorder=recorder,
+        )
+        connection._socket.settimeout(0.1)
+        client = yumemi.Client('test', 1, connection=connection)
+        client.auth('bob', 'secret')
+        client.command('FILE', {'fid': 1})
+        with pytest.raises(yumemi.ServerError):
+            client.command('UPTIME')
+        client.logout()
+        connection.close()
+
+    with gzip.open(path, 'rt') as f:
+        content = f.read()
+    assert 'secret' not in content
+    assert 'sEsSkEy' not in content
+
+    exchanges = list(read_capture(path))
+    assert [e['command'] for e in exchanges] == ['AUTH', 'FILE', 'UPTIME', 'LOGOUT']
+    assert exchanges[1]['request'] == 'FILE fid=1&s=REDACTED'
+    assert exchanges[1]['reply'] == '220 FILE\n1|2|3'
+    assert exchanges[2]['reply'] is None
+
+    connection = ReplayConnection(
+        capture_path=path,
+        short_term_delay=0,
+        long_term_delay=0,
+        latency_scale=0,
+    )
+    client = yumemi.Client('test', 1, connection=connection)
+    client.auth('bob', 'other')
+    assert client.command('FILE', {'fid': 1}).data == (('1', '2', '3'),)
+    with pytest.raises(yumemi.ServerError):
+        client.command('UPTIME')
+    with pytest.raises(yumemi.ClientError, match='expects LOGOUT'):
+        client.command('PING')
+
+
+def test_record_encrypted(tmp_path):
+    path = str(tmp_path / 'capture.jsonl.gz')
+    codec = CodecCrypt('ASCII', 'apikey' + 'sAlT')
+
+    with Recorder(path) as recorder:
+        recorder.sent(b'ENCRYPT user=bob&type=1', CodecPlain('ASCII'))
+        recorder.received(b'209 sAlT ENCRYPTION ENABLED')
+        recorder.sent(codec.encode('AUTH user=bob&pass=secret'), codec)
+        recorder.received(codec.encode('200 sEsSkEy LOGIN ACCEPTED'))
+
+    with gzip.open(path, 'rt') as f:
+        content = f.read()
+    for secret in ['secret', 'sEsSkEy', 'sAlT', '_b64']:
+        assert secret not in content
+
+    exchanges = list(read_capture(path))
+    assert exchanges[1]['request'] == 'AUTH user=bob&pass=REDACTED'
+
+    # Replayed as a plain session.
+    connection = ReplayConnection(capture_path=path, latency_scale=0)
+    client = yumemi.Client('test', 1, connection=connection)
+    assert client.auth('bob', 'other').code == 200
+    connection.close()
+
+
+def test_read_capture_old_version(tmp_path):
+    path = tmp_path / 'capture.jsonl.gz'
+    with gzip.open(path, 'wt') as f:
+        f.write('{"version": 1}\n')
+        f.write('{"command": "AUTH", "request_b64": "", "reply": null}\n')
+
+    with pytest.raises(ValueError, match='older version'):
+        list(read_capture(str(path)))
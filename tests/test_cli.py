@@ -12,13 +12,6 @@ def runner(tmp_path):
         yield runner
 
 
-@pytest.fixture
-def mp_pool_mock(mocker):
-    m = mocker.Mock()
-    mocker.patch('multiprocessing.Pool').return_value = m
-    yield m
-
-
 @pytest.fixture
 def client_mock(mocker):
     m = mocker.Mock(spec=yumemi.Client)
@@ -51,8 +44,7 @@ def client_mock(mocker):
         ),
     ],
 )
-def test_mylistadd(runner, tmp_path, client_mock, mp_pool_mock,
-                   cli_args, mylistadd_params):
+def test_mylistadd(runner, tmp_path, client_mock, cli_args, mylistadd_params):
     client_mock.auth.return_value = yumemi.Result(
         command='',
         params={},
@@ -68,10 +60,6 @@ def test_mylistadd(runner, tmp_path, client_mock, mp_pool_mock,
         data=((1,),),
     )
 
-    mp_pool_mock.imap.return_value = [
-        ('test.mkv', '47c61a0fa8738ba77308a8a600f88e4b', 1),
-    ]
-
     file = tmp_path / 'test.mkv'
     file.write_bytes(b'\x00')
 
@@ -99,3 +87,251 @@ def test_mylistadd(runner, tmp_path, client_mock, mp_pool_mock,
     assert cmd_params['size'] == 1
     for param_key, param_value in mylistadd_params.items():
         assert cmd_params[param_key] == param_value
+
+
+def test_mylistadd_manifest(runner, tmp_path, client_mock):
+    client_mock.command.return_value = yumemi.Result(
+        command='',
+        params={},
+        code=210,
+        message='MYLIST ENTRY ADDED',
+        data=((1,),),
+    )
+
+    file = tmp_path / 'test.mkv'
+    file.write_bytes(b'\x00')
+
+    result = runner.invoke(
+        yumemi.cli.main,
+        ['-u', 'testuser', '-p', 'testpass', '--manifest', str(file)],
+    )
+
+    assert result.exit_code == 0
+    assert (tmp_path / '.yumemi.ed2k').read_text() == (
+        'ed2k://|file|test.mkv|1|47c61a0fa8738ba77308a8a600f88e4b|/ '
+        f'{file.stat().st_mtime_ns}\n'
+    )
+
+
+def test_stream(runner, tmp_path, client_mock):
+    client_mock.command.return_value = yumemi.Result(
+        command='',
+        params={},
+        code=210,
+        message='MYLIST ENTRY ADDED',
+        data=((1,),),
+    )
+    file = tmp_path / 'test.mkv'
+
+    result = runner.invoke(
+        yumemi.cli.main,
+        ['stream', '-u', 'testuser', '-p', 'testpass', '--size', '1', str(file)],
+        input=b'\x00',
+    )
+
+    assert result.exit_code == 0
+    assert file.read_bytes() == b'\x00'
+    client_mock.command.assert_called_with('MYLISTADD', {
+        'ed2k': '47c61a0fa8738ba77308a8a600f88e4b',
+        'size': 1,
+        'state': 1,
+        'viewed': False,
+        'viewdate': 0,
+        'edit': False,
+    })
+
+    # Incomplete stream is not added.
+    client_mock.command.reset_mock()
+    result = runner.invoke(
+        yumemi.cli.main,
+        ['stream', '-u', 'testuser', '-p', 'testpass', '--size', '2',
+         str(tmp_path / 'short.mkv')],
+        input=b'\x00',
+    )
+
+    assert result.exit_code == 1
+    client_mock.command.assert_not_called()
+
+    # Prefetching is only for commands which process many files.
+    result = runner.invoke(
+        yumemi.cli.main,
+        ['stream', '-u', 'testuser', '-p', 'testpass', '--prefetch',
+         str(tmp_path / 'other.mkv')],
+        input=b'\x00',
+    )
+    assert result.exit_code == 2
+
+
+def test_verify(runner, tmp_path):
+    (tmp_path / 'a.mkv').write_bytes(b'\x00')
+    (tmp_path / 'b.mkv').write_bytes(b'\x01')
+    (tmp_path / '.yumemi.ed2k').write_text(
+        'ed2k://|file|a.mkv|1|47c61a0fa8738ba77308a8a600f88e4b|/ 0\n'
+        'ed2k://|file|b.mkv|1|47c61a0fa8738ba77308a8a600f88e4b|/ 0\n'
+        'ed2k://|file|c.mkv|1|47c61a0fa8738ba77308a8a600f88e4b|/ 0\n'
+    )
+
+    result = runner.invoke(yumemi.cli.main, ['verify', str(tmp_path)])
+
+    assert result.exit_code == 1
+    assert f'{tmp_path / "a.mkv"}: ok' in result.output
+    assert f'{tmp_path / "b.mkv"}: changed' in result.output
+    assert f'{tmp_path / "c.mkv"}: missing' in result.output
+
+    # Matching file was recorded with its current mtime and is not rehashed.
+    mtime = (tmp_path / 'a.mkv').stat().st_mtime_ns
+    assert f'a.mkv|1|47c61a0fa8738ba77308a8a600f88e4b|/ {mtime}\n' in (
+        tmp_path / '.yumemi.ed2k').read_text()
+
+
+def test_plan(runner, tmp_path, client_mock):
+    (tmp_path / 'a.mkv').write_bytes(b'\x00' * 1024)
+    (tmp_path / 'b.mkv').write_bytes(b'\x00' * 1024)
+
+    result = runner.invoke(
+        yumemi.cli.main,
+        ['--plan', '--hash-rate', '1K', '-r', str(tmp_path / 'a.mkv'),
+         str(tmp_path / 'b.mkv')],
+    )
+
+    assert result.exit_code == 0
+    assert 'Hashing: 2 files (2.0 KiB), 2s at 1.0 KiB/s' in result.output
+    assert 'Packets: 6 (MYLISTADD and FILE per file, AUTH, LOGOUT)' in result.output
+    assert 'ETA:     2s (short term policy, 2 s per packet)' in result.output
+    assert 'ETA:     4s (long term policy, 4 s per packet)' in result.output
+    client_mock.auth.assert_not_called()
+
+
+def test_edit(runner, tmp_path, client_mock):
+    def command(command, params):
+        if command == 'FILE':
+            epno = {'47c61a0fa8738ba77308a8a600f88e4b': '01'}.get(params['ed2k'], '02')
+            return yumemi.Result(
+                command, params, 220, 'FILE',
+                (('1', '11829', '2', '7172', *[''] * 9, epno, *[''] * 5),),
+            )
+        return yumemi.Result(command, params, 311, 'MYLIST ENTRY EDITED', ())
+
+    client_mock.command.side_effect = command
+    (tmp_path / 'a.mkv').write_bytes(b'\x00')
+    (tmp_path / 'b.mkv').write_bytes(b'\x01')
+
+    result = runner.invoke(
+        yumemi.cli.main,
+        ['edit', '-u', 'testuser', '-p', 'testpass', '-W', '2020-01-01',
+         '--recursive', str(tmp_path)],
+    )
+
+    assert result.exit_code == 0
+    assert [c.args[0] for c in client_mock.command.call_args_list] == \
+        ['FILE', 'FILE', 'MYLISTADD']
+    cmd_params = client_mock.command.call_args.args[1]
+    assert cmd_params['aid'] == '11829'
+    assert cmd_params['gid'] == '7172'
+    assert cmd_params['epno'] == '-2'
+    assert cmd_params['viewed'] is True
+    assert cmd_params['edit'] is True
+    assert 'state' not in cmd_params
+
+    result = runner.invoke(
+        yumemi.cli.main, ['edit', '-u', 'testuser', '-p', 'testpass', str(tmp_path)],
+    )
+    assert result.exit_code == 2
+
+
+def test_mylistadd_unknown_files(runner, tmp_path, client_mock):
+    client_mock.command.return_value = yumemi.Result(
+        command='',
+        params={},
+        code=320,
+        message='NO SUCH FILE',
+        data=(),
+    )
+    file = tmp_path / 'test.mkv'
+    file.write_bytes(b'\x00')
+    args = ['-u', 'testuser', '-p', 'testpass',
+            '--unknown-files', str(tmp_path / 'unknown.json'), str(file)]
+
+    result = runner.invoke(yumemi.cli.main, args)
+    assert result.exit_code == 0
+    assert client_mock.command.call_count == 1
+
+    # Skipped until it's time to check it again.
+    result = runner.invoke(yumemi.cli.main, args)
+    assert result.exit_code == 0
+    assert 'unknown to AniDB' in result.output
+    assert client_mock.command.call_count == 1
+
+    result = runner.invoke(yumemi.cli.main, [*args, '--recheck'])
+    assert result.exit_code == 0
+    assert client_mock.command.call_count == 2
+
+
+def test_mylistadd_errors(runner, tmp_path, client_mock):
+    added = yumemi.Result(command='', params={}, code=210,
+                          message='MYLIST ENTRY ADDED', data=((1,),))
+    banned = yumemi.Result(command='', params={}, code=555, message='BANNED',
+                           data=())
+    files = [tmp_path / f'{name}.mkv' for name in 'abc']
+    for file in files:
+        file.write_bytes(b'\x00')
+    args = ['-u', 'testuser', '-p', 'testpass', *map(str, files)]
+
+    # File which failed is skipped.
+    client_mock.command.side_effect = [
+        yumemi.ServerError('Received no data from the API'), added, added]
+    result = runner.invoke(yumemi.cli.main, args)
+    assert result.exit_code == 0
+    assert client_mock.command.call_count == 3
+
+    # Ban stops the processing.
+    client_mock.command.reset_mock()
+    client_mock.command.side_effect = [
+        added, yumemi.ClientError.from_result(banned), added]
+    result = runner.invoke(yumemi.cli.main, args)
+    assert client_mock.command.call_count == 2
+
+
+def test_mylistadd_unreadable(runner, tmp_path, client_mock, mocker):
+    client_mock.command.return_value = yumemi.Result(
+        command='', params={}, code=210, message='MYLIST ENTRY ADDED',
+        data=((1,),))
+    removed = tmp_path / 'removed.mkv'
+    file = tmp_path / 'test.mkv'
+    removed.write_bytes(b'\x00')
+    file.write_bytes(b'\x00')
+    hash_file = yumemi.hashers.hash_file
+
+    def remove_and_hash(path):
+        # Removed after it was found.
+        if path == str(removed):
+            removed.unlink()
+        return hash_file(path)
+
+    mocker.patch('yumemi.hashers.hash_file', side_effect=remove_and_hash)
+
+    result = runner.invoke(yumemi.cli.main, [
+        '-u', 'testuser', '-p', 'testpass', str(removed), str(file),
+    ])
+
+    assert result.exit_code == 0
+    assert 'removed.mkv\n  - failed' in result.output
+    assert client_mock.command.call_count == 1
+
+
+def test_mylistadd_periodic_save(runner, tmp_path, client_mock, mocker):
+    client_mock.command.return_value = yumemi.Result(
+        command='', params={}, code=320, message='NO SUCH FILE', data=())
+    mocker.patch.object(yumemi.cli, 'SAVE_INTERVAL', -1)
+    save = mocker.spy(yumemi.cli.UnknownFiles, 'save')
+    file = tmp_path / 'test.mkv'
+    file.write_bytes(b'\x00')
+
+    result = runner.invoke(yumemi.cli.main, [
+        '-u', 'testuser', '-p', 'testpass',
+        '--unknown-files', str(tmp_path / 'unknown.json'), str(file),
+    ])
+
+    assert result.exit_code == 0
+    # After the file, and at the end.
+    assert save.call_count == 2
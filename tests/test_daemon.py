@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+import yumemi
+from yumemi.daemon import RemoteClient, Server, _Scheduler
+
+
+@pytest.fixture
+def server(mocker, tmp_path):
+    client = mocker.Mock(spec=yumemi.Client)
+    server = Server(client, str(tmp_path / 'yumemi.sock'))
+    server.listen()
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    yield server
+
+    server.close()
+    thread.join()
+
+
+def test_scheduler_round_robin():
+    scheduler = _Scheduler()
+    for i in range(3):
+        scheduler.put(1, f'a{i}')
+    scheduler.put(2, 'b0')
+    scheduler.put(3, 'c0')
+    scheduler.put(2, 'b1')
+
+    items = [scheduler.get(timeout=0) for _ in range(6)]
+
+    assert items == ['a0', 'b0', 'c0', 'a1', 'b1', 'a2']
+    assert scheduler.get(timeout=0) is None
+
+
+def test_remote_command(server):
+    server.client.command.return_value = yumemi.Result(
+        command='FILE',
+        params={'fid': 1},
+        code=220,
+        message='FILE',
+        data=(('1', 'foo'),),
+    )
+
+    client = RemoteClient(server.path)
+    result = client.command('FILE', {'fid': 1})
+    client.close()
+
+    assert result == server.client.command.return_value
+    server.client.command.assert_called_with('FILE', {'fid': 1})
+
+
+def test_remote_command_error(server):
+    result = yumemi.Result(
+        command='FILE',
+        params={},
+        code=505,
+        message='ILLEGAL INPUT OR ACCESS DENIED',
+        data=(),
+    )
+    server.client.command.side_effect = yumemi.ClientError.from_result(result)
+
+    client = RemoteClient(server.path)
+    with pytest.raises(yumemi.ClientError) as exc_info:
+        client.command('FILE')
+    client.close()
+
+    assert exc_info.value.result == result
+
+
+def test_remote_session_command(server):
+    client = RemoteClient(server.path)
+    with pytest.raises(yumemi.ClientError):
+        client.command('LOGOUT')
+    client.close()
+
+    server.client.command.assert_not_called()
+
+
+def test_remote_command_session_expired(server, mocker):
+    expired = yumemi.Result(
+        command='FILE',
+        params={},
+        code=506,
+        message='INVALID SESSION',
+        data=(),
+    )
+    result = yumemi.Result(command='FILE', params={}, code=220, message='FILE',
+                           data=())
+    server.client.command.side_effect = [
+        yumemi.ClientError.from_result(expired), result]
+    server.login = mocker.Mock()
+
+    client = RemoteClient(server.path)
+    assert client.command('FILE') == result
+    client.close()
+
+    server.login.assert_called_once_with(server.client)
+    assert server.client.command.call_count == 2
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+
+import pytest
+
+from yumemi import _rhash as rhash
+from yumemi import follow
+from yumemi.follow import FollowHasher
+
+
+DATA = bytes(range(256)) * 1024
+
+
+def test_follow_hasher_update(tmp_path):
+    path = tmp_path / 'a.mkv'
+    hasher = FollowHasher(str(path), len(DATA), block_size=4096)
+
+    assert not hasher.update()
+    path.write_bytes(DATA[:100_000])
+    assert not hasher.update()
+    assert hasher.offset == 100_000
+
+    with open(path, 'ab') as f:
+        f.write(DATA[100_000:])
+    assert hasher.update()
+    assert hasher.digest() == rhash.hash_msg(DATA, rhash.ED2K)
+
+
+def test_follow_hasher_too_large(tmp_path):
+    path = tmp_path / 'a.mkv'
+    path.write_bytes(DATA)
+
+    with pytest.raises(ValueError):
+        FollowHasher(str(path), 100).update()
+
+
+def test_follow_hasher_sparse(tmp_path):
+    path = tmp_path / 'a.mkv'
+    with open(path, 'wb') as f:
+        f.write(DATA[:8192])
+        f.truncate(len(DATA))
+    with open(path, 'rb') as f:
+        if os.lseek(f.fileno(), 0, os.SEEK_HOLE) != 8192:
+            pytest.skip('file system does not report holes')
+
+    hasher = FollowHasher(str(path), len(DATA))
+    assert not hasher.update()
+    assert hasher.offset == 8192
+
+    with open(path, 'r+b') as f:
+        f.seek(8192)
+        f.write(DATA[8192:])
+    assert hasher.update()
+    assert hasher.digest() == rhash.hash_msg(DATA, rhash.ED2K)
+
+
+def test_follow_hasher_preallocated(tmp_path):
+    path = tmp_path / 'a.mkv'
+    path.write_bytes(bytes(len(DATA)))
+    warnings = []
+    hasher = FollowHasher(str(path), len(DATA), settle=60,
+                          onwarning=warnings.append)
+
+    assert not hasher.update()
+    assert hasher.offset == 0
+    assert len(warnings) == 1
+
+    # Hashed when it stops changing.
+    path.write_bytes(DATA)
+    os.utime(path, (0, 0))
+    assert hasher.update()
+    assert hasher.digest() == rhash.hash_msg(DATA, rhash.ED2K)
+
+
+def test_follow_hasher_no_hole_detection(tmp_path, mocker):
+    mocker.patch.object(follow, '_data_end', return_value=None)
+    path = tmp_path / 'a.mkv'
+    path.write_bytes(DATA[:100_000])
+    warnings = []
+    hasher = FollowHasher(str(path), len(DATA), settle=60,
+                          onwarning=warnings.append)
+
+    assert not hasher.update()
+    assert hasher.offset == 0
+    assert len(warnings) == 1
+
+    path.write_bytes(DATA)
+    assert not hasher.update()
+    os.utime(path, (0, 0))
+    assert hasher.update()
+    assert hasher.digest() == rhash.hash_msg(DATA, rhash.ED2K)
+
+
+def test_follow_hasher_state(tmp_path):
+    path = tmp_path / 'a.mkv'
+    state_path = tmp_path / 'state'
+    path.write_bytes(DATA[:100_000])
+
+    hasher = FollowHasher(str(path), len(DATA), state_path=str(state_path))
+    hasher.update()
+    hasher.save()
+
+    # Restarted, hashing continues from the saved state.
+    hasher = FollowHasher(str(path), len(DATA), state_path=str(state_path))
+    assert hasher.offset == 100_000
+    with open(path, 'ab') as f:
+        f.write(DATA[100_000:])
+    assert hasher.update()
+    assert hasher.digest() == rhash.hash_msg(DATA, rhash.ED2K)
+    assert not state_path.exists()
+
+    # State of another file is ignored.
+    state_path.write_bytes(b'YMF1' + bytes(100))
+    hasher = FollowHasher(str(path), len(DATA), state_path=str(state_path))
+    assert hasher.offset == 0
+
+
+def test_follow_hasher_follow(tmp_path):
+    path = tmp_path / 'a.mkv'
+
+    def download():
+        with open(path, 'wb') as f:
+            for i in range(0, len(DATA), 32768):
+                f.write(DATA[i:i + 32768])
+                f.flush()
+                time.sleep(0.01)
+
+    thread = threading.Thread(target=download)
+    thread.start()
+    hasher = FollowHasher(str(path), len(DATA))
+    ed2k = hasher.follow(timeout=5, poll_interval=0.05)
+    thread.join()
+
+    assert ed2k == rhash.hash_msg(DATA, rhash.ED2K)
+
+    with pytest.raises(TimeoutError):
+        FollowHasher(str(tmp_path / 'b.mkv'), 1).follow(
+            timeout=0.1, poll_interval=0.05)
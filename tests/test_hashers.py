@@ -0,0 +1,51 @@
+import pytest
+
+from yumemi import hashers
+from yumemi.hashers import CHUNK_SIZE, MD4, select_backend
+
+
+@pytest.mark.parametrize('data, digest', [
+    (b'', '31d6cfe0d16ae931b73c59d7e0c089c0'),
+    (b'a', 'bde52cb31de33e46245e05fbdbd6fb24'),
+    (b'abc', 'a448017aaf21d8525fc10ae87aa6729d'),
+    (b'message digest', 'd9130a8164549fe818874806e1c7014b'),
+    (b'1234567890' * 8, 'e33b4ddc9c38f2199c3e7b164fcc0536'),
+])
+def test_md4(data, digest):
+    assert MD4(data).hexdigest() == digest
+
+    md4 = MD4()
+    for i in range(0, len(data), 7):
+        md4.update(data[i:i + 7])
+    assert md4.hexdigest() == digest
+
+
+@pytest.mark.parametrize('size, ed2k', [
+    (1, '47c61a0fa8738ba77308a8a600f88e4b'),
+    # Multiple of the chunk size ends with an empty chunk.
+    (CHUNK_SIZE, 'fc21d9af828f92a8df64beac3357425d'),
+    (CHUNK_SIZE + 1, '06329e9dba1373512c06386fe29e3c65'),
+])
+def test_ed2k(size, ed2k):
+    backend = select_backend(name='python')
+    assert backend.hash_bytes(bytes(size)) == ed2k
+
+
+def test_hash_file(tmp_path):
+    path = tmp_path / 'a.mkv'
+    path.write_bytes(b'abc')
+
+    for backend in hashers.available_backends():
+        assert backend.hash_file(str(path)) == 'a448017aaf21d8525fc10ae87aa6729d'
+
+
+def test_select_backend(mocker):
+    slow = hashers.Backend('slow', lambda: hashers.Ed2kHasher(MD4))
+    fast = hashers.Backend('fast', lambda: hashers.Ed2kHasher(MD4))
+    mocker.patch.object(hashers, 'benchmark', side_effect=lambda b: {
+        'slow': 1, 'fast': 2}[b.name])
+
+    assert select_backend([slow, fast]) is fast
+    assert select_backend([slow, fast], name='slow') is slow
+    with pytest.raises(ValueError):
+        select_backend([slow, fast], name='rhash')
@@ -0,0 +1,67 @@
+import asyncio
+import concurrent.futures
+
+import pytest
+
+from yumemi import _rhash as rhash
+from yumemi.hashing import hash_file_async, hash_file_task
+
+
+def test_hash_file_async(tmp_path):
+    paths = []
+    for i in range(5):
+        path = tmp_path / f'{i}.mkv'
+        path.write_bytes(bytes([i]) * (i * 1000))
+        paths.append(str(path))
+
+    async def main():
+        return await asyncio.gather(*(
+            hash_file_async(path, block_size=256) for path in paths
+        ))
+
+    assert asyncio.run(main()) == [rhash.hash_file(p, rhash.ED2K) for p in paths]
+
+
+def test_hash_file_progress(tmp_path):
+    path = tmp_path / 'a.mkv'
+    path.write_bytes(b'a' * 1000)
+
+    async def main():
+        task = hash_file_task(str(path), block_size=300)
+        updates = [(p.done, p.total) async for p in task.progress()]
+        return updates, await task
+
+    updates, digest = asyncio.run(main())
+
+    assert updates[-1] == (1000, 1000)
+    assert updates == sorted(updates)
+    assert digest == rhash.hash_file(str(path), rhash.ED2K)
+
+
+def test_hash_file_cancel(tmp_path):
+    path = tmp_path / 'a.mkv'
+    path.write_bytes(b'a' * 100_000)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    submit = executor.submit
+    submitted = []
+
+    def spy(*args):
+        submitted.append(submit(*args))
+        return submitted[-1]
+
+    executor.submit = spy
+
+    async def main():
+        task = hash_file_task(str(path), executor=executor, block_size=1)
+        async for progress in task.progress():
+            if progress.done > 10:
+                task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+    # Hashing stopped at the next block.
+    with pytest.raises(concurrent.futures.CancelledError):
+        submitted[0].result(timeout=5)
+    executor.shutdown()
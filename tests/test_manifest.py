@@ -0,0 +1,42 @@
+import os
+
+from yumemi.manifest import MANIFEST_NAME, Manifests, read_manifest
+
+
+ED2K = '47c61a0fa8738ba77308a8a600f88e4b'
+
+
+def test_read_manifest(tmp_path):
+    path = tmp_path / MANIFEST_NAME
+    path.write_text(
+        '# exported\n'
+        'ed2k://|file|a%20b.mkv|1|47C61A0FA8738BA77308A8A600F88E4B|/ 123\n'
+        'ed2k://|file|c.mkv|2|31d6cfe0d16ae931b73c59d7e0c089c0|h=ABC|/\n'
+    )
+
+    entries = read_manifest(str(path))
+
+    assert entries['a b.mkv'].size == 1
+    assert entries['a b.mkv'].ed2k == ED2K
+    assert entries['a b.mkv'].mtime_ns == 123
+    assert entries['c.mkv'].mtime_ns is None
+
+
+def test_manifests(tmp_path):
+    file = tmp_path / 'a b.mkv'
+    file.write_bytes(b'\x00')
+
+    manifests = Manifests()
+    assert manifests.lookup(str(file)) is None
+    manifests.update(str(file), ED2K)
+    manifests.save()
+
+    assert (tmp_path / MANIFEST_NAME).read_text() == (
+        f'ed2k://|file|a%20b.mkv|1|{ED2K}|/ {file.stat().st_mtime_ns}\n')
+
+    manifests = Manifests()
+    assert manifests.lookup(str(file)) == ED2K
+
+    # Changed modification time, the hash is not trusted.
+    os.utime(file, ns=(0, 0))
+    assert manifests.lookup(str(file)) is None
@@ -0,0 +1,123 @@
+import errno
+import os
+
+import pytest
+
+from yumemi import move
+from yumemi.move import CopyError, VerifyError, move_file
+
+
+# ED2K of b'\x00'.
+ED2K = '47c61a0fa8738ba77308a8a600f88e4b'
+
+
+def cross_device(mocker):
+    """Make the first link fail as if the target was on another device."""
+    link = os.link
+
+    def fake_link(src, dst, **kwargs):
+        if not src.endswith('.yumemi-part'):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        return link(src, dst, **kwargs)
+
+    mocker.patch('os.link', side_effect=fake_link)
+
+
+def test_move_file(tmp_path):
+    src = tmp_path / 'a.mkv'
+    src.write_bytes(b'\x00')
+
+    assert move_file(str(src), str(tmp_path / 'b.mkv')) == 'rename'
+    assert not src.exists()
+    assert (tmp_path / 'b.mkv').read_bytes() == b'\x00'
+
+
+def test_move_file_exists(tmp_path):
+    src = tmp_path / 'a.mkv'
+    src.write_bytes(b'\x00')
+    (tmp_path / 'b.mkv').write_bytes(b'\x01')
+
+    with pytest.raises(FileExistsError):
+        move_file(str(src), str(tmp_path / 'b.mkv'))
+    assert src.exists()
+    assert (tmp_path / 'b.mkv').read_bytes() == b'\x01'
+
+
+@pytest.mark.parametrize('method', ['copy_file_range', 'sendfile', 'copy'])
+def test_move_file_cross_device(tmp_path, mocker, method):
+    cross_device(mocker)
+    mocker.patch.object(move, '_reflink', return_value=False)
+    if method != 'copy_file_range':
+        mocker.patch.object(move, '_copy_file_range', return_value=False)
+    if method == 'copy':
+        mocker.patch.object(move, '_sendfile', return_value=False)
+
+    src = tmp_path / 'a.mkv'
+    src.write_bytes(b'\x00' * 100_000)
+    os.utime(src, ns=(1, 1_000_000_001))
+    dst = tmp_path / 'b.mkv'
+
+    assert move_file(str(src), str(dst)) == method
+    assert not src.exists()
+    assert dst.read_bytes() == b'\x00' * 100_000
+    assert dst.stat().st_mtime_ns == 1_000_000_001
+    assert os.listdir(tmp_path) == ['b.mkv']
+
+
+def test_move_file_verify(tmp_path, mocker):
+    cross_device(mocker)
+    src = tmp_path / 'a.mkv'
+    src.write_bytes(b'\x00')
+
+    assert move_file(str(src), str(tmp_path / 'b.mkv'), ed2k=ED2K) != 'rename'
+    assert (tmp_path / 'b.mkv').exists()
+
+    (tmp_path / 'b.mkv').rename(src)
+    with pytest.raises(VerifyError):
+        move_file(str(src), str(tmp_path / 'b.mkv'), ed2k='0' * 32)
+    # Original is kept and the copy removed.
+    assert os.listdir(tmp_path) == ['a.mkv']
+
+
+def test_move_file_short_copy(tmp_path, mocker):
+    cross_device(mocker)
+    mocker.patch.object(move, '_reflink', return_value=False)
+    src = tmp_path / 'a.mkv'
+    src.write_bytes(b'\x00' * 100)
+    # File shrank after it was opened.
+    fstat = os.fstat
+    mocker.patch('os.fstat', side_effect=lambda fd: os.stat_result(
+        (*fstat(fd)[:6], 200, *fstat(fd)[7:])))
+
+    with pytest.raises(CopyError):
+        move_file(str(src), str(tmp_path / 'b.mkv'))
+    assert os.listdir(tmp_path) == ['a.mkv']
+
+
+def test_move_file_stale_part(tmp_path, mocker):
+    cross_device(mocker)
+    src = tmp_path / 'a.mkv'
+    src.write_bytes(b'\x00')
+    (tmp_path / '.b.mkv.yumemi-part').write_bytes(b'\x01\x02')
+
+    move_file(str(src), str(tmp_path / 'b.mkv'))
+    assert os.listdir(tmp_path) == ['b.mkv']
+    assert (tmp_path / 'b.mkv').read_bytes() == b'\x00'
+
+
+def test_move_file_part_in_progress(tmp_path, mocker):
+    fcntl = pytest.importorskip('fcntl')
+    cross_device(mocker)
+    src = tmp_path / 'a.mkv'
+    src.write_bytes(b'\x00')
+    part = tmp_path / '.b.mkv.yumemi-part'
+    part.write_bytes(b'\x01\x02')
+
+    with open(part, 'rb') as f:
+        # Locked by another copy.
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        with pytest.raises(CopyError):
+            move_file(str(src), str(tmp_path / 'b.mkv'))
+
+    assert part.read_bytes() == b'\x01\x02'
+    assert src.exists()
@@ -0,0 +1,74 @@
+import pytest
+
+import yumemi
+from yumemi.mylist import episode_ranges, file_episode, mylistedit_many
+
+
+@pytest.mark.parametrize(
+    'epnos, ranges',
+    [
+        (['1', '2', '3'], ['-3']),
+        (['3', '1', '2', '5', 'S1'], ['-3', '5', 'S1']),
+        (['2', '3'], ['2', '3']),
+        (['1'], ['1']),
+        ([], []),
+    ],
+)
+def test_episode_ranges(epnos, ranges):
+    assert episode_ranges(epnos) == ranges
+
+
+def file_result(ed2k, aid, gid, epno):
+    return yumemi.Result(
+        'FILE',
+        {'ed2k': ed2k, 'size': 1, 'fmask': '50000000', 'amask': '00008000'},
+        220, 'FILE', (('1', aid, gid, epno),),
+    )
+
+
+def test_file_episode():
+    assert file_episode(file_result('a', '11829', '7172', '01')) == \
+        ('11829', '7172', '1')
+    assert file_episode(file_result('a', '11829', '7172', 'S02')) == \
+        ('11829', '7172', 'S2')
+    # No group.
+    assert file_episode(file_result('a', '11829', '0', '01')) is None
+
+    # Masks of the rename format, epno follows 13 other fields.
+    result = yumemi.Result(
+        'FILE', {'fmask': '78380000', 'amask': '30E0F0C0'}, 220, 'FILE',
+        (('1', '11829', '2', '7172', *['x'] * 9, '12', *['x'] * 5),),
+    )
+    assert file_episode(result) == ('11829', '7172', '12')
+
+
+def test_mylistedit_many(mocker):
+    files = {
+        ('e1', 1): file_result('e1', '11829', '7172', '01'),
+        ('e2', 1): file_result('e2', '11829', '7172', '02'),
+        ('e3', 1): file_result('e3', '11829', '7172', '03'),
+        ('s1', 1): file_result('s1', '11829', '7172', 'S01'),
+        ('o1', 1): file_result('o1', '11829', '8000', '01'),
+    }
+    client = mocker.Mock(spec=yumemi.Client)
+
+    def command(command, params):
+        if command == 'FILE':
+            return files.get((params['ed2k'], params['size']), yumemi.Result(
+                'FILE', params, 320, 'NO SUCH FILE', ()))
+        return yumemi.Result(command, params, 311, 'MYLIST ENTRY EDITED', ())
+
+    client.command.side_effect = command
+
+    edits = list(mylistedit_many(client, [*files, ('x', 2)], {'viewed': True}))
+
+    assert [(edit.params, edit.files) for edit, _ in edits] == [
+        ({'aid': '11829', 'gid': '7172', 'epno': '-3'},
+         [('e1', 1), ('e2', 1), ('e3', 1)]),
+        ({'aid': '11829', 'gid': '7172', 'epno': 'S1'}, [('s1', 1)]),
+        ({'aid': '11829', 'gid': '8000', 'epno': '1'}, [('o1', 1)]),
+        ({'size': 2, 'ed2k': 'x'}, [('x', 2)]),
+    ]
+    assert edits[0][1].params == {
+        'aid': '11829', 'gid': '7172', 'epno': '-3', 'viewed': True, 'edit': True,
+    }
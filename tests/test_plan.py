@@ -0,0 +1,98 @@
+import yumemi
+from yumemi.cache import ResultCache
+from yumemi.manifest import Manifests
+from yumemi.plan import Tracker, format_duration, make_plan
+from yumemi.unknown import UnknownFiles
+
+
+def test_make_plan(tmp_path):
+    for name in ('a.mkv', 'b.mkv', 'c.mkv'):
+        (tmp_path / name).write_bytes(b'\x00' * 1000)
+    manifests = Manifests()
+    manifests.update(str(tmp_path / 'a.mkv'), '47c61a0fa8738ba77308a8a600f88e4b')
+
+    plan = make_plan(
+        [str(tmp_path / name) for name in ('a.mkv', 'b.mkv', 'c.mkv')],
+        manifests=manifests,
+        file_commands=True,
+        hash_rate=100,
+    )
+
+    assert plan.size == 3000
+    assert len(plan.hash_files) == 2
+    assert plan.hash_size == 2000
+    assert plan.packets == 8
+    assert plan.hash_time() == 20
+    # First five packets are not delayed.
+    assert plan.packets_time(2) == 6
+    assert plan.eta(2) == 20
+    assert plan.eta(10) == 30
+
+
+def test_make_plan_caches(tmp_path):
+    manifests = Manifests()
+    for name in ('a.mkv', 'b.mkv', 'c.mkv', 'd.mkv'):
+        (tmp_path / name).write_bytes(name[0].encode() * 1000)
+    for name in ('a.mkv', 'b.mkv', 'c.mkv'):
+        manifests.update(str(tmp_path / name), name[0] * 32)
+    cache = ResultCache()
+    cache.put(yumemi.Result(
+        'FILE', {'ed2k': 'a' * 32, 'size': 1000, 'fmask': '78'}, 220, 'FILE',
+        (('1',),)))
+    unknown_files = UnknownFiles()
+    unknown_files.failed('b' * 32, 1000)
+
+    plan = make_plan(
+        [str(tmp_path / name) for name in ('a.mkv', 'b.mkv', 'c.mkv', 'd.mkv')],
+        manifests=manifests,
+        file_commands=True,
+        file_params={'fmask': '78'},
+        cache=cache,
+        unknown_files=unknown_files,
+        hash_rate=100,
+    )
+
+    # MYLISTADD of a, nothing for b, MYLISTADD and FILE of c and d.
+    assert [f.path[-5:] for f in plan.cached_files] == ['a.mkv']
+    assert [f.path[-5:] for f in plan.skip_files] == ['b.mkv']
+    assert plan.packets == 2 + 1 + 0 + 2 + 2
+    assert plan.hash_size == 1000
+
+
+def test_make_plan_removed(tmp_path):
+    (tmp_path / 'a.mkv').write_bytes(b'\x00' * 1000)
+    errors = []
+
+    plan = make_plan(
+        [str(tmp_path / 'a.mkv'), str(tmp_path / 'removed.mkv')],
+        hash_rate=100,
+        onerror=lambda path, e: errors.append(path),
+    )
+
+    assert [f.path for f in plan.files] == [str(tmp_path / 'a.mkv')]
+    assert errors == [str(tmp_path / 'removed.mkv')]
+
+
+def test_tracker(mocker, tmp_path):
+    for name in ('a.mkv', 'b.mkv'):
+        (tmp_path / name).write_bytes(b'\x00' * 1000)
+    plan = make_plan(
+        [str(tmp_path / 'a.mkv'), str(tmp_path / 'b.mkv')],
+        hash_rate=100,
+    )
+    monotonic = mocker.patch('time.monotonic', return_value=0)
+
+    tracker = Tracker(plan, delay=2)
+    assert tracker.eta() == 20
+
+    # First file took twice as long as planned.
+    monotonic.return_value = 20
+    tracker.done(str(tmp_path / 'a.mkv'), 1000)
+    assert tracker.eta() == 20
+    assert tracker.status() == '1/2 files, 50.0 B/s, ETA 20s'
+
+
+def test_format_duration():
+    assert format_duration(5.4) == '5s'
+    assert format_duration(125) == '2m 5s'
+    assert format_duration(3 * 3600 + 125) == '3h 2m'
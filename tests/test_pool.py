@@ -0,0 +1,59 @@
+import errno
+
+import pytest
+
+import yumemi
+from yumemi.pool import ClientPool
+
+
+@pytest.fixture
+def connection_mock(mocker):
+    used_ports = {8888}
+    connections = []
+
+    def connection(local_port, **kwargs):
+        if local_port in used_ports:
+            raise OSError(errno.EADDRINUSE, 'Address already in use')
+        used_ports.add(local_port)
+        m = mocker.Mock(spec=yumemi.Connection)
+        m.local_port = local_port
+        m.recv.side_effect = [
+            b'200 sesskey LOGIN ACCEPTED',
+            b'300 PONG',
+            b'203 LOGGED OUT',
+        ]
+        connections.append(m)
+        return m
+
+    mocker.patch('yumemi.pool.Connection', side_effect=connection)
+    yield connections
+
+
+def test_pool(connection_mock):
+    with ClientPool('test', 1) as pool:
+        pool.add_account('a', 'user-a', 'pass-a')
+        pool.add_account('b', 'user-b', 'pass-b')
+
+        future_a = pool.submit('a', 'PING')
+        future_b = pool.submit('b', 'PING')
+        assert future_a.result().code == 300
+        assert future_b.result().code == 300
+
+        assert pool.client('a') is not pool.client('b')
+
+    assert sorted(c.local_port for c in connection_mock) == [8889, 8890]
+    for connection in connection_mock:
+        connection.close.assert_called()
+
+
+def test_pool_unknown_account():
+    pool = ClientPool('test', 1)
+    with pytest.raises(KeyError):
+        pool.client('missing')
+
+
+def test_pool_run(connection_mock):
+    with ClientPool('test', 1) as pool:
+        pool.add_account('a', 'user-a', 'pass-a')
+        future = pool.run('a', lambda client, command: client.command(command), 'PING')
+        assert future.result().code == 300
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import yumemi
+from yumemi.cache import ResultCache
+from yumemi.prefetch import Prefetcher, file_ids
+
+
+FILE_REPLY = b'220 FILE\n2718281|11829|182437|7172'
+
+
+def make_client(mocker, replies):
+    connection = mocker.Mock(spec=yumemi.Connection)
+    connection.send_delay.return_value = 0
+    connection.recv.side_effect = lambda: replies[
+        connection.send.call_args.args[0].split(b' ', 1)[0].decode()]
+    client = yumemi.Client('test', 1, connection=connection, cache=ResultCache())
+    client._session_key = 'sesskey'
+    return client, connection
+
+
+def test_client_cache(mocker):
+    client, connection = make_client(mocker, {'FILE': FILE_REPLY, 'PING': b'300 PONG'})
+
+    params = {'size': 1, 'ed2k': 'abc', 'fmask': '70000000', 'amask': '00'}
+    result = client.command('FILE', params)
+    cached = client.command('file', dict(reversed(params.items())))
+    assert cached == result
+    assert connection.send.call_count == 1
+
+    # Only lookup commands are cached.
+    client.command('PING')
+    client.command('PING')
+    assert connection.send.call_count == 3
+
+
+def test_result_cache_mylist_fields():
+    cache = ResultCache()
+    params = {'size': 1, 'ed2k': 'abc', 'fmask': '78000000', 'amask': '00'}
+    result = yumemi.Result('FILE', params, 220, 'FILE', (('1', '2', '3', '4', '5'),))
+
+    cache.put(result)
+    assert cache.get('FILE', params).data == (('1', '2', '3', '4', ''),)
+    # Result of the command is not changed.
+    assert result.data == (('1', '2', '3', '4', '5'),)
+
+
+def test_client_command_if_idle(mocker):
+    client, connection = make_client(mocker, {'PING': b'300 PONG'})
+
+    connection.send_delay.return_value = 1.5
+    assert client.command_if_idle('PING') is None
+    connection.send_delay.return_value = 0
+    assert client.command_if_idle('PING').code == 300
+
+    # Another thread is sending a command.
+    client._lock.acquire()
+    try:
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(client.command_if_idle('PING')))
+        thread.start()
+        thread.join()
+        assert result == [None]
+    finally:
+        client._lock.release()
+
+
+def test_file_ids():
+    result = yumemi.Result('FILE', {'fmask': '70000000'}, 220, 'FILE',
+                           (('2718281', '11829', '182437', '7172'),))
+    assert file_ids(result) == {'aid': '11829', 'eid': '182437', 'gid': '7172'}
+
+    result.params['fmask'] = '50000000'
+    assert file_ids(result) == {'aid': '11829', 'gid': '182437'}
+
+
+def test_prefetcher(mocker):
+    client, connection = make_client(mocker, {
+        'FILE': FILE_REPLY,
+        'ANIME': b'230 ANIME\n11829',
+        'EPISODE': b'240 EPISODE\n182437',
+        'GROUP': b'250 GROUP\n7172',
+    })
+    params = {'size': 1, 'ed2k': 'abc', 'fmask': '70000000', 'amask': '00'}
+
+    with Prefetcher(client, poll_interval=0.01) as prefetcher:
+        prefetcher.prefetch('FILE', params)
+        deadline = time.monotonic() + 5
+        while prefetcher.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        result = client.command('FILE', params)
+        assert connection.send.call_count == 1
+
+        prefetcher.follow(result)
+        while prefetcher.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    assert client.command('ANIME', {'aid': '11829'}).code == 230
+    assert client.command('EPISODE', {'eid': '182437'}).code == 240
+    assert client.command('GROUP', {'gid': '7172'}).code == 250
+    assert connection.send.call_count == 4
+
+
+def test_result_cache_path(tmp_path):
+    path = str(tmp_path / 'cache.json')
+    cache = ResultCache(path=path)
+    params = {'size': 1, 'ed2k': 'abc', 's': 'sesskey'}
+    cache.put(yumemi.Result('FILE', params, 220, 'FILE', (('1', '2'),)))
+    cache.save()
+
+    cache = ResultCache(path=path)
+    result = cache.get('FILE', {'size': 1, 'ed2k': 'abc'})
+    assert result is not None
+    assert result.data == (('1', '2'),)
+    # Session key is not saved.
+    assert 'sesskey' not in (tmp_path / 'cache.json').read_text()
+
+    # Expired results are not loaded, damaged file is ignored.
+    cache = ResultCache(ttl=-1, path=path)
+    cache.put(yumemi.Result('FILE', params, 220, 'FILE', ()))
+    cache.save()
+    assert len(ResultCache(path=path)) == 0
+    (tmp_path / 'cache.json').write_text('{')
+    assert len(ResultCache(path=path)) == 0
@@ -0,0 +1,66 @@
+import socket
+import threading
+
+import pytest
+
+import yumemi
+from yumemi.push import Notification, PushListener
+
+
+@pytest.fixture
+def udp_server():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(4)
+    yield server
+    server.close()
+
+
+def test_push_listener(udp_server):
+    connection = yumemi.Connection(
+        server_host='127.0.0.1',
+        server_port=udp_server.getsockname()[1],
+        local_port=0,
+        short_term_delay=0,
+    )
+    client = yumemi.Client('test', 1, connection=connection)
+    client._session_key = 'sesskey'
+
+    received = []
+    notified = threading.Event()
+
+    def callback(notification):
+        received.append(notification)
+        notified.set()
+
+    listener = PushListener(client)
+    listener.subscribe(callback)
+    listener.start()
+
+    def serve():
+        data, address = udp_server.recvfrom(1400)
+        assert data == b'UPTIME s=sesskey'
+        # Notification arrives before the reply and is sent twice because
+        # it was not acknowledged yet.
+        for _ in range(2):
+            udp_server.sendto(b'720 5 NOTIFICATION - NEW FILE\n123|1|456', address)
+        udp_server.sendto(b'208 UPTIME\n100', address)
+
+        for _ in range(2):
+            data, address = udp_server.recvfrom(1400)
+            assert data == b'PUSHACK nid=5&s=sesskey'
+            udp_server.sendto(b'701 PUSHACK CONFIRMED', address)
+
+    server_thread = threading.Thread(target=serve)
+    server_thread.start()
+
+    result = client.command('UPTIME')
+    server_thread.join()
+    connection.close()
+
+    assert result.code == 208
+    assert result.data == (('100',),)
+    assert notified.wait(4)
+    assert received == [
+        Notification(720, 5, 'NOTIFICATION - NEW FILE', (('123', '1', '456'),)),
+    ]
@@ -0,0 +1,84 @@
+import concurrent.futures
+
+import pytest
+
+from yumemi import _rhash as rhash
+
+
+def test_hash_files(tmp_path):
+    paths = []
+    for i, size in enumerate([0, 1, 70000, 9728000]):
+        path = tmp_path / f'{i}.mkv'
+        path.write_bytes(bytes(range(256)) * (size // 256) + b'x' * (size % 256))
+        paths.append(str(path))
+    errors = []
+
+    results = list(rhash.hash_files(
+        [*paths, str(tmp_path / 'missing.mkv')],
+        rhash.ED2K,
+        buffer_size=4096,
+        onerror=lambda path, e: errors.append(path),
+    ))
+
+    assert results == [(path, rhash.hash_file(path, rhash.ED2K)) for path in paths]
+    assert errors == [str(tmp_path / 'missing.mkv')]
+
+
+def test_hash_files_multi(tmp_path):
+    paths = []
+    for i, size in enumerate([0, 70000]):
+        path = tmp_path / f'{i}.mkv'
+        path.write_bytes(b'x' * size)
+        paths.append(str(path))
+
+    results = list(rhash.hash_files_multi(paths, [rhash.ED2K, rhash.CRC32]))
+    assert results == [
+        (path, (rhash.hash_file(path, rhash.ED2K),
+                rhash.hash_file(path, rhash.CRC32)))
+        for path in paths
+    ]
+
+    # Single hash is a tuple too.
+    results = list(rhash.hash_files_multi(paths, [rhash.ED2K]))
+    assert results[0] == (paths[0], (rhash.hash_file(paths[0], rhash.ED2K),))
+
+    with pytest.raises(ValueError):
+        list(rhash.hash_files_multi(paths, []))
+
+
+def test_rhash_closed():
+    with rhash.RHash(rhash.ED2K) as hasher:
+        hasher.update(b'\x00')
+    with pytest.raises(ValueError):
+        hasher.update(b'\x00')
+    with pytest.raises(ValueError):
+        hasher.finish()
+    # Closing again does nothing.
+    hasher.close()
+
+
+def test_rhash_threads():
+    data = bytes(1 << 16)
+    expected = rhash.hash_msg(data * 64, rhash.ED2K)
+    hasher = rhash.RHash(rhash.ED2K)
+
+    def update():
+        for _ in range(16):
+            hasher.update(data)
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        for future in [executor.submit(update) for _ in range(4)]:
+            future.result()
+
+    assert hasher.finish().hash() == expected
+
+    # Other threads race with close, they either hash or fail cleanly.
+    hasher = rhash.RHash(rhash.ED2K)
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(update) for _ in range(3)]
+        executor.submit(hasher.close).result()
+        for future in futures:
+            try:
+                future.result()
+            except ValueError:
+                pass
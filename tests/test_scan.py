@@ -0,0 +1,43 @@
+import io
+import os
+
+from yumemi.scan import Scanner, read_paths0
+
+
+def test_read_paths0():
+    stream = io.BytesIO(b'a.mkv\0dir/b c.mkv\0\0last.mkv')
+    assert list(read_paths0(stream, chunk_size=3)) == [
+        'a.mkv', 'dir/b c.mkv', 'last.mkv',
+    ]
+
+
+def test_scan_recursive(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'a.mkv').write_bytes(b'a' * 10)
+    (tmp_path / 'small.mkv').write_bytes(b'a')
+    (tmp_path / 'notes.txt').write_bytes(b'a' * 10)
+    (tmp_path / 'sub' / 'b.MP4').write_bytes(b'b' * 10)
+    os.link(tmp_path / 'a.mkv', tmp_path / 'sub' / 'a-link.mkv')
+
+    scanner = Scanner(recursive=True, min_size=2)
+
+    assert list(scanner.scan([str(tmp_path)])) == [
+        str(tmp_path / 'a.mkv'),
+        str(tmp_path / 'sub' / 'b.MP4'),
+    ]
+
+
+def test_scan_errors(tmp_path):
+    (tmp_path / 'a.txt').write_bytes(b'a')
+    errors = []
+
+    scanner = Scanner(onerror=lambda path, e: errors.append(path))
+    files = list(scanner.scan([
+        str(tmp_path / 'a.txt'),
+        str(tmp_path / 'missing.mkv'),
+        str(tmp_path),
+    ]))
+
+    # Explicit files are not filtered.
+    assert files == [str(tmp_path / 'a.txt')]
+    assert errors == [str(tmp_path / 'missing.mkv'), str(tmp_path)]
@@ -0,0 +1,99 @@
+import gzip
+import os
+
+from yumemi.titles import TitleIndex, normalize
+
+
+DUMP = '''\
+# created: Sat Oct 1 02:00:01 2022
+# <aid>|<type>|<language>|<title>
+9541|1|x-jat|Shingeki no Kyojin
+9541|4|en|Attack on Titan
+9541|4|ja|進撃の巨人
+9541|2|x-jat|Shingeki no Kyoujin
+12345|1|x-jat|Shingeki no Bahamut: Genesis
+69|1|x-jat|One Piece
+'''
+
+
+def test_normalize():
+    assert normalize('Ōkami-san & Seven  Companions!') == 'okami san seven companions'
+    assert normalize('ＡＢＣ') == 'abc'
+
+
+def test_search(tmp_path):
+    dump = tmp_path / 'anime-titles.dat'
+    dump.write_text(DUMP, encoding='UTF-8')
+
+    index = TitleIndex.open(str(dump))
+    assert os.path.exists(str(dump) + '.idx')
+    assert len(index) == 6
+
+    matches = index.search('shingeki no kyojin')
+    # Best title of every anime only.
+    assert [(m.aid, m.title, m.score) for m in matches][0] == (
+        9541, 'Shingeki no Kyojin', 1.0)
+    assert [m.aid for m in matches] == [9541, 12345]
+
+    assert index.search('atack on titan')[0].aid == 9541
+    assert index.search('進撃の巨人')[0].title == '進撃の巨人'
+    assert index.search('one piece', limit=1)[0].aid == 69
+    assert index.search('naruto') == []
+    assert index.search('') == []
+
+    index.close()
+
+
+def test_reload(tmp_path):
+    dump = tmp_path / 'anime-titles.dat.gz'
+    with gzip.open(dump, 'wt', encoding='UTF-8') as f:
+        f.write(DUMP)
+
+    index = TitleIndex.open(str(dump), str(tmp_path / 'titles.idx'))
+    assert index.search('naruto') == []
+
+    # Opened without building, the index is up to date.
+    other = TitleIndex.open(str(dump), str(tmp_path / 'titles.idx'))
+    assert len(other) == 6
+    other.close()
+
+    with gzip.open(dump, 'at', encoding='UTF-8') as f:
+        f.write('239|1|x-jat|Naruto\n')
+    index.reload()
+
+    assert len(index) == 7
+    assert index.search('naruto')[0].aid == 239
+
+    index.close()
+
+
+def test_search_max_postings(tmp_path):
+    dump = tmp_path / 'anime-titles.dat'
+    dump.write_text(
+        ''.join(f'{i}|1|x-jat|Title{i} no Kyoushitsu\n' for i in range(1, 100))
+        + DUMP,
+        encoding='UTF-8',
+    )
+    index = TitleIndex.open(str(dump))
+
+    # Common trigrams are looked up only for the candidates of rare ones.
+    matches = index.search('shingeki no kyojin', max_postings=8)
+    assert matches[0].title == 'Shingeki no Kyojin'
+    assert matches[0].score == 1.0
+
+    index.close()
+
+
+def test_not_loaded(tmp_path):
+    dump = tmp_path / 'anime-titles.dat'
+    dump.write_text(DUMP, encoding='UTF-8')
+
+    index = TitleIndex(str(dump), str(tmp_path / 'titles.idx'))
+    assert len(index) == 0
+    assert index.search('one piece') == []
+
+    index.reload()
+    assert len(index) == 6
+    index.close()
+    assert len(index) == 0
+    assert index.search('one piece') == []
@@ -0,0 +1,38 @@
+import io
+import json
+
+import yumemi
+from yumemi.trace import Tracer
+
+
+def test_tracer_dump():
+    tracer = Tracer()
+    with tracer.span('outer', 'test', foo=1) as args:
+        args['bar'] = 2
+        with tracer.span('inner'):
+            pass
+
+    fp = io.StringIO()
+    tracer.dump(fp)
+    events = json.loads(fp.getvalue())['traceEvents']
+
+    assert [e['ph'] for e in events] == ['M', 'X', 'X']
+    inner, outer = events[1], events[2]
+    assert inner['name'] == 'inner'
+    assert outer['name'] == 'outer'
+    assert outer['args'] == {'foo': 1, 'bar': 2}
+    assert outer['ts'] <= inner['ts']
+    assert outer['dur'] >= inner['dur']
+
+
+def test_client_tracer(mocker):
+    connection = mocker.Mock(spec=yumemi.Connection)
+    connection.recv.return_value = b'300 PONG'
+    tracer = Tracer()
+
+    client = yumemi.Client('test', 1, connection=connection, tracer=tracer)
+    client.ping()
+
+    (event,) = [e for e in tracer._events if e['ph'] == 'X']
+    assert event['name'] == 'PING'
+    assert event['args'] == {'reply': '300 PONG'}
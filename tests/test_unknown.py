@@ -0,0 +1,39 @@
+from yumemi.unknown import UnknownFiles
+
+
+def test_unknown_files_backoff(mocker):
+    now = mocker.patch('time.time', return_value=1000.0)
+    unknown = UnknownFiles(backoff=(10, 100))
+
+    assert unknown.should_check('ABC', 1)
+    assert unknown.failed('ABC', 1) == 10
+    assert ('abc', 1) in unknown
+    assert not unknown.should_check('abc', 1)
+    assert unknown.should_check('abc', 2)
+
+    now.return_value = 1010.0
+    assert unknown.should_check('abc', 1)
+    assert unknown.failed('abc', 1) == 100
+    now.return_value = 1100.0
+    assert not unknown.should_check('abc', 1)
+    # Longest interval is repeated.
+    now.return_value = 1110.0
+    assert unknown.failed('abc', 1) == 100
+
+    unknown.found('abc', 1)
+    assert unknown.should_check('abc', 1)
+    assert len(unknown) == 0
+
+
+def test_unknown_files_path(tmp_path):
+    path = str(tmp_path / 'unknown.json')
+    unknown = UnknownFiles(path)
+    unknown.failed('abc', 1)
+    unknown.failed('abc', 1)
+    unknown.save()
+
+    unknown = UnknownFiles(path)
+    assert unknown.failed('abc', 1) == 7 * 24 * 60 * 60
+
+    (tmp_path / 'unknown.json').write_text('[')
+    assert len(UnknownFiles(path)) == 0
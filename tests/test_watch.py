@@ -0,0 +1,31 @@
+import pytest
+
+from yumemi.watch import Watcher, inotify_available
+
+
+@pytest.mark.parametrize(
+    'poll',
+    [
+        pytest.param(
+            False,
+            id='inotify',
+            marks=pytest.mark.skipif(not inotify_available(),
+                                     reason='inotify is not available'),
+        ),
+        pytest.param(True, id='poll'),
+    ],
+)
+def test_watcher(tmp_path, poll):
+    (tmp_path / 'old.mkv').write_bytes(b'old')
+
+    watcher = Watcher(str(tmp_path), settle=0.1, poll=poll, poll_interval=0.05)
+    watcher.start()
+
+    (tmp_path / 'new.mkv').write_bytes(b'new')
+    (tmp_path / 'dir').mkdir()
+
+    files = iter(watcher)
+    assert next(files) == str(tmp_path / 'new.mkv')
+
+    watcher.close()
+    assert list(files) == []